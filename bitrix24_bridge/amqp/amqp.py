@@ -1,11 +1,14 @@
 import functools
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 from dataclasses import dataclass, field
 
 import pika
 import ujson
 from django.conf import settings
-from typing import Callable, Any, Optional, List
+from pika.adapters.blocking_connection import BlockingChannel
+from typing import Callable, Any, Optional, List, Dict, Iterable, Tuple, Set, Deque
 
 """
 BB = Bitrix24 Bridge
@@ -21,6 +24,22 @@ def get_var(name) -> Callable[[], Optional[Any]]:
     return functools.partial(getattr, settings, name, None)
 
 
+@dataclass
+class PublishResult:
+    """
+    Result of batch publishing
+
+    :param sent: int - count of messages confirmed by broker
+    :param failed: List[Tuple[int, Any]] - (index in batch, message) of nacked or unconfirmed messages
+    """
+    sent: int = 0
+    failed: List[Tuple[int, Any]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
 class MessageProducer(ABC):
 
     @abstractmethod
@@ -35,6 +54,19 @@ class MessageProducer(ABC):
     def send(self, message):
         raise NotImplemented
 
+    def send_many(self, messages: Iterable, **kwargs) -> PublishResult:
+        """
+        Send messages one by one, producers with batch support override it
+        """
+        result = PublishResult()
+        for i, message in enumerate(messages):
+            try:
+                self.send(message)
+                result.sent += 1
+            except Exception:
+                result.failed.append((i, message))
+        return result
+
     def __enter__(self):
         self.connect()
         return self
@@ -64,6 +96,7 @@ class RabbitMQProducer(MessageProducer):
     exchange_durable: str = field(default_factory=get_var('BB_RABBITMQ_EXCHANGE_DURABLE'))
 
     connection: Optional[pika.BlockingConnection] = None
+    channel: Optional[BlockingChannel] = field(default=None, init=False, repr=False, compare=False)
 
     def connect(self):
         if self.connection is None or self.connection.is_closed:
@@ -73,14 +106,30 @@ class RabbitMQProducer(MessageProducer):
             else:
                 conn_params = pika.ConnectionParameters(self.host, self.port, self.virtual_host, credentials)
             self.connection = pika.BlockingConnection(parameters=conn_params)
+            self.channel = None
         return self.connection
 
+    def get_channel(self) -> BlockingChannel:
+        """
+        Reuse opened channel while connection is alive
+        Returns:
+            BlockingChannel
+        """
+        connection = self.connect()
+
+        # Service heartbeats and detect a connection dropped by the broker while it was idle
+        connection.process_data_events(time_limit=0)
+
+        if self.channel is None or self.channel.is_closed:
+            self.channel = connection.channel()
+        return self.channel
+
     def close(self):
-        if self.connection.is_open:
+        if self.connection and self.connection.is_open:
             self.connection.close()
+        self.channel = None
 
-    def send(self, message):
-        channel = self.connect().channel()
+    def publish(self, channel: BlockingChannel, message):
         channel.basic_publish(
             self.exchange,
             self.routing_key,
@@ -89,6 +138,250 @@ class RabbitMQProducer(MessageProducer):
                 content_type='application/json; charset=utf-8'
             ))
 
+    def send(self, message):
+        self.publish(self.get_channel(), message)
+
+    def batch(self, window: Optional[int] = None, timeout: Optional[float] = None) -> 'ConfirmedBatch':
+        """
+        Context-managed batch publishing with publisher confirms
+
+        Usage:
+            with producer.batch() as batch:
+                for message in messages:
+                    batch.send(message)
+            batch.result.failed
+        """
+        return ConfirmedBatch(self, window=window, timeout=timeout)
+
+    def send_many(self, messages: Iterable, window: Optional[int] = None,
+                  timeout: Optional[float] = None) -> PublishResult:
+        """
+        Publish messages on one channel, confirms are awaited by windows, not after every message
+        Args:
+            messages: Iterable[Dict]
+            window: Optional[int] - max count of unconfirmed messages
+            timeout: Optional[float] - seconds to wait for confirms
+
+        Returns:
+            PublishResult
+        """
+        with self.batch(window=window, timeout=timeout) as batch:
+            for message in messages:
+                batch.send(message)
+        return batch.result
+
+
+# pika versions with asynchronous channel behind BlockingChannel._impl, see confirm_delivery_async()
+ASYNC_CONFIRMS_PIKA_VERSIONS = ('1.0.', '1.1.', '1.2.', '1.3.')
+
+
+def confirm_delivery_async(channel: BlockingChannel, callback: Callable[[Any], None]) -> bool:
+    """
+    Enable publisher confirms delivered to `callback(method_frame)` while basic_publish() doesn't wait for them.
+
+    Public BlockingChannel.confirm_delivery() makes every basic_publish() wait for its confirm,
+    pika has no public API of asynchronous confirms for BlockingConnection, so confirms are enabled
+    on the underlying pika.channel.Channel (`BlockingChannel._impl`). It is checked for pika 1.0 - 1.3 only,
+    with other versions the channel is left as is.
+
+    Returns:
+        bool - asynchronous confirms are enabled, else use public synchronous confirm_delivery()
+    """
+    if not pika.__version__.startswith(ASYNC_CONFIRMS_PIKA_VERSIONS):
+        return False
+
+    impl = getattr(channel, '_impl', None)
+    if impl is None or not hasattr(impl, 'confirm_delivery'):
+        return False
+
+    impl.confirm_delivery(ack_nack_callback=callback)
+    return True
+
+
+class ConfirmedBatch:
+    """
+    Publish messages on dedicated channel in publisher confirms mode.
+
+    Up to `window` messages are in flight, send() blocks only when the window is full.
+    Messages nacked by broker, unconfirmed in `timeout` or lost with connection are reported in result.failed.
+    If pika doesn't support asynchronous confirms (see confirm_delivery_async()),
+    every send() waits for its confirm by public BlockingChannel.confirm_delivery().
+    """
+
+    def __init__(self, producer: RabbitMQProducer, window: Optional[int] = None, timeout: Optional[float] = None):
+        self.producer = producer
+        self.window: int = int(window or get_var('BB_RABBITMQ_CONFIRM_WINDOW')() or 1000)
+        self.timeout: float = float(timeout or get_var('BB_RABBITMQ_CONFIRM_TIMEOUT')() or 30)
+
+        self.channel: Optional[BlockingChannel] = None
+        self.result = PublishResult()
+
+        # delivery_tag -> (index, message)
+        self.pending: Dict[int, Tuple[int, Any]] = {}
+        self.delivery_tag = 0
+        self.index = 0
+        self.broken = False
+        self.asynchronous = False
+
+    def open(self):
+        self.channel = self.producer.connect().channel()
+        self.asynchronous = confirm_delivery_async(self.channel, self.on_confirm)
+        if not self.asynchronous:
+            self.channel.confirm_delivery()
+        return self
+
+    def on_confirm(self, method_frame):
+        method = method_frame.method
+        if method.multiple:
+            tags = [tag for tag in self.pending if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        for tag in tags:
+            item = self.pending.pop(tag, None)
+            if item is None:
+                continue
+            if acked:
+                self.result.sent += 1
+            else:
+                self.result.failed.append(item)
+
+    def fail_pending(self):
+        self.result.failed.extend(self.pending[tag] for tag in sorted(self.pending))
+        self.pending.clear()
+
+    def wait(self, limit: int = 0):
+        """
+        Process confirms until count of unconfirmed messages is not greater than limit
+        """
+        deadline = time.monotonic() + self.timeout
+        try:
+            while len(self.pending) > limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.fail_pending()
+                    break
+                self.producer.connection.process_data_events(time_limit=min(remaining, 1))
+        except (pika.exceptions.AMQPError, ConnectionError):
+            self.broken = True
+            self.fail_pending()
+
+    def send(self, message):
+        index = self.index
+        self.index += 1
+
+        if self.broken:
+            self.result.failed.append((index, message))
+            return
+
+        try:
+            self.producer.publish(self.channel, message)
+        except (pika.exceptions.NackError, pika.exceptions.UnroutableError):
+            # synchronous confirms only
+            self.result.failed.append((index, message))
+            return
+        except (pika.exceptions.AMQPError, ConnectionError):
+            self.broken = True
+            self.fail_pending()
+            self.result.failed.append((index, message))
+            return
+
+        if not self.asynchronous:
+            self.result.sent += 1
+            return
+
+        self.delivery_tag += 1
+        self.pending[self.delivery_tag] = (index, message)
+
+        if len(self.pending) >= self.window:
+            self.wait(limit=self.window - 1)
+
+    def close(self):
+        if not self.broken:
+            self.wait()
+        self.result.failed.sort(key=lambda item: item[0])
+        try:
+            if self.channel is not None and self.channel.is_open:
+                self.channel.close()
+        except (pika.exceptions.AMQPError, ConnectionError):
+            pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Acknowledger:
+    """
+    Batched acknowledgements of consumed messages.
+
+    Acks are sent with multiple=True every `batch_size` acked messages or `interval` seconds,
+    only up to the first not settled delivery, so messages may be settled out of order.
+    Failed messages are nacked at once one by one.
+    All methods must be called from the connection I/O thread.
+
+    :param connection: pika.BlockingConnection
+    :param channel: BlockingChannel
+    :param batch_size: int - ack every N messages
+    :param interval: Optional[float] - ack every T seconds
+    """
+
+    def __init__(self, connection: pika.BlockingConnection, channel: BlockingChannel,
+                 batch_size: int = 1, interval: Optional[float] = None):
+        self.connection = connection
+        self.channel = channel
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+
+        # delivery tags in order of delivery, not acknowledged to broker yet
+        self.outstanding: Deque[int] = deque()
+        self.acked: Set[int] = set()
+        self.nacked: Set[int] = set()
+
+        self.timer = None
+
+    def track(self, delivery_tag: int):
+        self.outstanding.append(delivery_tag)
+
+    def ack(self, delivery_tag: int):
+        self.acked.add(delivery_tag)
+
+        if len(self.acked) >= self.batch_size:
+            self.flush()
+        elif self.timer is None and self.interval:
+            self.timer = self.connection.call_later(self.interval, self.on_timer)
+
+    def nack(self, delivery_tag: int, requeue: bool = True):
+        self.channel.basic_nack(delivery_tag=delivery_tag, multiple=False, requeue=requeue)
+        self.nacked.add(delivery_tag)
+
+    def on_timer(self):
+        self.timer = None
+        self.flush()
+
+    def flush(self):
+        """
+        Ack all settled messages up to the first not settled one
+        """
+        last = None
+        while self.outstanding and (self.outstanding[0] in self.acked or self.outstanding[0] in self.nacked):
+            tag = self.outstanding.popleft()
+            if tag in self.acked:
+                self.acked.discard(tag)
+                last = tag
+            else:
+                self.nacked.discard(tag)
+
+        if last is not None and self.channel.is_open:
+            self.channel.basic_ack(delivery_tag=last, multiple=True)
+
+        if self.timer is not None and not self.acked:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+
 
 class MessageConsumer(ABC):
 
@@ -133,7 +426,19 @@ class RabbitMQConsumer(MessageConsumer):
     exchange_type: str = field(default_factory=get_var('BB_RABBITMQ_EXCHANGE_TYPE'))
     exchange_durable: str = field(default_factory=get_var('BB_RABBITMQ_EXCHANGE_DURABLE'))
 
+    # seconds, None - negotiated with broker
+    heartbeat: Optional[int] = field(default_factory=get_var('BB_RABBITMQ_HEARTBEAT'))
+
+    # unacknowledged messages per consumer, None - unlimited
+    prefetch_count: Optional[int] = field(default_factory=lambda: int(get_var('BB_RABBITMQ_PREFETCH_COUNT')() or 100))
+    # ack every N messages or every T milliseconds
+    ack_batch_size: int = field(default_factory=lambda: int(get_var('BB_RABBITMQ_ACK_BATCH_SIZE')() or 50))
+    ack_interval: Optional[int] = field(default_factory=lambda: int(get_var('BB_RABBITMQ_ACK_INTERVAL')() or 500))
+    # requeue failed message once, reject (dead-letter) it on redelivery
+    requeue_on_failure: bool = field(default_factory=lambda: get_var('BB_RABBITMQ_REQUEUE_ON_FAILURE')() is not False)
+
     connection: Optional[pika.BlockingConnection] = None
+    acknowledger: Optional[Acknowledger] = field(default=None, init=False, repr=False, compare=False)
 
     buffer: List = field(init=False, repr=False, compare=False, default_factory=list)
 
@@ -148,6 +453,8 @@ class RabbitMQConsumer(MessageConsumer):
                     virtual_host=self.virtual_host,
                     credentials=credentials,
                 )
+            if self.heartbeat is not None:
+                conn_params.heartbeat = self.heartbeat
             self.connection = pika.BlockingConnection(parameters=conn_params)
 
         return self.connection
@@ -160,18 +467,76 @@ class RabbitMQConsumer(MessageConsumer):
         self.buffer.append(msg)
 
     def close(self):
-        if self.connection and self.connection.is_open():
+        if self.acknowledger is not None:
+            try:
+                self.acknowledger.flush()
+            except (pika.exceptions.AMQPError, ConnectionError):
+                pass
+        if self.connection and self.connection.is_open:
             self.connection.close()
 
-    def receive(self, callback=None):
+    @property
+    def is_open(self) -> bool:
+        return self.connection is not None and self.connection.is_open
+
+    def track(self, delivery_tag: int):
+        self.acknowledger.track(delivery_tag)
+
+    def call_threadsafe(self, callback: Callable[[], None]):
+        """
+        Run callback on connection I/O thread, e.g. ack of message handled in other thread
+        """
+        self.connection.add_callback_threadsafe(callback)
+
+    def process_events(self, time_limit: float = 0):
+        self.connection.process_data_events(time_limit=time_limit)
+
+    def ack(self, delivery_tag: int):
+        self.acknowledger.ack(delivery_tag)
+
+    def nack(self, delivery_tag: int, redelivered: bool = False, requeue: Optional[bool] = None):
+        """
+        Settle failed message
+        Args:
+            delivery_tag: int
+            redelivered: bool - message was delivered before, it is not requeued again
+            requeue: Optional[bool] - force requeue policy, e.g. False for broken messages
+        """
+        if requeue is None:
+            requeue = self.requeue_on_failure and not redelivered
+        self.acknowledger.nack(delivery_tag, requeue=requeue)
+
+    def receive(self, callback=None, on_stop: Optional[Callable[[], None]] = None):
+        """
+        Consume messages until KeyboardInterrupt
+        Args:
+            callback: message callback, see default_callback
+            on_stop: Optional[Callable[[], None]] - called after consuming is stopped, before connection is closed
+        """
         if callback is None:
             callback = self.default_callback
 
         connection = self.connect()
         channel = connection.channel()
+
+        if self.prefetch_count:
+            channel.basic_qos(prefetch_count=self.prefetch_count)
+
+        self.acknowledger = Acknowledger(
+            connection, channel,
+            batch_size=self.ack_batch_size,
+            interval=self.ack_interval / 1000 if self.ack_interval else None,
+        )
+
         channel.basic_consume(self.queue, callback)
         try:
             channel.start_consuming()
         except KeyboardInterrupt:
             channel.stop_consuming()
+        finally:
+            try:
+                if on_stop is not None:
+                    on_stop()
+            finally:
+                self.close()
 
@@ -0,0 +1,184 @@
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from queue import LifoQueue, Empty
+from typing import Callable, Optional, Iterable
+
+import pika.exceptions
+
+from bitrix24_bridge.amqp.amqp import MessageProducer, PublishResult, get_var
+from bitrix24_bridge.amqp.transports import get_transport
+
+"""
+Process-wide pool of long-living producers
+"""
+
+# Errors after which producer connection can't be reused
+RECONNECT_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.AMQPChannelError,
+    ConnectionError,
+)
+
+
+def _pool_size() -> int:
+    return int(get_var('BB_RABBITMQ_POOL_SIZE')() or 4)
+
+
+@dataclass
+class ProducerPool:
+    """
+    Thread safe pool of producers.
+
+    Every producer keeps its connection and channel opened between sends,
+    connection is (re)opened lazily on the first send after failure.
+    Producer is owned by one thread while it is acquired, because pika connections are not thread safe.
+
+    :param size: int - max count of producers (connections)
+    :param timeout: Optional[float] - seconds to wait for free producer, None - wait forever
+    :param retries: int - how many times resend message through new connection
+    :param factory: Callable[[], MessageProducer] - producer constructor, producer of BB_TRANSPORT by default
+    """
+    size: int = field(default_factory=_pool_size)
+    timeout: Optional[float] = field(default_factory=get_var('BB_RABBITMQ_POOL_TIMEOUT'))
+    retries: int = 1
+    factory: Callable[[], MessageProducer] = field(default_factory=lambda: get_transport().producer)
+
+    _idle: LifoQueue = field(init=False, repr=False, compare=False, default_factory=LifoQueue)
+    _created: int = field(init=False, repr=False, compare=False, default=0)
+    _lock: threading.Lock = field(init=False, repr=False, compare=False, default_factory=threading.Lock)
+    _pid: int = field(init=False, repr=False, compare=False, default_factory=os.getpid)
+
+    def _check_fork(self):
+        """
+        Connections inherited from parent process must not be used (and closed) in child
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = LifoQueue()
+                    self._created = 0
+                    self._pid = os.getpid()
+
+    def acquire(self) -> MessageProducer:
+        self._check_fork()
+
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.factory()
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except Empty:
+            raise TimeoutError(f"No free producer in pool after {self.timeout} sec")
+
+    def release(self, producer: MessageProducer):
+        if self._pid != os.getpid():
+            return
+        self._idle.put(producer)
+
+    def discard(self, producer: MessageProducer):
+        """
+        Drop broken producer, new one will be created on demand
+        """
+        try:
+            producer.close()
+        except Exception:
+            pass
+
+        if self._pid != os.getpid():
+            return
+
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def producer(self):
+        """
+        Acquire producer for several sends, e.g. batch publishing
+
+        Usage:
+            with pool.producer() as producer:
+                producer.send(message)
+        """
+        producer = self.acquire()
+        try:
+            yield producer
+        except RECONNECT_ERRORS:
+            self.discard(producer)
+            raise
+        except BaseException:
+            self.release(producer)
+            raise
+        else:
+            self.release(producer)
+
+    def send(self, message):
+        """
+        Send message with pooled producer, reconnect if connection was lost
+        Args:
+            message: Dict
+
+        Returns:
+
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.producer() as producer:
+                    return producer.send(message)
+            except RECONNECT_ERRORS:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+
+    def send_many(self, messages: Iterable, **kwargs) -> PublishResult:
+        """
+        Publish batch with one pooled producer, failed messages are reported, not resent
+        Args:
+            messages: Iterable[Dict]
+            **kwargs: window, timeout of batch
+
+        Returns:
+            PublishResult
+        """
+        with self.producer() as producer:
+            return producer.send_many(messages, **kwargs)
+
+    def close(self):
+        """
+        Close all idle producers
+        """
+        while True:
+            try:
+                producer = self._idle.get_nowait()
+            except Empty:
+                break
+            self.discard(producer)
+
+
+_pool: Optional[ProducerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_producer_pool() -> ProducerPool:
+    """
+    Lazy process-wide producer pool
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProducerPool()
+                atexit.register(_pool.close)
+
+    return _pool
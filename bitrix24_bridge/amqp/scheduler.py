@@ -0,0 +1,269 @@
+import atexit
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from queue import PriorityQueue
+from typing import Any, Dict, List, Optional
+
+from bitrix24_bridge.amqp.amqp import PublishResult, get_var
+from bitrix24_bridge.amqp.pool import ProducerPool, get_producer_pool
+
+"""
+Client-side rate limiting of outbound commands
+"""
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BULK = 10
+
+# Methods which produce long bulk traffic
+BULK_METHODS = {'list', 'batch'}
+
+
+def command_priority(message: Dict) -> int:
+    """
+    Interactive get/add/update/delete go before bulk list/batch traffic
+    """
+    method = (message.get('method') or '').rsplit('.', 1)[-1]
+    return PRIORITY_BULK if method in BULK_METHODS else PRIORITY_INTERACTIVE
+
+
+@dataclass
+class TokenBucket:
+    """
+    Token bucket, tokens can be borrowed: reserve() takes tokens at once and returns delay to keep the rate
+
+    :param rate: float - tokens per second
+    :param capacity: float - max burst
+    """
+    rate: float
+    capacity: float
+
+    tokens: float = field(init=False)
+    updated: float = field(init=False, default_factory=time.monotonic)
+    lock: threading.Lock = field(init=False, repr=False, compare=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def reserve(self, n: float = 1) -> float:
+        """
+        Take n tokens
+        Returns:
+            float - seconds to wait before use of the tokens
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, n: float = 1):
+        delay = self.reserve(n)
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass(order=True)
+class Job:
+    priority: int
+    seq: int
+    messages: List[Any] = field(compare=False)
+    future: Future = field(compare=False)
+    single: bool = field(compare=False, default=True)
+    enqueued: float = field(compare=False, default_factory=time.monotonic)
+
+
+@dataclass
+class JobStats:
+    depth: int = 0
+    dispatched: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    @property
+    def wait_avg(self) -> float:
+        return self.wait_total / self.dispatched if self.dispatched else 0.0
+
+
+@dataclass
+class CommandScheduler:
+    """
+    Priority queue of outbound commands in front of producer pool, limited by token bucket.
+
+    Commands are published by one background thread in (priority, arrival) order.
+    Bulk batches are split into chunks of `burst` messages, so interactive commands can go between them.
+
+    :param rate: float - commands per second, BB_RATE_LIMIT
+    :param burst: int - bucket capacity, BB_RATE_BURST
+    :param pool: ProducerPool
+    """
+    rate: float = field(default_factory=lambda: float(get_var('BB_RATE_LIMIT')() or 2))
+    burst: int = field(default_factory=lambda: int(get_var('BB_RATE_BURST')() or 0))
+    pool: Optional[ProducerPool] = None
+
+    bucket: TokenBucket = field(init=False, repr=False)
+    queue: PriorityQueue = field(init=False, repr=False, default_factory=PriorityQueue)
+    counter: Any = field(init=False, repr=False, default_factory=itertools.count)
+    stats_by_priority: Dict[int, JobStats] = field(init=False, repr=False, default_factory=dict)
+    lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    thread: Optional[threading.Thread] = field(init=False, repr=False, default=None)
+    closed: bool = field(init=False, repr=False, default=False)
+
+    def __post_init__(self):
+        self.burst = self.burst or max(1, int(self.rate))
+        self.bucket = TokenBucket(rate=self.rate, capacity=self.burst)
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='bitrix-command-scheduler', daemon=True)
+                    self.thread.start()
+
+    def _put(self, messages: List, priority: int, single: bool) -> Future:
+        if self.closed:
+            raise RuntimeError("Scheduler is closed")
+
+        future = Future()
+        with self.lock:
+            self.stats_by_priority.setdefault(priority, JobStats()).depth += 1
+        self.queue.put(Job(priority, next(self.counter), messages, future, single=single))
+        self._start()
+        return future
+
+    def submit(self, message: Dict, priority: Optional[int] = None) -> Future:
+        """
+        Enqueue one command
+        Returns:
+            Future - resolved after publishing
+        """
+        if priority is None:
+            priority = command_priority(message)
+        return self._put([message], priority, single=True)
+
+    def submit_many(self, messages: List[Dict], priority: int = PRIORITY_BULK) -> Future:
+        """
+        Enqueue batch of commands, it is published with confirms by chunks of `burst` messages
+        Returns:
+            Future[PublishResult]
+        """
+        messages = list(messages)
+        chunks = [
+            self._put(messages[i:i + self.burst], priority, single=False)
+            for i in range(0, len(messages), self.burst)
+        ]
+
+        future = Future()
+        if not chunks:
+            future.set_result(PublishResult())
+            return future
+
+        result = PublishResult()
+        remaining = [len(chunks)]
+        lock = threading.Lock()
+
+        def done(offset: int, chunk: Future):
+            with lock:
+                try:
+                    r: PublishResult = chunk.result()
+                    result.sent += r.sent
+                    result.failed.extend((offset + i, m) for i, m in r.failed)
+                except Exception:
+                    chunk_messages = messages[offset:offset + self.burst]
+                    result.failed.extend((offset + i, m) for i, m in enumerate(chunk_messages))
+
+                remaining[0] -= 1
+                if not remaining[0]:
+                    result.failed.sort(key=lambda item: item[0])
+                    future.set_result(result)
+
+        for n, chunk in enumerate(chunks):
+            chunk.add_done_callback(lambda f, offset=n * self.burst: done(offset, f))
+
+        return future
+
+    def dispatch(self, job: Job):
+        pool = self.pool or get_producer_pool()
+        self.bucket.acquire(len(job.messages))
+
+        if job.single:
+            pool.send(job.messages[0])
+            return True
+
+        return pool.send_many(job.messages)
+
+    def run(self):
+        while True:
+            job: Job = self.queue.get()
+            if job.messages is None:
+                break
+
+            wait = time.monotonic() - job.enqueued
+            with self.lock:
+                stats = self.stats_by_priority[job.priority]
+                stats.depth -= 1
+                stats.dispatched += 1
+                stats.wait_total += wait
+                stats.wait_max = max(stats.wait_max, wait)
+
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                job.future.set_result(self.dispatch(job))
+            except Exception as e:
+                job.future.set_exception(e)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        """
+        Returns:
+            Dict[int, Dict[str, float]] - {priority: {depth, dispatched, wait_avg, wait_max}}
+        """
+        with self.lock:
+            return {
+                priority: {
+                    "depth": s.depth,
+                    "dispatched": s.dispatched,
+                    "wait_avg": s.wait_avg,
+                    "wait_max": s.wait_max,
+                }
+                for priority, s in self.stats_by_priority.items()
+            }
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Publish enqueued commands and stop background thread
+        """
+        self.closed = True
+        if self.thread is not None and self.thread.is_alive():
+            # goes after all enqueued jobs
+            self.queue.put(Job(sys.maxsize, next(self.counter), None, Future()))
+            self.thread.join(timeout)
+
+
+_scheduler: Optional[CommandScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[CommandScheduler]:
+    """
+    Process-wide scheduler, None if BB_RATE_LIMIT is not set
+    """
+    global _scheduler
+
+    if _scheduler is None and get_var('BB_RATE_LIMIT')():
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = CommandScheduler()
+                atexit.register(_scheduler.close)
+
+    return _scheduler
@@ -0,0 +1,482 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from queue import Empty, Queue
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import ujson
+from django.core.exceptions import ImproperlyConfigured
+
+from bitrix24_bridge.amqp.amqp import (
+    MessageConsumer,
+    MessageProducer,
+    PublishResult,
+    RabbitMQConsumer,
+    RabbitMQProducer,
+    get_var,
+)
+
+"""
+Transport registry: producer and consumer implementations chosen by BB_TRANSPORT
+
+    rabbitmq - RabbitMQ by pika, default
+    memory - in-process queues, for load tests of listener and exports in one process
+    spool - append-only files in BB_TRANSPORT_SPOOL_DIR, for load tests of separate processes on one machine
+"""
+
+
+@dataclass(frozen=True)
+class Transport:
+    producer: Callable[[], MessageProducer]
+    consumer: Callable[[], MessageConsumer]
+
+
+TRANSPORTS: Dict[str, Transport] = {}
+
+
+def register_transport(name: str, producer: Callable[[], MessageProducer], consumer: Callable[[], MessageConsumer]):
+    TRANSPORTS[name] = Transport(producer=producer, consumer=consumer)
+
+
+def get_transport(name: Optional[str] = None) -> Transport:
+    name = name or get_var('BB_TRANSPORT')() or 'rabbitmq'
+    try:
+        return TRANSPORTS[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown BB_TRANSPORT {name}, registered: {', '.join(sorted(TRANSPORTS))}")
+
+
+def create_producer() -> MessageProducer:
+    return get_transport().producer()
+
+
+def create_consumer() -> MessageConsumer:
+    return get_transport().consumer()
+
+
+def command_queue() -> str:
+    return get_var('BB_RABBITMQ_ROUTING_KEY')() or 'send.command'
+
+
+def message_queue() -> str:
+    return get_var('BB_RABBITMQ_MESSAGE_QUEUE')() or 'bitrix24-info'
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """
+    Consumed message attributes, the same as used from pika method frame
+    """
+    delivery_tag: int
+    redelivered: bool = False
+
+
+@dataclass
+class LocalConsumer(MessageConsumer):
+    """
+    Consumer loop of local transports with semantics of RabbitMQConsumer:
+    callback(channel, method_frame, header_frame, body), at most `prefetch_count` unsettled messages,
+    failed message is requeued once and rejected on redelivery, callbacks of other threads run in consumer thread
+    """
+    queue: str = field(default_factory=message_queue)
+    prefetch_count: int = field(default_factory=lambda: int(get_var('BB_RABBITMQ_PREFETCH_COUNT')() or 100))
+    requeue_on_failure: bool = field(default_factory=lambda: get_var('BB_RABBITMQ_REQUEUE_ON_FAILURE')() is not False)
+    # seconds to wait for new message
+    poll_interval: float = 0.05
+
+    buffer: List = field(init=False, repr=False, compare=False, default_factory=list)
+
+    _open: bool = field(init=False, repr=False, compare=False, default=False)
+    _unsettled: Set[int] = field(init=False, repr=False, compare=False, default_factory=set)
+    _callbacks: Queue = field(init=False, repr=False, compare=False, default_factory=Queue)
+
+    @abstractmethod
+    def fetch(self, timeout: float) -> Optional[Tuple[Delivery, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def settle(self, delivery_tag: int, ack: bool, requeue: bool):
+        raise NotImplementedError
+
+    def connect(self):
+        self._open = True
+        return self
+
+    def close(self):
+        self._open = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def default_callback(self, channel, method_frame, header_frame, body):
+        try:
+            msg = ujson.loads(body)
+        except Exception:
+            msg = "¯\_(ツ)_/¯"
+        self.buffer.append(msg)
+        self.settle(method_frame.delivery_tag, ack=True, requeue=False)
+
+    def track(self, delivery_tag: int):
+        self._unsettled.add(delivery_tag)
+
+    def ack(self, delivery_tag: int):
+        self._unsettled.discard(delivery_tag)
+        self.settle(delivery_tag, ack=True, requeue=False)
+
+    def nack(self, delivery_tag: int, redelivered: bool = False, requeue: Optional[bool] = None):
+        if requeue is None:
+            requeue = self.requeue_on_failure and not redelivered
+        self._unsettled.discard(delivery_tag)
+        self.settle(delivery_tag, ack=False, requeue=requeue)
+
+    def call_threadsafe(self, callback: Callable[[], None]):
+        self._callbacks.put(callback)
+
+    def process_events(self, time_limit: float = 0):
+        """
+        Run callbacks of other threads, wait for the first one at most `time_limit` seconds
+        """
+        try:
+            callback = self._callbacks.get(timeout=time_limit) if time_limit else self._callbacks.get_nowait()
+        except Empty:
+            return
+        while True:
+            callback()
+            try:
+                callback = self._callbacks.get_nowait()
+            except Empty:
+                return
+
+    def receive(self, callback=None, on_stop: Optional[Callable[[], None]] = None):
+        """
+        Consume messages until KeyboardInterrupt
+        """
+        if callback is None:
+            callback = self.default_callback
+
+        self.connect()
+        try:
+            while True:
+                self.process_events()
+                if self.prefetch_count and len(self._unsettled) >= self.prefetch_count:
+                    self.process_events(time_limit=self.poll_interval)
+                    continue
+
+                item = self.fetch(self.poll_interval)
+                if item is not None:
+                    delivery, body = item
+                    callback(None, delivery, None, body)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try:
+                if on_stop is not None:
+                    on_stop()
+            finally:
+                self.close()
+
+
+class MemoryQueue:
+    """
+    Thread safe queue with unacknowledged messages, nacked messages go back to the head
+    """
+
+    def __init__(self):
+        self.ready: Deque[Tuple[Any, bool]] = deque()
+        self.unacked: Dict[int, Any] = {}
+        self.dead: List = []
+        self.delivery_tag = 0
+        self.condition = threading.Condition()
+
+    def put(self, body: Any, redelivered: bool = False):
+        with self.condition:
+            if redelivered:
+                self.ready.appendleft((body, True))
+            else:
+                self.ready.append((body, False))
+            self.condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[Delivery, Any]]:
+        with self.condition:
+            if not self.ready and not self.condition.wait_for(lambda: self.ready, timeout=timeout):
+                return None
+            body, redelivered = self.ready.popleft()
+            self.delivery_tag += 1
+            self.unacked[self.delivery_tag] = body
+            return Delivery(self.delivery_tag, redelivered), body
+
+    def settle(self, delivery_tag: int, ack: bool, requeue: bool):
+        with self.condition:
+            body = self.unacked.pop(delivery_tag, None)
+        if body is None or ack:
+            return
+        if requeue:
+            self.put(body, redelivered=True)
+        else:
+            self.dead.append(body)
+
+    def __len__(self) -> int:
+        return len(self.ready)
+
+
+class MemoryBroker:
+    """
+    Process-wide named in-memory queues
+
+    Usage (load test):
+        get_memory_broker().publish(message_queue(), response)  # as bitrix24-bridge would do
+        get_memory_broker().queue(command_queue())  # commands published by send_command
+    """
+
+    def __init__(self):
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.lock = threading.Lock()
+
+    def queue(self, name: str) -> MemoryQueue:
+        with self.lock:
+            if name not in self.queues:
+                self.queues[name] = MemoryQueue()
+            return self.queues[name]
+
+    def publish(self, name: str, message: Any):
+        self.queue(name).put(message if isinstance(message, (str, bytes)) else ujson.dumps(message))
+
+
+_broker = MemoryBroker()
+
+
+def get_memory_broker() -> MemoryBroker:
+    return _broker
+
+
+@dataclass
+class MemoryProducer(MessageProducer):
+    routing_key: str = field(default_factory=command_queue)
+
+    def connect(self):
+        return self
+
+    def close(self):
+        pass
+
+    def send(self, message):
+        get_memory_broker().publish(self.routing_key, message)
+
+
+@dataclass
+class MemoryConsumer(LocalConsumer):
+
+    def fetch(self, timeout: float) -> Optional[Tuple[Delivery, Any]]:
+        return get_memory_broker().queue(self.queue).get(timeout=timeout)
+
+    def settle(self, delivery_tag: int, ack: bool, requeue: bool):
+        get_memory_broker().queue(self.queue).settle(delivery_tag, ack=ack, requeue=requeue)
+
+
+def spool_dir() -> str:
+    return get_var('BB_TRANSPORT_SPOOL_DIR')() or os.path.join(tempfile.gettempdir(), 'bitrix24_spool')
+
+
+class FileSpool:
+    """
+    Append-only log of queue messages, one JSON line per message: <directory>/<queue>.log
+
+    Writers append under exclusive flock, so several producer processes can share one spool.
+    Offset of the consumed and settled part of log is kept in <queue>.offset, rejected messages in <queue>.dead
+
+    :param directory: str
+    :param queue: str
+    :param fsync: bool - fsync log after every append
+    """
+
+    def __init__(self, directory: str, queue: str, fsync: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, f'{queue}.log')
+        self.offset_path = os.path.join(directory, f'{queue}.offset')
+        self.dead_path = os.path.join(directory, f'{queue}.dead')
+        self.fsync = fsync
+
+    @staticmethod
+    def line(body: Any, redelivered: bool = False) -> bytes:
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        elif not isinstance(body, str):
+            body = ujson.dumps(body)
+        return (json.dumps({"redelivered": redelivered, "body": body}, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def append(self, bodies: Iterable[Any], redelivered: bool = False, path: Optional[str] = None) -> int:
+        data = b''.join(self.line(body, redelivered) for body in bodies)
+        if not data:
+            return 0
+
+        with open(path or self.log_path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return data.count(b'\n')
+
+    def read_offset(self) -> int:
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_offset(self, offset: int):
+        tmp_path = f'{self.offset_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+
+@dataclass
+class SpoolProducer(MessageProducer):
+    directory: str = field(default_factory=spool_dir)
+    routing_key: str = field(default_factory=command_queue)
+    fsync: bool = field(default_factory=lambda: bool(get_var('BB_TRANSPORT_SPOOL_FSYNC')()))
+
+    spool: Optional[FileSpool] = field(default=None, init=False, repr=False, compare=False)
+
+    def connect(self):
+        if self.spool is None:
+            self.spool = FileSpool(self.directory, self.routing_key, fsync=self.fsync)
+        return self.spool
+
+    def close(self):
+        pass
+
+    def send(self, message):
+        self.connect().append([message])
+
+    def send_many(self, messages: Iterable, **kwargs) -> PublishResult:
+        """
+        Append all messages by one write
+        """
+        messages = list(messages)
+        try:
+            return PublishResult(sent=self.connect().append(messages))
+        except OSError:
+            return PublishResult(failed=list(enumerate(messages)))
+
+
+@dataclass
+class SpoolConsumer(LocalConsumer):
+    """
+    Single consumer of spool queue. Log is read from the committed offset, so messages not settled
+    before restart are delivered again. Requeued message is delivered again with redelivered flag
+    before the next lines of log, like nacked message of MemoryQueue goes back to the head.
+    The offset is not moved over requeued message until it is settled.
+
+    Limitations:
+        - only one listener process may consume a queue, offsets of several consumers overwrite each other
+    """
+    directory: str = field(default_factory=spool_dir)
+    fsync: bool = field(default_factory=lambda: bool(get_var('BB_TRANSPORT_SPOOL_FSYNC')()))
+    # write offset every N settled messages
+    commit_every: int = field(default_factory=lambda: int(get_var('BB_RABBITMQ_ACK_BATCH_SIZE')() or 50))
+
+    spool: Optional[FileSpool] = field(default=None, init=False, repr=False, compare=False)
+    file: Any = field(default=None, init=False, repr=False, compare=False)
+
+    # delivery tag -> (end offset of line, body)
+    _pending: Dict[int, Tuple[int, Any]] = field(init=False, repr=False, compare=False, default_factory=dict)
+    # delivery tags of requeued messages, delivered again before the rest of log
+    _requeued: Deque[int] = field(init=False, repr=False, compare=False, default_factory=deque)
+    # delivery tag of redelivery -> delivery tag of log line
+    _redeliveries: Dict[int, int] = field(init=False, repr=False, compare=False, default_factory=dict)
+    _settled: Set[int] = field(init=False, repr=False, compare=False, default_factory=set)
+    _delivery_tag: int = field(init=False, repr=False, compare=False, default=0)
+    _uncommitted: int = field(init=False, repr=False, compare=False, default=0)
+    _offset: int = field(init=False, repr=False, compare=False, default=0)
+
+    def connect(self):
+        if self.file is None:
+            self.spool = FileSpool(self.directory, self.queue, fsync=self.fsync)
+            open(self.spool.log_path, 'ab').close()
+            self._offset = self.spool.read_offset()
+            self.file = open(self.spool.log_path, 'rb')
+            self.file.seek(self._offset)
+        return super().connect()
+
+    def close(self):
+        if self.file is not None:
+            self.commit(force=True)
+            self.file.close()
+            self.file = None
+        super().close()
+
+    def fetch(self, timeout: float) -> Optional[Tuple[Delivery, Any]]:
+        if self._requeued:
+            original = self._requeued.popleft()
+            self._delivery_tag += 1
+            self._redeliveries[self._delivery_tag] = original
+            return Delivery(self._delivery_tag, True), self._pending[original][1]
+
+        position = self.file.tell()
+        line = self.file.readline()
+        if not line.endswith(b'\n'):
+            # end of log or line being written
+            self.file.seek(position)
+            time.sleep(timeout)
+            return None
+
+        self._delivery_tag += 1
+        try:
+            record = json.loads(line.decode('utf-8'))
+        except ValueError:
+            record = {"redelivered": False, "body": line}
+
+        self._pending[self._delivery_tag] = (self.file.tell(), record["body"])
+        return Delivery(self._delivery_tag, bool(record.get("redelivered"))), record["body"]
+
+    def settle(self, delivery_tag: int, ack: bool, requeue: bool):
+        delivery_tag = self._redeliveries.pop(delivery_tag, delivery_tag)
+        item = self._pending.get(delivery_tag)
+        if item is None:
+            return
+
+        if not ack:
+            if requeue:
+                self._requeued.append(delivery_tag)
+                return
+            self.spool.append([item[1]], path=self.spool.dead_path)
+
+        self._settled.add(delivery_tag)
+        self.commit()
+
+    def commit(self, force: bool = False):
+        """
+        Move offset over settled prefix of delivered messages
+        """
+        offset = None
+        # pending lines are in log order, redeliveries have no lines of their own
+        while self._pending:
+            delivery_tag = next(iter(self._pending))
+            if delivery_tag not in self._settled:
+                break
+            self._settled.discard(delivery_tag)
+            offset, _ = self._pending.pop(delivery_tag)
+            self._uncommitted += 1
+
+        if offset is not None:
+            self._offset = offset
+        if self._uncommitted and (force or self._uncommitted >= self.commit_every):
+            self.spool.write_offset(self._offset)
+            self._uncommitted = 0
+
+
+register_transport('rabbitmq', RabbitMQProducer, RabbitMQConsumer)
+register_transport('memory', MemoryProducer, MemoryConsumer)
+register_transport('spool', SpoolProducer, SpoolConsumer)
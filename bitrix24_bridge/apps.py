@@ -13,6 +13,17 @@ class BitrixConfig(OscarConfig):
     def ready(self):
         super().ready()
 
+        from bitrix24_bridge.mixin import BitrixSyncMixin
+
+        for model in self.get_models():
+            if issubclass(model, BitrixSyncMixin):
+                model.compile_maps()
+
+        from bitrix24_bridge import capture
+
+        if capture.capture_enabled():
+            capture.connect()
+
     def get_urls(self):
         urls = super().get_urls()
 
@@ -0,0 +1,226 @@
+import ast
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import dateparse
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.cache import ImportSession, current_session
+from bitrix24_bridge.utils import parse_datetime
+
+"""
+Bulk writer of product attribute values
+"""
+
+
+def to_text(value: Any) -> str:
+    return str(value)
+
+
+def to_integer(value: Any) -> int:
+    number = Decimal(str(value).strip())
+    if number != number.to_integral_value():
+        raise ValueError(f"Not integer: {value}")
+    return int(number)
+
+
+def to_float(value: Any) -> float:
+    return float(str(value).strip().replace(',', '.'))
+
+
+def to_boolean(value: Any) -> bool:
+    return str(value).strip().upper() in ('Y', '1', 'TRUE', 'YES')
+
+
+def to_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    result = dateparse.parse_date(text[:10])
+    if result is None:
+        raise ValueError(f"Wrong date: {value}")
+    return result
+
+
+def to_datetime(value: Any) -> datetime:
+    result = parse_datetime(value)
+    if result is None:
+        raise ValueError(f"Wrong datetime: {value}")
+    return result
+
+
+# oscar attribute type -> converter of bitrix value, option values are resolved by AttributeValueWriter
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    'text': to_text,
+    'richtext': to_text,
+    'integer': to_integer,
+    'float': to_float,
+    'boolean': to_boolean,
+    'date': to_date,
+    'datetime': to_datetime,
+}
+
+
+def property_value(data: Any) -> Any:
+    """
+    Value of product custom property in bitrix format: {"valueId": ..., "value": ...}.
+    HStoreField keeps nested dicts as their str() after reloading from db, see ProductPropertyBX.parse_values()
+    """
+    if isinstance(data, str) and data.startswith('{'):
+        try:
+            data = ast.literal_eval(data)
+        except (ValueError, SyntaxError):
+            return data
+    if isinstance(data, dict):
+        return data.get('value')
+    return data
+
+
+def export_value(value: Any) -> Any:
+    """
+    Oscar attribute value in bitrix format, options are exported by AttributeOption text
+    """
+    if isinstance(value, bool):
+        return 'Y' if value else 'N'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'option'):
+        return value.option
+    return value
+
+
+class AttributeValueWriter:
+    """
+    Writes attribute values of a page of products by bulk queries:
+    one SELECT of existing values, one INSERT of new ones, one UPDATE per attribute type
+    and one DELETE of emptied values. Unchanged values are not written.
+
+    Option values are resolved by bitrix value id or option text against options cached in import session.
+    Types without bulk support (file, image, entity, multi_option) go through ProductAttribute.save_value().
+
+    Usage:
+        writer = AttributeValueWriter()
+        writer.add(product, attribute, "red")
+        stats = writer.write()
+
+    :param session: ImportSession - current session by default
+    """
+
+    def __init__(self, session: Optional[ImportSession] = None):
+        self.session = session or current_session()
+        # (product id, attribute id) -> (product, attribute, value)
+        self.values: Dict[Tuple[int, int], Tuple[Any, Any, Any]] = {}
+        self.stats: Counter = Counter()
+
+    def add(self, product, attribute, value: Any):
+        self.values[(product.pk, attribute.pk)] = (product, attribute, value)
+
+    def convert(self, attribute, value: Any) -> Any:
+        """
+        Column value of attribute type, None to delete value
+        """
+        if value is None or value == '':
+            return None
+
+        if attribute.type == 'option':
+            # list properties of products have value ids, option text is accepted too
+            option_id = (
+                self.session.option_id_by_value(attribute.code, str(value))
+                or self.session.option_id(attribute.option_group_id, str(value))
+            )
+            if option_id is None:
+                raise ValueError(f"Unknown option {value} of attribute {attribute.code}")
+            return option_id
+
+        return CONVERTERS[attribute.type](value)
+
+    @staticmethod
+    def column(attribute) -> str:
+        return 'value_option_id' if attribute.type == 'option' else f'value_{attribute.type}'
+
+    def write(self) -> Counter:
+        """
+        Returns:
+            Counter - created, updated, deleted, unchanged, fallback and error values
+        """
+        ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+        if not self.values:
+            return self.stats
+
+        bulk, fallback = {}, []
+        for key, (product, attribute, value) in self.values.items():
+            if attribute.type in CONVERTERS or attribute.type == 'option':
+                bulk[key] = (product, attribute, value)
+            else:
+                fallback.append((product, attribute, value))
+
+        option_attributes = [attribute for _, attribute, _ in bulk.values() if attribute.type == 'option']
+        self.session.load_option_values(attribute.code for attribute in option_attributes)
+        self.session.load_options(attribute.option_group_id for attribute in option_attributes)
+
+        existing: Dict[Tuple[int, int], Any] = {
+            (value_obj.product_id, value_obj.attribute_id): value_obj
+            for value_obj in ProductAttributeValue.objects.filter(
+                product_id__in={product_id for product_id, _ in bulk},
+                attribute_id__in={attribute_id for _, attribute_id in bulk},
+            )
+        }
+
+        to_create = []
+        to_update: Dict[str, List] = defaultdict(list)
+        to_delete = []
+
+        for key, (product, attribute, value) in bulk.items():
+            try:
+                new = self.convert(attribute, value)
+            except Exception:
+                self.stats['error'] += 1
+                continue
+
+            column = self.column(attribute)
+            value_obj = existing.get(key)
+
+            if value_obj is None:
+                if new is None:
+                    continue
+                value_obj = ProductAttributeValue(product_id=product.pk, attribute_id=attribute.pk)
+                setattr(value_obj, column, new)
+                to_create.append(value_obj)
+            elif new is None:
+                to_delete.append(value_obj.pk)
+            elif getattr(value_obj, column) == new:
+                self.stats['unchanged'] += 1
+            else:
+                setattr(value_obj, column, new)
+                to_update[column].append(value_obj)
+
+        with transaction.atomic():
+            if to_create:
+                ProductAttributeValue.objects.bulk_create(to_create, ignore_conflicts=True)
+            for column, objs in to_update.items():
+                ProductAttributeValue.objects.bulk_update(objs, [column])
+            if to_delete:
+                ProductAttributeValue.objects.filter(pk__in=to_delete).delete()
+
+            for product, attribute, value in fallback:
+                try:
+                    with transaction.atomic():
+                        attribute.save_value(product, value)
+                    self.stats['fallback'] += 1
+                except Exception:
+                    self.stats['error'] += 1
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += sum(len(objs) for objs in to_update.values())
+        self.stats['deleted'] += len(to_delete)
+
+        self.values = {}
+        return self.stats
@@ -0,0 +1,183 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bitrix24_bridge.amqp.amqp import PublishResult
+from bitrix24_bridge.utils import http_build_query
+
+"""
+Pack commands into Bitrix24 REST `batch` calls
+https://training.bitrix24.com/rest_help/general/batch.php
+"""
+
+# Bitrix24 limit of commands per batch call
+BATCH_LIMIT = 50
+
+_local = threading.local()
+
+
+def command_key(index: int) -> str:
+    return f"cmd{index}"
+
+
+def pack_commands(commands: Iterable[Dict], size: int = BATCH_LIMIT, halt: bool = False) -> List[Dict]:
+    """
+    Pack commands (see BitrixSyncMixin.make_command) into `batch` commands.
+
+    Every batched command gets own key, meta["commands"][key] keeps
+    method, action and meta of original command to fan out results in listener.
+
+    Args:
+        commands: Iterable[Dict]
+        size: int - commands per batch, not greater than BATCH_LIMIT
+        halt: bool - stop batch on first error
+
+    Returns:
+        List[Dict] - batch commands
+    """
+    size = max(1, min(size, BATCH_LIMIT))
+    batches = []
+    cmd, meta = {}, {}
+
+    for i, command in enumerate(commands):
+        key = command_key(i)
+        cmd[key] = f"{command['method']}?{http_build_query(command.get('params'))}"
+        meta[key] = {
+            "method": command['method'],
+            "action": command.get('action'),
+            "meta": command.get('meta'),
+        }
+
+        if len(cmd) >= size:
+            batches.append(make_batch(cmd, meta, halt))
+            cmd, meta = {}, {}
+
+    if cmd:
+        batches.append(make_batch(cmd, meta, halt))
+
+    return batches
+
+
+def make_batch(cmd: Dict[str, str], meta: Dict[str, Dict], halt: bool = False) -> Dict:
+    return {
+        "method": "batch",
+        "action": "batch",
+        "params": {
+            "halt": 1 if halt else 0,
+            "cmd": cmd,
+        },
+        "meta": {
+            "commands": meta,
+        },
+    }
+
+
+def unpack_results(data: Dict, meta: Optional[Dict] = None) -> List[Dict]:
+    """
+    Fan out result of `batch` command into results of single commands
+    Args:
+        data: Dict - {"status_code": int, "result": {"result": {key: ...}, "result_error": {key: ...}, ...}}
+        meta: Optional[Dict] - meta of batch command, taken from data if None
+
+    Returns:
+        List[Dict] - [{"method": ..., "action": ..., "meta": ..., "status_code": ..., "result": ...}]
+    """
+    meta = meta or data.get('meta') or {}
+    commands: Dict[str, Dict] = meta.get('commands') or {}
+
+    batch_result: Dict = data.get('result') or {}
+    results: Dict = batch_result.get('result') or {}
+    errors: Dict = batch_result.get('result_error') or {}
+    totals: Dict = batch_result.get('result_total') or {}
+    nexts: Dict = batch_result.get('result_next') or {}
+
+    # Bitrix returns empty list instead of empty dict
+    results = results if isinstance(results, dict) else {}
+    errors = errors if isinstance(errors, dict) else {}
+    totals = totals if isinstance(totals, dict) else {}
+    nexts = nexts if isinstance(nexts, dict) else {}
+
+    parts = []
+    for key, command in commands.items():
+        if key in errors:
+            part = {"status_code": 400, "result": None, "error": errors[key]}
+        elif key in results:
+            part = {"status_code": data.get('status_code', 200), "result": results[key]}
+        else:
+            # not executed because of halt
+            continue
+
+        part.update(command)
+
+        if key in totals:
+            part['total'] = totals[key]
+        if key in nexts:
+            part['next'] = nexts[key]
+
+        parts.append(part)
+
+    return parts
+
+
+class BatchCoalescer:
+    """
+    Collect single commands and send them packed in `batch` commands.
+
+    While coalescer is active as context manager, BitrixSyncMixin.send_command
+    of the same thread is collected too.
+
+    Usage:
+        with BatchCoalescer() as batch:
+            for product in ProductBX.objects.all():
+                product.update()
+        batch.result
+
+    :param sender: Callable[[List[Dict]], PublishResult] - e.g. BitrixSyncMixin.send_commands
+    :param size: int - commands per batch
+    :param halt: bool - stop batch on first error
+    """
+
+    def __init__(self, sender: Callable[[List[Dict]], PublishResult], size: int = BATCH_LIMIT, halt: bool = False):
+        self.sender = sender
+        self.size = max(1, min(size, BATCH_LIMIT))
+        self.halt = halt
+
+        self.commands: List[Dict] = []
+        self.result = PublishResult()
+
+    def add(self, command: Dict):
+        self.commands.append(command)
+        if len(self.commands) >= self.size:
+            self.flush()
+
+    def flush(self) -> PublishResult:
+        if not self.commands:
+            return self.result
+
+        batches = pack_commands(self.commands, size=self.size, halt=self.halt)
+        self.commands = []
+
+        result = self.sender(batches)
+        self.result.sent += result.sent
+        self.result.failed.extend(result.failed)
+
+        return self.result
+
+    def __enter__(self):
+        stack = getattr(_local, 'coalescers', None)
+        if stack is None:
+            stack = _local.coalescers = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.coalescers.remove(self)
+        if exc_type is None:
+            self.flush()
+
+
+def current_coalescer() -> Optional[BatchCoalescer]:
+    """
+    Innermost active coalescer of current thread
+    """
+    stack = getattr(_local, 'coalescers', None)
+    return stack[-1] if stack else None
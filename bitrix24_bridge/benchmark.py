@@ -0,0 +1,353 @@
+import json
+import resource
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import factory
+import factory.random
+from django.db import connection, transaction
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.fullsync import PAGE_SIZE
+
+"""
+Benchmark of listener import path with synthetic Bitrix24 list messages, see `bitrix_benchmark` command
+"""
+
+
+class SectionPayloadFactory(factory.DictFactory):
+    NAME = factory.Faker('word')
+    CATALOG_ID = '1'
+    XML_ID = factory.Faker('uuid4')
+
+
+class PropertyPayloadFactory(factory.DictFactory):
+    NAME = factory.Faker('word')
+    IBLOCK_ID = '1'
+    ACTIVE = 'Y'
+    SORT = '500'
+    PROPERTY_TYPE = factory.LazyFunction(lambda: factory.random.randgen.choice(['S', 'N', 'L']))
+    USER_TYPE = None
+    ROW_COUNT = '1'
+    COL_COUNT = '30'
+    MULTIPLE = 'N'
+    IS_REQUIRED = factory.LazyFunction(lambda: factory.random.randgen.choice(['N', 'Y']))
+    XML_ID = factory.Faker('uuid4')
+
+
+class ProductPayloadFactory(factory.DictFactory):
+    NAME = factory.Faker('catch_phrase')
+    ACTIVE = 'Y'
+    SORT = '500'
+    XML_ID = factory.Faker('uuid4')
+    CATALOG_ID = '1'
+    DESCRIPTION = factory.Faker('paragraph')
+    DESCRIPTION_TYPE = 'text'
+    PRICE = factory.Faker('numerify', text='####.##')
+    CURRENCY_ID = 'RUB'
+    MEASURE = '796'
+    DATE_CREATE = factory.Faker('iso8601')
+    TIMESTAMP_X = factory.Faker('iso8601')
+
+
+class SyntheticCatalog:
+    """
+    Bitrix24 catalog of random sections tree, properties of S/N/L types and products
+    with `properties_per_product` custom property values, as pages of *.list responses.
+
+    Ids start from `id_start`, so they don't clash with real bitrix ids of the database
+
+    :param sections: int
+    :param properties: int
+    :param products: int
+    :param properties_per_product: int
+    :param values_per_property: int - values of list (L) properties
+    :param page_size: int - rows per list message
+    :param id_start: int
+    :param seed: Optional[int] - seed of factory-boy/Faker random, same seed gives same catalog
+    """
+
+    def __init__(self, sections: int = 50, properties: int = 20, products: int = 1000,
+                 properties_per_product: int = 5, values_per_property: int = 10,
+                 page_size: int = PAGE_SIZE, id_start: int = 1000000, seed: Optional[int] = None):
+        self.sections = sections
+        self.properties = properties
+        self.products = products
+        self.properties_per_product = min(properties_per_product, properties)
+        self.values_per_property = values_per_property
+        self.page_size = page_size
+        self.id_start = id_start
+
+        if seed is not None:
+            factory.random.reseed_random(seed)
+        self.random = factory.random.randgen
+
+        self.section_rows = self.make_sections()
+        self.property_rows = self.make_properties()
+        self.product_rows = self.make_products()
+
+    def make_sections(self) -> List[Dict]:
+        rows = []
+        for i in range(self.sections):
+            b_id = str(self.id_start + i)
+            # parent is one of previous sections, a third of sections are roots
+            parent = rows[self.random.randrange(len(rows))]['ID'] if rows and self.random.random() > 0.33 else None
+            rows.append(SectionPayloadFactory(ID=b_id, SECTION_ID=parent))
+        return rows
+
+    def make_properties(self) -> List[Dict]:
+        rows = []
+        for i in range(self.properties):
+            row = PropertyPayloadFactory(ID=str(self.id_start + i))
+            if row['PROPERTY_TYPE'] == 'L':
+                value_ids = [str(self.id_start + i * self.values_per_property + j)
+                             for j in range(self.values_per_property)]
+                row['VALUES'] = {
+                    value_id: {"ID": value_id, "VALUE": f"{row['NAME']} {j}", "XML_ID": f"v{value_id}"}
+                    for j, value_id in enumerate(value_ids)
+                }
+            else:
+                row['VALUES'] = {}
+            rows.append(row)
+        return rows
+
+    def property_value(self, prop: Dict, n: int) -> Dict:
+        if prop['PROPERTY_TYPE'] == 'L':
+            value = self.random.choice(list(prop['VALUES']))
+        elif prop['PROPERTY_TYPE'] == 'N':
+            value = str(self.random.randint(0, 10000))
+        else:
+            value = factory.Faker('word').generate({})
+        return {"valueId": str(n), "value": value}
+
+    def make_products(self) -> List[Dict]:
+        rows = []
+        for i in range(self.products):
+            row = ProductPayloadFactory(
+                ID=str(self.id_start + i),
+                SECTION_ID=self.random.choice(self.section_rows)['ID'] if self.section_rows else None,
+            )
+            for prop in self.random.sample(self.property_rows, self.properties_per_product):
+                row[f"PROPERTY_{prop['ID']}"] = self.property_value(prop, i)
+            rows.append(row)
+        return rows
+
+    def messages(self, entity: str, rows: List[Dict]) -> List[Dict]:
+        """
+        Listener messages with one list response of `page_size` rows each
+        """
+        messages = []
+        for start in range(0, len(rows), self.page_size):
+            next_start = start + self.page_size
+            messages.append({
+                "entity": entity,
+                "result": [{
+                    "method": f"{entity}.list",
+                    "status_code": 200,
+                    "result": rows[start:next_start],
+                    "total": len(rows),
+                    "next": next_start if next_start < len(rows) else None,
+                }],
+            })
+        return messages
+
+
+class BenchmarkError(Exception):
+    """
+    Phase didn't import its rows, its timings are not comparable
+    """
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper() counting queries
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def peak_rss_kb() -> int:
+    """
+    Peak resident set size of process, kilobytes on linux
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@dataclass
+class PhaseResult:
+    phase: str
+    messages: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    queries: int = 0
+
+    @property
+    def messages_per_sec(self) -> float:
+        return self.messages / self.seconds if self.seconds else 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def queries_per_message(self) -> float:
+        return self.queries / self.messages if self.messages else 0.0
+
+    def as_dict(self) -> Dict:
+        return dict(
+            asdict(self),
+            messages_per_sec=round(self.messages_per_sec, 2),
+            rows_per_sec=round(self.rows_per_sec, 2),
+            queries_per_message=round(self.queries_per_message, 2),
+        )
+
+
+@dataclass
+class BenchmarkReport:
+    params: Dict
+    phases: List[PhaseResult] = field(default_factory=list)
+    peak_rss_kb: int = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "params": self.params,
+            "phases": {result.phase: result.as_dict() for result in self.phases},
+            "peak_rss_kb": self.peak_rss_kb,
+        }
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+
+class Benchmark:
+    """
+    Feeds catalog messages to listener `process_message` phase by phase:
+    sections, properties, products and the same products again (unchanged payloads).
+
+    Everything runs in one transaction rolled back at the end unless `keep` is set.
+    Phase which didn't import all its rows raises BenchmarkError.
+
+    :param catalog: SyntheticCatalog
+    :param process_message: Callable[[Dict], None] - e.g. bitrix_sync_listener Command().process_message
+    :param keep: bool - commit imported data
+    :param report: Callable[[str], None] - progress output
+    """
+
+    def __init__(self, catalog: SyntheticCatalog, process_message: Callable[[Dict], None],
+                 keep: bool = False, report: Callable[[str], None] = print):
+        self.catalog = catalog
+        self.process_message = process_message
+        self.keep = keep
+        self.report = report
+
+    def phases(self) -> Iterable:
+        catalog = self.catalog
+        products = catalog.messages('crm.product', catalog.product_rows)
+        return (
+            ('sections', catalog.messages('crm.productsection', catalog.section_rows)),
+            ('properties', catalog.messages('crm.product.property', catalog.property_rows)),
+            ('products', products),
+            ('products_unchanged', products),
+        )
+
+    def check(self, phase: str):
+        """
+        Rows of phase are imported and linked to oscar objects
+        """
+        catalog = self.catalog
+        if phase == 'sections':
+            model, rows, linked = get_model('bitrix', 'ProductSectionBX'), catalog.section_rows, 'category'
+        elif phase == 'properties':
+            model, rows, linked = get_model('bitrix', 'ProductPropertyBX'), catalog.property_rows, 'product_attribute'
+        else:
+            model, rows, linked = get_model('bitrix', 'ProductBX'), catalog.product_rows, 'product'
+
+        queryset = model.objects.filter(bitrix_id__in=[row['ID'] for row in rows])
+        imported = queryset.count()
+        applied = queryset.exclude(**{linked: None}).count()
+
+        if imported != len(rows) or applied != len(rows):
+            raise BenchmarkError(
+                f"{phase}: {imported} of {len(rows)} {model.__name__} rows imported, {applied} linked to {linked}"
+            )
+
+    def run_phase(self, phase: str, messages: List[Dict]) -> PhaseResult:
+        result = PhaseResult(phase=phase)
+        counter = QueryCounter()
+
+        with connection.execute_wrapper(counter):
+            for message in messages:
+                started = time.perf_counter()
+                self.process_message(message)
+                result.seconds += time.perf_counter() - started
+
+                result.messages += 1
+                result.rows += sum(len(part.get('result') or []) for part in message['result'])
+
+        result.queries = counter.count
+        return result
+
+    def run(self) -> BenchmarkReport:
+        report = BenchmarkReport(params={
+            "sections": self.catalog.sections,
+            "properties": self.catalog.properties,
+            "products": self.catalog.products,
+            "properties_per_product": self.catalog.properties_per_product,
+            "values_per_property": self.catalog.values_per_property,
+            "page_size": self.catalog.page_size,
+        })
+
+        with transaction.atomic():
+            for phase, messages in self.phases():
+                result = self.run_phase(phase, messages)
+                self.check(phase)
+                report.phases.append(result)
+                self.report(
+                    f"{phase}: {result.messages} messages, {result.rows} rows in {result.seconds:.2f}s, "
+                    f"{result.messages_per_sec:.1f} msgs/sec, {result.rows_per_sec:.1f} rows/sec, "
+                    f"{result.queries_per_message:.1f} queries/msg"
+                )
+
+            if not self.keep:
+                transaction.set_rollback(True)
+
+        report.peak_rss_kb = peak_rss_kb()
+        self.report(f"peak RSS: {report.peak_rss_kb / 1024:.1f} MB")
+        return report
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """
+    Regressions of report against baseline: rows/sec lower or queries/msg higher than `tolerance` allows
+    Args:
+        report: Dict - BenchmarkReport.as_dict()
+        baseline: Dict - saved BenchmarkReport.as_dict()
+        tolerance: float - e.g. 0.2 = 20%
+
+    Returns:
+        List[str] - descriptions of regressions, empty if there are none
+    """
+    regressions = []
+    for phase, base in baseline.get('phases', {}).items():
+        current = report['phases'].get(phase)
+        if current is None:
+            continue
+
+        if current['rows_per_sec'] < base['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{phase}: {current['rows_per_sec']} rows/sec, baseline {base['rows_per_sec']}")
+        if current['queries_per_message'] > base['queries_per_message'] * (1 + tolerance):
+            regressions.append(
+                f"{phase}: {current['queries_per_message']} queries/msg, baseline {base['queries_per_message']}"
+            )
+
+    if baseline.get('peak_rss_kb') and report['peak_rss_kb'] > baseline['peak_rss_kb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {report['peak_rss_kb']} KB, baseline {baseline['peak_rss_kb']} KB")
+
+    return regressions
@@ -0,0 +1,272 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Iterable, List, Optional
+
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.amqp.amqp import get_var
+
+"""
+Import-session cache of lookups repeated by to_object()
+"""
+
+PRODUCT_CLASS_NAME = "__bitrix_product_class"
+PARTNER_CODE = "__bitrix24-bridge-partner"
+
+_local = threading.local()
+
+# cached "not found"
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded map, the least recently used keys are evicted first
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self.data[key]
+        except KeyError:
+            return default
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Drop key or all keys if key is None
+        """
+        if key is None:
+            self.data.clear()
+        else:
+            self.data.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class ImportSession:
+    """
+    Cache of bridge lookups for one import, e.g. one listener message.
+
+    Keeps bitrix_id -> ProductSectionBX (with category), bitrix_id -> ProductPropertyBX (with product_attribute),
+    bridge partner and product class. Sections and properties imported in session are put in cache
+    by their to_object(), so children of a section in the same page find its category.
+
+    Usage:
+        with ImportSession() as session:
+            for obj in objs:
+                obj.to_object()
+
+    :param maxsize: int - max cached sections and properties, BB_IMPORT_CACHE_SIZE
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        maxsize = maxsize or int(get_var('BB_IMPORT_CACHE_SIZE')() or 10000)
+
+        self.sections = LRUCache(maxsize)
+        self.properties = LRUCache(maxsize)
+        # AttributeOptionGroup id -> {option: AttributeOption id}
+        self.options = LRUCache(maxsize)
+        # property bitrix_id (ProductAttribute code) -> {bitrix value id: AttributeOption id}
+        self.option_values = LRUCache(maxsize)
+
+        self._partner = None
+        self._product_class = None
+
+    def partner(self):
+        if self._partner is None:
+            Partner = get_model('partner', 'Partner')
+            self._partner, _ = Partner.objects.get_or_create(code=PARTNER_CODE)
+        return self._partner
+
+    def product_class(self):
+        if self._product_class is None:
+            ProductClass = get_model('catalogue', 'ProductClass')
+            self._product_class, _ = ProductClass.objects.get_or_create(name=PRODUCT_CLASS_NAME)
+        return self._product_class
+
+    def load_sections(self, bitrix_ids: Iterable[Any]):
+        """
+        Fetch not cached sections in one query
+        """
+        ProductSectionBX = get_model('bitrix', 'ProductSectionBX')
+
+        missing = {str(b_id) for b_id in bitrix_ids if b_id is not None} - set(self.sections.data)
+        if not missing:
+            return
+
+        for section in ProductSectionBX.objects.select_related('category').filter(bitrix_id__in=missing):
+            self.sections.set(section.bitrix_id, section)
+            missing.discard(section.bitrix_id)
+
+        for b_id in missing:
+            self.sections.set(b_id, MISSING)
+
+    def section(self, bitrix_id: Any):
+        """
+        Returns:
+            Optional[ProductSectionBX]
+        """
+        if bitrix_id is None:
+            return None
+
+        self.load_sections([bitrix_id])
+        section = self.sections.get(str(bitrix_id), MISSING)
+        return None if section is MISSING else section
+
+    def load_properties(self, bitrix_ids: Iterable[Any]):
+        """
+        Fetch not cached properties in one query
+        """
+        ProductPropertyBX = get_model('bitrix', 'ProductPropertyBX')
+
+        missing = {str(b_id) for b_id in bitrix_ids if b_id is not None} - set(self.properties.data)
+        if not missing:
+            return
+
+        for prop in ProductPropertyBX.objects.select_related('product_attribute').filter(bitrix_id__in=missing):
+            self.properties.set(prop.bitrix_id, prop)
+            missing.discard(prop.bitrix_id)
+
+        for b_id in missing:
+            self.properties.set(b_id, MISSING)
+
+    def properties_by_ids(self, bitrix_ids: Iterable[Any]) -> List:
+        """
+        Returns:
+            List[ProductPropertyBX] - found properties
+        """
+        bitrix_ids = [str(b_id) for b_id in bitrix_ids]
+        self.load_properties(bitrix_ids)
+        props = (self.properties.get(b_id, MISSING) for b_id in bitrix_ids)
+        return [prop for prop in props if prop is not MISSING]
+
+    def load_options(self, group_ids: Iterable[int]):
+        """
+        Fetch options of not cached groups in one query
+        """
+        AttributeOption = get_model('catalogue', 'AttributeOption')
+
+        missing = {group_id for group_id in group_ids if group_id is not None} - set(self.options.data)
+        if not missing:
+            return
+
+        groups = {group_id: {} for group_id in missing}
+        for group_id, option, option_id in (
+                AttributeOption.objects.filter(group_id__in=missing).values_list('group_id', 'option', 'id')
+        ):
+            groups[group_id][option] = option_id
+
+        for group_id, options in groups.items():
+            self.options.set(group_id, options)
+
+    def option_id(self, group_id: Optional[int], option: str) -> Optional[int]:
+        """
+        Returns:
+            Optional[int] - id of AttributeOption of group by its text
+        """
+        if group_id is None:
+            return None
+        self.load_options([group_id])
+        return self.options.get(group_id, {}).get(option)
+
+    def load_option_values(self, codes: Iterable[str]):
+        """
+        Fetch value id -> option id maps of not cached list properties in one query
+        """
+        AttributeOptionBX = get_model('bitrix', 'AttributeOptionBX')
+
+        missing = {str(code) for code in codes if code is not None} - set(self.option_values.data)
+        if not missing:
+            return
+
+        maps = {code: {} for code in missing}
+        for code, value_id, option_id in (
+                AttributeOptionBX.objects
+                    .filter(prop__bitrix_id__in=missing)
+                    .values_list('prop__bitrix_id', 'value_id', 'option_id')
+        ):
+            maps[code][value_id] = option_id
+
+        for code, values in maps.items():
+            self.option_values.set(code, values)
+
+    def option_id_by_value(self, code: Optional[str], value_id: str) -> Optional[int]:
+        """
+        Returns:
+            Optional[int] - id of AttributeOption linked to bitrix value id of list property
+        """
+        if code is None:
+            return None
+        self.load_option_values([code])
+        return self.option_values.get(str(code), {}).get(str(value_id))
+
+    def add_section(self, section):
+        if section.bitrix_id is not None:
+            self.sections.set(str(section.bitrix_id), section)
+
+    def add_property(self, prop):
+        if prop.bitrix_id is not None:
+            self.properties.set(str(prop.bitrix_id), prop)
+
+    def invalidate(self):
+        self.sections.invalidate()
+        self.properties.invalidate()
+        self.options.invalidate()
+        self.option_values.invalidate()
+        self._partner = None
+        self._product_class = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'sessions', None)
+        if stack is None:
+            stack = _local.sessions = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.sessions.remove(self)
+
+
+def current_session() -> ImportSession:
+    """
+    Innermost active session of current thread, new not shared session if there is no active one
+    """
+    stack = getattr(_local, 'sessions', None)
+    return stack[-1] if stack else ImportSession()
+
+
+def has_session() -> bool:
+    """
+    Is bitrix import running in current thread
+    """
+    return bool(getattr(_local, 'sessions', None))
+
+
+@contextmanager
+def import_session(maxsize: Optional[int] = None):
+    """
+    Active session of current thread or new one for the block, so nested handlers share one cache
+    """
+    stack = getattr(_local, 'sessions', None)
+    if stack:
+        yield stack[-1]
+        return
+
+    with ImportSession(maxsize=maxsize) as session:
+        yield session
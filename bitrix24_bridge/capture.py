@@ -0,0 +1,290 @@
+import atexit
+import logging
+import threading
+import time
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.amqp.amqp import get_var
+from bitrix24_bridge.cache import PARTNER_CODE, has_session
+
+logger = logging.getLogger(__name__)
+
+"""
+Oscar -> Bitrix24 change capture by model signals, enabled by BB_CHANGE_CAPTURE
+"""
+
+# dirty kinds
+PRODUCT = 'product'
+CATEGORY = 'category'
+ATTRIBUTE = 'attribute'
+
+# bridge model of dirty kind
+BRIDGE_MODELS = {
+    PRODUCT: ('bitrix', 'ProductBX', 'product'),
+    CATEGORY: ('bitrix', 'ProductSectionBX', 'category'),
+    ATTRIBUTE: ('bitrix', 'ProductPropertyBX', 'product_attribute'),
+}
+
+# meta key of add command, pk of bridge row to link with the returned bitrix id
+ADD_META = 'bridge_id'
+
+
+def capture_enabled() -> bool:
+    return bool(get_var('BB_CHANGE_CAPTURE')())
+
+
+class ChangeCapture:
+    """
+    Buffer of changed oscar objects, exported by background thread.
+
+    Signal receivers mark ids after commit of their transaction, so rolled back changes are never sent.
+    Thread exports dirty objects `window` seconds after the first mark, by chunks of `batch_size`,
+    so bursts of edits leave as a few *_many commands.
+
+    :param window: float - seconds
+    :param batch_size: int - objects per export
+    """
+
+    def __init__(self, window: float = 2.0, batch_size: int = 200):
+        self.window = window
+        self.batch_size = batch_size
+
+        # kind -> ids of changed objects
+        self.dirty: Dict[str, Set[int]] = {kind: set() for kind in BRIDGE_MODELS}
+        # kind -> bitrix ids of deleted objects
+        self.removed: Dict[str, Set[str]] = {kind: set() for kind in BRIDGE_MODELS}
+        self.deadline: Optional[float] = None
+
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+        self.exported = 0
+
+    def mark(self, kind: str, pk: Optional[int]):
+        if pk is None:
+            return
+        with self.condition:
+            self.dirty[kind].add(pk)
+            self._schedule()
+
+    def mark_removed(self, kind: str, bitrix_ids: Iterable[str]):
+        with self.condition:
+            self.removed[kind].update(b_id for b_id in bitrix_ids if b_id)
+            self._schedule()
+
+    def _schedule(self):
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.window
+            self.condition.notify()
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='bitrix-change-capture', daemon=True)
+            self.thread.start()
+
+    def _pop(self) -> Tuple[Dict[str, Set[int]], Dict[str, Set[str]]]:
+        dirty, removed = self.dirty, self.removed
+        self.dirty = {kind: set() for kind in BRIDGE_MODELS}
+        self.removed = {kind: set() for kind in BRIDGE_MODELS}
+        self.deadline = None
+        return dirty, removed
+
+    def requeue(self, dirty: Dict[str, Set[int]], removed: Dict[str, Set[str]]):
+        """
+        Return not exported ids to buffer, they are exported again after `window`
+        """
+        with self.condition:
+            for kind in BRIDGE_MODELS:
+                self.dirty[kind].update(dirty.get(kind, ()))
+                self.removed[kind].update(removed.get(kind, ()))
+            if any(self.dirty.values()) or any(self.removed.values()):
+                self._schedule()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.deadline is None or self.deadline > time.monotonic():
+                    self.condition.wait(None if self.deadline is None else self.deadline - time.monotonic())
+                dirty, removed = self._pop()
+
+            self.export(dirty, removed)
+
+    def flush(self):
+        """
+        Export all buffered changes now
+        """
+        with self.condition:
+            dirty, removed = self._pop()
+        self.export(dirty, removed)
+
+    @staticmethod
+    def chunks(items: Iterable, size: int) -> Iterable[List]:
+        items = sorted(items)
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def export(self, dirty: Dict[str, Set[int]], removed: Dict[str, Set[str]]):
+        """
+        Ids of failed chunks and of commands not confirmed by broker are requeued
+        """
+        # ids not exported yet
+        pending = {kind: set(ids) for kind, ids in dirty.items()}
+        pending_removed = {kind: set(ids) for kind, ids in removed.items()}
+        # ids of exported chunks with not delivered commands
+        failed = {kind: set() for kind in BRIDGE_MODELS}
+        failed_removed = {kind: set() for kind in BRIDGE_MODELS}
+
+        try:
+            # sections and properties before products
+            for kind in (CATEGORY, ATTRIBUTE, PRODUCT):
+                app_label, model_name, field = BRIDGE_MODELS[kind]
+                model = get_model(app_label, model_name)
+
+                for ids in self.chunks(dirty[kind], self.batch_size):
+                    failed[kind].update(self.export_objects(kind, model, ids))
+                    pending[kind].difference_update(ids)
+
+                for bitrix_ids in self.chunks(removed[kind], self.batch_size):
+                    result = model.remove_many([model(bitrix_id=b_id) for b_id in bitrix_ids])
+                    failed_removed[kind].update(bitrix_ids[index] for index, command in result.failed)
+                    self.exported += result.sent
+                    pending_removed[kind].difference_update(bitrix_ids)
+        except Exception:
+            logger.exception("Export of captured changes failed, changes are requeued")
+        finally:
+            close_old_connections()
+
+        for kind in BRIDGE_MODELS:
+            pending[kind].update(failed[kind])
+            pending_removed[kind].update(failed_removed[kind])
+        self.requeue(pending, pending_removed)
+
+    def export_objects(self, kind: str, model, ids: List[int]) -> Set[int]:
+        """
+        Objects linked to bitrix are updated, not linked ones are added,
+        bitrix id of added object is saved by `add` response handler
+        Returns:
+            Set[int] - ids of objects with not delivered commands
+        """
+        if kind == PRODUCT:
+            objects = get_model('catalogue', 'Product').objects.filter(id__in=ids)
+        elif kind == CATEGORY:
+            objects = get_model('catalogue', 'Category').objects.filter(id__in=ids)
+        else:
+            objects = get_model('catalogue', 'ProductAttribute').objects.filter(id__in=ids)
+
+        app_label, model_name, field = BRIDGE_MODELS[kind]
+        sync_objs = model.from_objects(objects)
+        linked = [obj for obj in sync_objs if obj.bitrix_id is not None]
+        unlinked = [obj for obj in sync_objs if obj.bitrix_id is None]
+
+        failed = set()
+        if linked:
+            result = model.update_many(linked)
+            failed.update(getattr(linked[index], f'{field}_id') for index, command in result.failed)
+            self.exported += result.sent
+        if unlinked:
+            result = model.send_commands(obj.add_command(meta={ADD_META: obj.pk}) for obj in unlinked)
+            failed.update(getattr(unlinked[index], f'{field}_id') for index, command in result.failed)
+            self.exported += result.sent
+
+        return failed
+
+
+_capture: Optional[ChangeCapture] = None
+_capture_lock = threading.Lock()
+
+
+def get_capture() -> ChangeCapture:
+    global _capture
+
+    if _capture is None:
+        with _capture_lock:
+            if _capture is None:
+                _capture = ChangeCapture(
+                    window=float(get_var('BB_CHANGE_CAPTURE_WINDOW')() or 2.0),
+                    batch_size=int(get_var('BB_CHANGE_CAPTURE_BATCH_SIZE')() or 200),
+                )
+                atexit.register(_capture.flush)
+
+    return _capture
+
+
+_partner_id: Optional[int] = None
+
+
+def bridge_partner_id() -> Optional[int]:
+    global _partner_id
+
+    if _partner_id is None:
+        Partner = get_model('partner', 'Partner')
+        _partner_id = Partner.objects.filter(code=PARTNER_CODE).values_list('id', flat=True).first()
+    return _partner_id
+
+
+def ignored(kwargs: Dict) -> bool:
+    """
+    Fixtures loading and changes made by bitrix import itself
+    """
+    return kwargs.get('raw', False) or has_session()
+
+
+def on_save(kind: str, sender, instance, **kwargs):
+    if ignored(kwargs):
+        return
+    transaction.on_commit(partial(get_capture().mark, kind, instance.pk))
+
+
+def on_stockrecord_save(sender, instance, **kwargs):
+    if ignored(kwargs) or instance.partner_id != bridge_partner_id():
+        return
+    transaction.on_commit(partial(get_capture().mark, PRODUCT, instance.product_id))
+
+
+def on_delete(kind: str, sender, instance, **kwargs):
+    """
+    pre_delete: bridge rows are deleted by cascade, bitrix ids are taken before
+    """
+    if ignored(kwargs):
+        return
+
+    app_label, model_name, field = BRIDGE_MODELS[kind]
+    bitrix_ids = list(
+        get_model(app_label, model_name).objects
+            .filter(**{field: instance})
+            .exclude(bitrix_id=None)
+            .values_list('bitrix_id', flat=True)
+    )
+    if bitrix_ids:
+        transaction.on_commit(partial(get_capture().mark_removed, kind, bitrix_ids))
+
+
+def on_stockrecord_delete(sender, instance, **kwargs):
+    # price is removed, product is exported again
+    on_stockrecord_save(sender, instance, **kwargs)
+
+
+def connect():
+    """
+    Connect signal receivers, called in AppConfig.ready() if BB_CHANGE_CAPTURE is set
+    """
+    senders = {
+        PRODUCT: get_model('catalogue', 'Product'),
+        CATEGORY: get_model('catalogue', 'Category'),
+        ATTRIBUTE: get_model('catalogue', 'ProductAttribute'),
+    }
+    for kind, sender in senders.items():
+        post_save.connect(partial(on_save, kind), sender=sender, weak=False,
+                          dispatch_uid=f'bitrix_capture_save_{kind}')
+        pre_delete.connect(partial(on_delete, kind), sender=sender, weak=False,
+                           dispatch_uid=f'bitrix_capture_delete_{kind}')
+
+    StockRecord = get_model('partner', 'StockRecord')
+    post_save.connect(on_stockrecord_save, sender=StockRecord, weak=False,
+                      dispatch_uid='bitrix_capture_save_stockrecord')
+    post_delete.connect(on_stockrecord_delete, sender=StockRecord, weak=False,
+                        dispatch_uid='bitrix_capture_delete_stockrecord')
@@ -0,0 +1,295 @@
+from collections import Counter
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from oscar.core.loading import get_model
+from oscar.core.utils import slugify
+
+from bitrix24_bridge.cache import current_session
+
+"""
+Category tree importer of ProductSectionBX
+"""
+
+
+class CategoryTreeImporter:
+    """
+    Reconcile oscar Category tree with imported ProductSectionBX rows in one transaction.
+
+    Only imported sections, their ancestors and their already imported children are loaded.
+    Sections are sorted topologically by section_id (parents first, sections of cycles or with unknown parent
+    are roots), then compared with the existing tree:
+        - subtrees of sections without category are created by treebeard load_bulk(), one call per parent
+        - categories with other parent are moved, only these ones
+        - names and slugs of renamed categories are written by one bulk UPDATE at the end
+    So order of imported pages doesn't matter: a child imported before its parent is moved under it later.
+
+    Moves are decided by paths loaded before any change (treebeard moves whole subtrees, so parent links
+    of other categories stay as loaded), paths are reloaded once at the end.
+
+    Usage:
+        stats = CategoryTreeImporter().run(sections)
+    """
+
+    def __init__(self):
+        self.Category = get_model('catalogue', 'Category')
+        self.stats: Counter = Counter()
+
+        # bitrix_id -> section
+        self.sections: Dict[str, 'ProductSectionBX'] = {}
+        # bitrix_id -> parent bitrix_id in desired tree
+        self.parents: Dict[str, Optional[str]] = {}
+        # category id -> path before import, reloaded at the end
+        self.paths: Dict[int, str] = {}
+        # category ids of moved and renamed categories
+        self.touched = set()
+
+    def load(self, sections: List['ProductSectionBX']):
+        """
+        Imported sections, their children waiting for them and their ancestors, one query per tree level
+        """
+        ProductSectionBX = get_model('bitrix', 'ProductSectionBX')
+        queryset = ProductSectionBX.objects.select_related('category').exclude(bitrix_id=None)
+
+        # imported objects get their categories
+        imported = {section.bitrix_id: section for section in sections if section.bitrix_id is not None}
+
+        self.sections = {
+            section.bitrix_id: section
+            for section in queryset.filter(section_id__in=imported.keys()).exclude(bitrix_id__in=imported.keys())
+        }
+        self.sections.update(imported)
+
+        wanted = {
+            section.section_id for section in self.sections.values()
+            if section.section_id and section.section_id not in self.sections
+        }
+        while wanted:
+            found = {section.bitrix_id: section for section in queryset.filter(bitrix_id__in=wanted)}
+            self.sections.update(found)
+            wanted = {
+                section.section_id for section in found.values()
+                if section.section_id and section.section_id not in self.sections
+            }
+
+        for b_id, section in self.sections.items():
+            parent = section.section_id
+            self.parents[b_id] = parent if parent in self.sections and parent != b_id else None
+
+        self.break_cycles()
+        self.reload_paths()
+
+    def break_cycles(self):
+        """
+        Make roots of sections which are ancestors of themselves
+        """
+        done = set()
+        for b_id in self.sections:
+            chain, node = [], b_id
+            while node is not None and node not in done:
+                if node in chain:
+                    self.parents[node] = None
+                    break
+                chain.append(node)
+                node = self.parents[node]
+            done.update(chain)
+
+    def order(self) -> List[str]:
+        """
+        bitrix_ids of sections, parents first
+        """
+        depth: Dict[str, int] = {}
+
+        def get_depth(b_id: str) -> int:
+            chain = []
+            while b_id is not None and b_id not in depth:
+                chain.append(b_id)
+                b_id = self.parents[b_id]
+            level = depth[b_id] if b_id is not None else -1
+            for node in reversed(chain):
+                level += 1
+                depth[node] = level
+            return level
+
+        for b_id in self.sections:
+            get_depth(b_id)
+
+        return sorted(self.sections, key=lambda b_id: (depth[b_id], b_id))
+
+    def reload_paths(self):
+        ids = [section.category_id for section in self.sections.values() if section.category_id]
+        self.paths = dict(self.Category.objects.filter(id__in=ids).values_list('id', 'path'))
+
+    def parent_path(self, path: str) -> str:
+        return path[:-self.Category.steplen]
+
+    def desired_parent_path(self, b_id: str) -> str:
+        parent = self.parents[b_id]
+        if parent is None:
+            return ''
+        return self.paths.get(self.sections[parent].category_id, '')
+
+    def new_subtree(self, b_id: str, children: Dict[Optional[str], List[str]]) -> Dict:
+        """
+        load_bulk() structure of section and its descendants without categories
+        """
+        section = self.sections[b_id]
+        return {
+            'data': {'name': section.name, 'slug': slugify(section.name)},
+            'children': [
+                self.new_subtree(child, children)
+                for child in children.get(b_id, [])
+                if not self.sections[child].category_id
+            ],
+        }
+
+    def create(self, parent: Optional[str], b_ids: List[str],
+               children: Dict[Optional[str], List[str]]) -> List['ProductSectionBX']:
+        """
+        Create categories of sections and their new descendants under one parent by one load_bulk(),
+        ids of load_bulk() are in preorder
+        Returns:
+            List[ProductSectionBX] - linked sections
+        """
+        parent_category = (
+            self.Category.objects.get(id=self.sections[parent].category_id) if parent is not None else None
+        )
+
+        structure = [self.new_subtree(b_id, children) for b_id in b_ids]
+        ids = self.Category.load_bulk(structure, parent=parent_category)
+
+        preorder, stack = [], list(reversed(b_ids))
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            stack.extend(reversed([
+                child for child in children.get(node, [])
+                if not self.sections[child].category_id
+            ]))
+
+        for node, category_id in zip(preorder, ids):
+            self.sections[node].category_id = category_id
+
+        self.stats['created'] += len(ids)
+
+        return [self.sections[node] for node in preorder]
+
+    def move(self, b_id: str):
+        section = self.sections[b_id]
+        parent = self.parents[b_id]
+
+        # failed move rolls back the whole import, the message is nacked by listener
+        node = self.Category.objects.get(id=section.category_id)
+        if parent is None:
+            node.move(self.Category.get_last_root_node(), 'last-sibling')
+        else:
+            node.move(self.Category.objects.get(id=self.sections[parent].category_id), 'last-child')
+
+        self.touched.add(section.category_id)
+        self.stats['moved'] += 1
+
+    def rename(self):
+        categories = self.Category.objects.filter(
+            id__in=[section.category_id for section in self.sections.values() if section.category_id]
+        ).only('id', 'name', 'slug')
+
+        names = {section.category_id: section.name for section in self.sections.values() if section.category_id}
+
+        renamed = []
+        for category in categories:
+            name = names[category.id]
+            if category.name != name:
+                category.name = name
+                category.slug = slugify(name)
+                renamed.append(category)
+                self.touched.add(category.id)
+
+        if renamed:
+            self.Category.objects.bulk_update(renamed, ['name', 'slug'])
+        self.stats['renamed'] += len(renamed)
+
+    def clear_url_cache(self):
+        """
+        Full slugs of touched categories and their descendants are cached by oscar
+        """
+        if not self.touched:
+            return
+
+        paths = [self.paths[category_id] for category_id in self.touched if category_id in self.paths]
+        ids = set(self.touched)
+        for path in paths:
+            ids.update(self.Category.objects.filter(path__startswith=path).values_list('id', flat=True))
+
+        languages = [code for code, _ in getattr(settings, 'LANGUAGES', [])] or [settings.LANGUAGE_CODE]
+        cache.delete_many([f'CATEGORY_URL_{language}_{category_id}' for language in languages for category_id in ids])
+
+    def run(self, sections: List['ProductSectionBX']) -> Counter:
+        """
+        Args:
+            sections: List[ProductSectionBX] - imported sections, they get their categories
+
+        Returns:
+            Counter - created, moved and renamed categories
+        """
+        ProductSectionBX = get_model('bitrix', 'ProductSectionBX')
+
+        with transaction.atomic():
+            # one tree import at a time
+            list(self.Category.objects.select_for_update().filter(depth=1).values_list('id'))
+
+            self.load(sections)
+
+            order = self.order()
+            children: Dict[Optional[str], List[str]] = {}
+            for b_id in order:
+                children.setdefault(self.parents[b_id], []).append(b_id)
+
+            # parent bitrix_id -> sections without category, created under it
+            new: Dict[Optional[str], List[str]] = {}
+            moved = []
+            for b_id in order:
+                section = self.sections[b_id]
+                parent = self.parents[b_id]
+
+                if not section.category_id:
+                    # created with subtree of parent otherwise
+                    if parent is None or self.sections[parent].category_id:
+                        new.setdefault(parent, []).append(b_id)
+                    continue
+
+                current = self.paths.get(section.category_id)
+                if current is None:
+                    continue
+                if parent is not None and not self.sections[parent].category_id:
+                    # parent is created now
+                    moved.append(b_id)
+                elif self.parent_path(current) != self.desired_parent_path(b_id):
+                    moved.append(b_id)
+
+            linked = []
+            for parent, b_ids in new.items():
+                linked.extend(self.create(parent, b_ids, children))
+
+            # parents first
+            for b_id in moved:
+                self.move(b_id)
+
+            if linked:
+                ProductSectionBX.objects.bulk_update(linked, ['category'])
+
+            self.rename()
+            self.reload_paths()
+
+        self.clear_url_cache()
+
+        categories = self.Category.objects.in_bulk(
+            [section.category_id for section in sections if section.category_id]
+        )
+        session = current_session()
+        for section in sections:
+            section.category = categories.get(section.category_id)
+            session.add_section(section)
+
+        return self.stats
@@ -0,0 +1,172 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from bitrix24_bridge.amqp.amqp import get_var
+
+"""
+Debounce repeated update/delete commands of the same entity object
+"""
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCED_METHODS = {'update', 'delete'}
+
+
+def command_key(command: Dict) -> Optional[Tuple[str, str]]:
+    """
+    (entity, bitrix_id) of update/delete command, None for other commands
+    """
+    entity, _, method = (command.get('method') or '').rpartition('.')
+    bid = (command.get('params') or {}).get('id')
+
+    if method not in DEBOUNCED_METHODS or bid is None:
+        return None
+
+    return entity, str(bid)
+
+
+def merge_commands(pending: Dict, command: Dict) -> Dict:
+    """
+    Merge next command into pending one:
+        update + update -> update with fields of both, last value wins
+        update + delete -> delete
+        delete + any -> delete
+    """
+    pending_method = pending['method'].rsplit('.', 1)[-1]
+    method = command['method'].rsplit('.', 1)[-1]
+
+    if pending_method == 'delete':
+        return pending
+    if method == 'delete':
+        return command
+
+    params = dict(pending.get('params') or {}, **(command.get('params') or {}))
+    params['fields'] = dict(
+        (pending.get('params') or {}).get('fields') or {},
+        **((command.get('params') or {}).get('fields') or {})
+    )
+    return dict(command, params=params)
+
+
+class UpdateDebouncer:
+    """
+    Outbound buffer of update/delete commands keyed by (entity, bitrix_id).
+
+    Commands of the same object received within `window` seconds after the first one
+    are merged into one command with final field values, update followed by delete is dropped.
+    Background thread sends due commands with `sender`, commands failed to send are logged
+    and counted in `failed`.
+
+    :param sender: Callable[[Dict], Any] - publish one command
+    :param window: float - seconds
+    """
+
+    def __init__(self, sender: Callable[[Dict], object], window: float):
+        self.sender = sender
+        self.window = window
+
+        # key -> (deadline, command), ordered by first arrival
+        self.pending: 'OrderedDict[Tuple[str, str], Tuple[float, Dict]]' = OrderedDict()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+        self.received = 0
+        self.sent = 0
+        self.failed = 0
+
+    def push(self, command: Dict) -> bool:
+        """
+        Buffer command
+        Returns:
+            bool - False if command can't be debounced and must be sent as is
+        """
+        key = command_key(command)
+        if key is None:
+            return False
+
+        with self.condition:
+            self.received += 1
+            if key in self.pending:
+                deadline, pending = self.pending[key]
+                self.pending[key] = (deadline, merge_commands(pending, command))
+            else:
+                self.pending[key] = (time.monotonic() + self.window, command)
+                self.condition.notify()
+
+        self._start()
+        return True
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.condition:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='bitrix-debouncer', daemon=True)
+                    self.thread.start()
+
+    def _pop_due(self, now: Optional[float] = None):
+        """
+        Pop commands with passed deadline, all commands if now is None
+        """
+        due = []
+        while self.pending:
+            key, (deadline, command) = next(iter(self.pending.items()))
+            if now is not None and deadline > now:
+                break
+            self.pending.popitem(last=False)
+            due.append(command)
+        return due
+
+    def _send(self, commands):
+        for command in commands:
+            try:
+                self.sender(command)
+                self.sent += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"debounced {command.get('method')} was not sent: {command}")
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.pending:
+                    deadline = next(iter(self.pending.values()))[0]
+                    self.condition.wait(max(0.0, deadline - time.monotonic()))
+                else:
+                    self.condition.wait()
+                due = self._pop_due(time.monotonic())
+
+            self._send(due)
+
+    def flush(self):
+        """
+        Send all buffered commands now
+        """
+        with self.condition:
+            due = self._pop_due()
+        self._send(due)
+
+    def __len__(self):
+        return len(self.pending)
+
+
+_debouncer: Optional[UpdateDebouncer] = None
+_debouncer_lock = threading.Lock()
+
+
+def get_debouncer(sender: Callable[[Dict], object]) -> Optional[UpdateDebouncer]:
+    """
+    Process-wide debouncer, None if BB_DEBOUNCE_WINDOW is not set
+    """
+    global _debouncer
+
+    if _debouncer is None and get_var('BB_DEBOUNCE_WINDOW')():
+        with _debouncer_lock:
+            if _debouncer is None:
+                _debouncer = UpdateDebouncer(sender=sender, window=float(get_var('BB_DEBOUNCE_WINDOW')()))
+                atexit.register(_debouncer.flush)
+
+    return _debouncer
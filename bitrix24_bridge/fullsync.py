@@ -0,0 +1,168 @@
+import time
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from bitrix24_bridge.models import ProductBX, ProductPropertyBX, ProductSectionBX, SyncPage, SyncRun
+
+"""
+Full resync: walk all pages of entity lists in parallel, see `bitrix_full_sync` command
+"""
+
+FULL_SYNC_ACTION = 'full_sync'
+
+# rows per page of bitrix *.list methods
+PAGE_SIZE = 50
+
+# dependency order: products need sections and properties
+ENTITIES = (ProductSectionBX, ProductPropertyBX, ProductBX)
+
+
+class FullSyncError(Exception):
+    pass
+
+
+def page_params(model, start: int) -> Dict:
+    """
+    list params of page, ordered by ID so offsets are stable
+    """
+    params = {
+        "order": {"ID": "ASC"},
+        "start": start,
+    }
+    if model.list_select:
+        params["select"] = model.list_select
+    return params
+
+
+class FullSync:
+    """
+    Requests pages of entity list and waits for bitrix_sync_listener to apply them.
+
+    First page gives `total`, then pages of the rest offsets are requested with at most `concurrency`
+    unapplied pages at a time. Pages are SyncPage rows of the run, so interrupted run is resumed
+    from not applied pages. Pages without response for `page_timeout` seconds are requested again.
+
+    :param run: SyncRun
+    :param concurrency: int - max requested and not applied pages
+    :param page_timeout: float - seconds
+    :param retries: int - max requests of one page
+    :param interval: float - seconds between progress checks
+    :param report: Callable[[str], None] - progress output
+    """
+
+    def __init__(self, run: SyncRun, concurrency: int = 8, page_timeout: float = 300, retries: int = 3,
+                 interval: float = 1.0, report: Callable[[str], None] = print):
+        self.run = run
+        self.concurrency = max(1, concurrency)
+        self.page_timeout = page_timeout
+        self.retries = retries
+        self.interval = interval
+        self.report = report
+
+    def request(self, model, pages: Iterable[SyncPage]):
+        now = timezone.now()
+        for page in pages:
+            model().list(
+                params=page_params(model, page.start),
+                action=FULL_SYNC_ACTION,
+                meta={"full_sync": {"run": self.run.id, "page": page.id}},
+            )
+            SyncPage.objects.filter(id=page.id).exclude(status=SyncPage.DONE).update(
+                status=SyncPage.SENT, sent=now, attempts=page.attempts + 1
+            )
+
+    def plan(self, model, total: int):
+        """
+        Pages of all offsets after the first one
+        """
+        SyncPage.objects.bulk_create(
+            [
+                SyncPage(run=self.run, entity=model.entity, start=start)
+                for start in range(PAGE_SIZE, total, PAGE_SIZE)
+            ],
+            ignore_conflicts=True
+        )
+
+    def sync_entity(self, model, concurrency: Optional[int] = None):
+        """
+        Request all pages of model entity and wait until they are applied
+        """
+        concurrency = concurrency or self.concurrency
+        pages = SyncPage.objects.filter(run=self.run, entity=model.entity)
+
+        first, _ = SyncPage.objects.get_or_create(run=self.run, entity=model.entity, start=0)
+        planned = False
+
+        started = time.monotonic()
+        rows_before = pages.filter(status=SyncPage.DONE).aggregate(rows=Sum('rows'))['rows'] or 0
+
+        while True:
+            first.refresh_from_db()
+
+            if first.status == SyncPage.DONE and not planned:
+                if first.total is None and first.rows == PAGE_SIZE:
+                    raise FullSyncError(f"{model.entity} list response has no total, pages can't be planned")
+                self.plan(model, first.total or 0)
+                planned = True
+
+            counts = dict(pages.order_by().values_list('status').annotate(count=Count('id')))
+            if planned and counts.get(SyncPage.DONE, 0) == sum(counts.values()):
+                self.progress(model, first.total, started, rows_before)
+                break
+
+            exhausted = pages.filter(attempts__gte=self.retries).exclude(status=SyncPage.DONE)
+            expired = timezone.now() - timedelta(seconds=self.page_timeout)
+            exhausted = exhausted.filter(Q(status=SyncPage.FAILED) | Q(status=SyncPage.SENT, sent__lt=expired))
+            if exhausted.exists():
+                raise FullSyncError(
+                    f"{model.entity} pages {list(exhausted.values_list('start', flat=True))} "
+                    f"are not applied after {self.retries} requests"
+                )
+
+            inflight = pages.filter(status=SyncPage.SENT, sent__gte=expired).count()
+            free = concurrency - inflight
+            if free > 0:
+                due: List[SyncPage] = list(
+                    pages
+                        .filter(Q(status__in=(SyncPage.PENDING, SyncPage.FAILED)) |
+                                Q(status=SyncPage.SENT, sent__lt=expired))
+                        .order_by('start')[:free]
+                )
+                self.request(model, due)
+
+            self.progress(model, first.total, started, rows_before)
+            time.sleep(self.interval)
+
+    def progress(self, model, total: Optional[int], started: float, rows_before: int):
+        rows = SyncPage.objects.filter(
+            run=self.run, entity=model.entity, status=SyncPage.DONE
+        ).aggregate(rows=Sum('rows'))['rows'] or 0
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rate = (rows - rows_before) / elapsed
+
+        if total is None:
+            self.report(f"{model.entity}: waiting for first page")
+            return
+
+        left = max(total - rows, 0)
+        eta = f"{left / rate:.0f}s" if rate > 0 else "-"
+        self.report(f"{model.entity}: {rows}/{total} rows, {rate:.1f} rows/sec, ETA {eta}")
+
+    def sync(self, models: Iterable = ENTITIES, concurrency: Optional[Dict[str, int]] = None):
+        """
+        Sync entities one after another in dependency order
+        Args:
+            models: Iterable[BitrixSyncMixin subclass]
+            concurrency: Optional[Dict[str, int]] - concurrency by entity, e.g. {'crm.productsection': 1}
+        """
+        concurrency = concurrency or {}
+
+        for model in models:
+            self.sync_entity(model, concurrency=concurrency.get(model.entity))
+
+        self.run.finished = timezone.now()
+        self.run.save(update_fields=['finished'])
@@ -1,3 +1,4 @@
+from .batch import BatchHandler
 from .product import ProductHandler
 from .productproperty import ProductPropertyHandler
 from .productsection import ProductSectionHandler
@@ -1,5 +1,23 @@
-from pprint import pprint
-from typing import Dict, List
+import logging
+from typing import Dict, List, Optional
+
+from django.db import transaction
+
+from bitrix24_bridge.cache import import_session
+from bitrix24_bridge.capture import ADD_META
+from bitrix24_bridge.incremental import request_next
+from bitrix24_bridge.models import SyncCursor, SyncPage
+
+logger = logging.getLogger(__name__)
+
+
+def log_failed(data: Dict, method: Optional[str] = None):
+    """
+    Log bitrix response with error status, full payload only at debug level
+    """
+    method = method or data.get('method')
+    logger.warning(f"{method} failed with status {data.get('status_code')}: {data.get('error')}")
+    logger.debug(f"{method} failed response: {data}")
 
 
 class BaseModelHandler:
@@ -9,29 +27,76 @@ class BaseModelHandler:
     def list(self, data: Dict):
         result: List[Dict] = data.get('result')
 
+        meta: Dict = data.get('meta') or {}
+        cursor: Optional[Dict] = meta.get('cursor')
+        page: Optional[Dict] = meta.get('full_sync')
+
         if data.get('status_code') != 200:
-            print(data)
+            log_failed(data)
+            if page is not None:
+                SyncPage.fail(page['page'])
             return
 
-        for part in result:
-            sync_obj = self.model.update_or_create_cls(part)
-            oscar_obj = sync_obj.to_object()
+        if cursor is None and page is None:
+            self.apply_page(result)
+            return
+
+        # page of incremental sync or full resync, its progress is committed with applied data
+        with transaction.atomic():
+            sync_objs = self.apply_page(result)
+            if cursor is not None:
+                SyncCursor.advance(cursor['entity'], sync_objs, field=self.model.cursor_field.lower())
+            if page is not None:
+                SyncPage.complete(page['page'], rows=len(result or []), total=data.get('total'))
+
+        if cursor is not None:
+            request_next(self.model, cursor, sync_objs, data.get('next'))
+
+    def apply_page(self, result: List[Dict]) -> List:
+        sync_objs = self.model.bulk_update_or_create_cls(result)
+        self.prepare(sync_objs)
+
+        self.model.apply_many(sync_objs)
+
+        return sync_objs
+
+    def prepare(self, sync_objs: List):
+        """
+        Load lookups of the page into import session before to_object() calls
+        """
+        pass
 
     def get(self, data: Dict):
         result: Dict = data.get('result')
 
         if data.get('status_code') != 200:
-            print(data)
+            log_failed(data)
             return
 
         sync_obj = self.model.update_or_create_cls(result)
-        oscar_obj = sync_obj.to_object()
+        sync_obj.apply()
+
+    def add(self, data: Dict):
+        """
+        Link bridge row of exported object with bitrix id returned by *.add, see ChangeCapture.export_objects()
+        """
+        meta: Dict = data.get('meta') or {}
+        bridge_id = meta.get(ADD_META)
+
+        if data.get('status_code') != 200:
+            log_failed(data)
+            return
+
+        if bridge_id is None or not data.get('result'):
+            return
+
+        self.model.objects.filter(pk=bridge_id, bitrix_id=None).update(bitrix_id=str(data.get('result')))
 
     def update(self, data: Dict):
         pass
 
     def default(self, data: Dict):
-        pprint(data)
+        logger.debug(f"No handler of {data.get('method')}: {data}")
 
     def dispatch(self, data: Dict):
         method = data.get('method', 'default')
@@ -42,8 +107,10 @@ class BaseModelHandler:
 
         try:
             handler(data)
-        except Exception as e:
-            print(e)
+        except Exception:
+            # message is nacked by listener: requeued once, then rejected
+            logger.exception(f"{self.__class__.__name__}.{method} failed")
+            raise
 
     def handle(self, data: Dict, *args, **kwargs):
         """
@@ -56,8 +123,9 @@ class BaseModelHandler:
         """
         result: List[Dict] = data.get('result')
 
-        for part in result:
-            self.dispatch(part)
+        with import_session():
+            for part in result:
+                self.dispatch(part)
 
     def __call__(self, data: Dict, *args, **kwargs):
         return self.handle(data, *args, **kwargs)
@@ -0,0 +1,55 @@
+import logging
+from typing import Callable, Dict, List
+
+from bitrix24_bridge.batch import unpack_results
+from bitrix24_bridge.handlers.base import BaseModelHandler, log_failed
+
+logger = logging.getLogger(__name__)
+
+
+class BatchHandler(BaseModelHandler):
+    """
+    Fan out results of Bitrix24 `batch` command (see bitrix24_bridge.batch.pack_commands)
+    to handlers of batched commands entities
+
+    A part failed while other parts are applied is logged and counted in `failed`,
+    the batch is not redelivered then. Batch without applied parts is raised to the listener.
+
+    :param get_handler: Callable[[str], Callable] - handler by entity, e.g. 'crm.product'
+    """
+
+    def __init__(self, get_handler: Callable[[str], Callable]):
+        self.get_handler = get_handler
+        # count of failed parts of acknowledged batches
+        self.failed = 0
+
+    def batch(self, data: Dict):
+        if data.get('status_code') != 200:
+            log_failed(data, method='batch')
+            return
+
+        parts: List[Dict] = unpack_results(data)
+
+        applied, errors = 0, []
+        for part in parts:
+            entity = part.get('method', 'default').rsplit('.', 1)[0]
+            handler = self.get_handler(entity)
+
+            try:
+                handler({"entity": entity, "result": [part]})
+            except Exception as e:
+                errors.append(e)
+            else:
+                applied += 1
+
+        if not errors:
+            return
+
+        # nothing is applied, the batch is requeued once, then rejected
+        if not applied:
+            raise errors[0]
+
+        # applied parts (e.g. links of added objects) must not run again, so the batch is acknowledged
+        # and failed parts are left to the next sync
+        self.failed += len(errors)
+        logger.warning(f"batch: {len(errors)} of {len(parts)} parts failed, they are not retried")
@@ -0,0 +1,92 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.utils import parse_datetime
+
+"""
+Incremental sync: list only records changed since SyncCursor watermark
+"""
+
+INCREMENTAL_ACTION = 'incremental'
+
+
+def changes_params(field: str, since: Optional[datetime] = None, start: Optional[int] = None,
+                   select: Optional[List[str]] = None) -> Dict:
+    """
+    list params of records with `field` >= since, oldest first
+
+    `>=` instead of `>` keeps records changed in the same second as the watermark,
+    already applied ones are skipped by payload hash.
+    """
+    params = {
+        "order": {field: "ASC", "ID": "ASC"},
+    }
+    if select:
+        params["select"] = select
+    if since is not None:
+        params["filter"] = {f">={field}": since.isoformat()}
+    if start:
+        params["start"] = start
+    return params
+
+
+def request_changes(model, since: Optional[datetime] = None, start: Optional[int] = None):
+    """
+    Send list command of model records changed since watermark
+    Args:
+        model: BitrixSyncMixin subclass with `cursor_field`, e.g. ProductBX
+        since: Optional[datetime] - watermark, SyncCursor of model entity if None
+        start: Optional[int] - offset in records with the same watermark
+
+    Returns:
+        result of model.list()
+    """
+    if since is None and start is None:
+        SyncCursor = get_model('bitrix', 'SyncCursor')
+        cursor = SyncCursor.objects.filter(entity=model.entity).first()
+        since = cursor.timestamp if cursor else None
+
+    meta = {
+        "cursor": {
+            "entity": model.entity,
+            "since": since.isoformat() if since else None,
+            "start": start,
+        }
+    }
+
+    return model().list(
+        params=changes_params(model.cursor_field, since, start, select=model.list_select),
+        action=INCREMENTAL_ACTION,
+        meta=meta,
+    )
+
+
+def request_next(model, cursor_meta: Dict, objs: List, next_start: Optional[int]):
+    """
+    Continue incremental list after applied page.
+
+    Next page starts from the new watermark, so records moved to the end by changes during sync
+    are not skipped as with plain offsets. If the whole page has the watermark of request
+    (more records changed in one second than page size), offset `next_start` is used instead.
+    Args:
+        model: BitrixSyncMixin subclass
+        cursor_meta: Dict - meta["cursor"] of applied page
+        objs: List[BitrixSyncMixin] - applied page
+        next_start: Optional[int] - `next` of bitrix response, None if it is the last page
+    """
+    if not next_start:
+        return None
+
+    field = model.cursor_field.lower()
+    since = parse_datetime(cursor_meta.get('since'))
+    newest = max(
+        (getattr(obj, field) for obj in objs if isinstance(getattr(obj, field, None), datetime)),
+        default=None
+    )
+
+    if newest is None or (since is not None and newest <= since):
+        return request_changes(model, since=since, start=next_start)
+
+    return request_changes(model, since=newest)
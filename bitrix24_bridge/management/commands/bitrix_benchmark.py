@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Benchmark listener import of synthetic sections, properties and products, use a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sections', type=int, default=50)
+        parser.add_argument('--properties', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--properties-per-product', type=int, default=5)
+        parser.add_argument('--values-per-property', type=int, default=10,
+                            help='Values of list properties')
+        parser.add_argument('--page-size', type=int, default=50,
+                            help='Rows per list message')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed of generated catalog')
+        parser.add_argument('--output', default='bitrix_benchmark.json',
+                            help='File for results')
+        parser.add_argument('--baseline', default=None,
+                            help='Results of previous run, fail on regression')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed regression against baseline, 0.2 = 20%%')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit imported data instead of rollback')
+
+    def handle(self, *args, **options):
+        try:
+            from bitrix24_bridge.benchmark import Benchmark, BenchmarkError, SyntheticCatalog, compare
+        except ImportError as e:
+            raise CommandError(f"{e}, install bitrix24-bridge-oscar[benchmark]")
+
+        from bitrix24_bridge.management.commands.bitrix_sync_listener import Command as ListenerCommand
+
+        catalog = SyntheticCatalog(
+            sections=options['sections'],
+            properties=options['properties'],
+            products=options['products'],
+            properties_per_product=options['properties_per_product'],
+            values_per_property=options['values_per_property'],
+            page_size=options['page_size'],
+            seed=options['seed'],
+        )
+
+        benchmark = Benchmark(
+            catalog=catalog,
+            process_message=ListenerCommand().process_message,
+            keep=options['keep'],
+            report=self.stdout.write,
+        )
+        try:
+            report = benchmark.run()
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        report.save(options['output'])
+        self.stdout.write(f"Results saved to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+            regressions = compare(report.as_dict(), baseline, tolerance=options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against baseline:\n" + "\n".join(regressions))
+            self.stdout.write("No regressions against baseline")
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bitrix24_bridge.fullsync import ENTITIES, FullSync, FullSyncError
+from bitrix24_bridge.models import ProductSectionBX, SyncRun
+
+
+class Command(BaseCommand):
+    help = 'Reload sections, properties and products from Bitrix24, pages are applied by bitrix_sync_listener'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Max requested and not applied pages')
+        parser.add_argument('--page-timeout', type=float, default=300,
+                            help='Seconds to wait for page before requesting it again')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Max requests of one page')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between progress reports')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the last not finished run')
+        parser.add_argument('--run', type=int, default=None,
+                            help='Continue run with id')
+
+    def handle(self, *args, **options):
+        if options['run'] is not None:
+            run = SyncRun.objects.filter(id=options['run']).first()
+            if run is None:
+                raise CommandError(f"Run {options['run']} doesn't exist")
+        elif options['resume']:
+            run = SyncRun.objects.filter(finished=None).first()
+            if run is None:
+                raise CommandError("There is no not finished run")
+        else:
+            run = SyncRun.objects.create()
+
+        self.stdout.write(f"Full sync run {run.id}")
+
+        sync = FullSync(
+            run=run,
+            concurrency=options['concurrency'],
+            page_timeout=options['page_timeout'],
+            retries=options['retries'],
+            interval=options['interval'],
+            report=self.stdout.write,
+        )
+
+        try:
+            # sections go page by page, listener handles them in order of requests
+            sync.sync(ENTITIES, concurrency={ProductSectionBX.entity: 1})
+        except FullSyncError as e:
+            raise CommandError(f"{e}, continue with --run {run.id}")
+        except KeyboardInterrupt:
+            self.stdout.write(f"Interrupted, continue with --run {run.id}")
+            return
+
+        self.stdout.write(f"Full sync run {run.id} finished")
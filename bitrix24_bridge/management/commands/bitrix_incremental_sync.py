@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bitrix24_bridge.incremental import request_changes
+from bitrix24_bridge.models import ProductBX, SyncCursor
+from bitrix24_bridge.utils import parse_datetime
+
+MODELS = {
+    model.entity: model
+    for model in (ProductBX,)
+}
+
+
+class Command(BaseCommand):
+    help = 'Request records changed since last applied TIMESTAMP_X, pages are applied by bitrix_sync_listener'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entity', choices=sorted(MODELS), default=ProductBX.entity,
+                            help='Synced entity')
+        parser.add_argument('--since', default=None,
+                            help='ISO 8601 watermark instead of stored cursor')
+        parser.add_argument('--reset', action='store_true',
+                            help='Delete stored cursor and request all records')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['entity']]
+
+        if options['reset']:
+            SyncCursor.objects.filter(entity=model.entity).delete()
+
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Wrong datetime: {options['since']}")
+
+        request_changes(model, since=since)
+
+        cursor = SyncCursor.objects.filter(entity=model.entity).first()
+        watermark = since or (cursor.timestamp if cursor else None)
+        self.stdout.write(f"Requested {model.entity} changed since {watermark.isoformat() if watermark else 'beginning'}")
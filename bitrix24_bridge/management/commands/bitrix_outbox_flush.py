@@ -0,0 +1,66 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from bitrix24_bridge import outbox
+from bitrix24_bridge.mixin import BitrixSyncMixin
+
+logger = logging.getLogger(__name__)
+
+# seconds, upper limit of sleep between retries while broker is unavailable
+MAX_BACKOFF = 60.0
+
+
+class Command(BaseCommand):
+    help = 'Publish commands from outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Commands published in one batch')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Publish commands queued before start and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        interval = options['interval']
+        once = options['once']
+
+        # --once publishes commands written before start, new ones are left for the next run
+        until_id = outbox.last_id() if once else None
+        backoff = interval
+
+        try:
+            while True:
+                try:
+                    result = outbox.drain(BitrixSyncMixin.publish_commands, batch_size=batch_size, until_id=until_id)
+                except Exception:
+                    logger.exception("Outbox flush failed")
+                    if once:
+                        break
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+
+                if result.failed:
+                    logger.warning(f"{len(result.failed)} commands are not published, retry later")
+                    if once:
+                        break
+                    if not result.sent:
+                        # broker is down, don't spin on the same rows
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, MAX_BACKOFF)
+                        continue
+                    # published prefix of batch, failed rows go first in the next one
+                    continue
+
+                backoff = interval
+
+                if result.sent < batch_size:
+                    if once:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -1,16 +1,26 @@
+import functools
 import logging
 import re
-from pprint import pprint
+import signal
 
 import ujson
 from django.core.management.base import BaseCommand
 
-from bitrix24_bridge.amqp.amqp import RabbitMQConsumer
+from bitrix24_bridge.amqp.transports import create_consumer
 from bitrix24_bridge.handlers import (
+    BatchHandler,
     ProductSectionHandler,
     ProductPropertyHandler,
     ProductHandler,
 )
+from bitrix24_bridge.workers import (
+    BROKEN,
+    DONE,
+    REQUEUED,
+    OrderedDispatcher,
+    ProcessWorkerPool,
+    ThreadWorkerPool,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,10 +35,10 @@ def regex_search(handlers: dict, key: str, default=None):
 
 class DefaultHandler:
     def __call__(self, data, *args, **kwargs):
-        pprint(data)
+        logger.debug(f"No handler of {data.get('entity')}: {data}")
 
     def handler(self, data):
-        pprint(data)
+        logger.debug(f"No handler of {data.get('entity')}: {data}")
 
 
 class Command(BaseCommand):
@@ -36,38 +46,124 @@ class Command(BaseCommand):
 
     def __init__(self):
         super().__init__()
-        self.msg_consumer = RabbitMQConsumer()
+        # BB_TRANSPORT, RabbitMQ by default
+        self.msg_consumer = create_consumer()
+        self.dispatcher = None
+        # delivery tag -> redelivered flag of messages passed to dispatcher
+        self.deliveries = {}
 
         self.HANDLERS = {
             'crm.productsection': ProductSectionHandler(),
             'crm.product.property': ProductPropertyHandler(),
             'crm.product': ProductHandler(),
+            'batch': BatchHandler(self.get_handler),
             'default': DefaultHandler(),
         }
 
+    def get_handler(self, entity: str):
+        return self.HANDLERS.get(entity) or self.HANDLERS['default']
+
     def process_message(self, data: dict):
 
-        entity = data.get('entity', 'default')
+        entity = data.get('entity') or 'default'
 
-        handler = self.HANDLERS.get(entity)
+        handler = self.get_handler(entity)
 
         try:
             handler(data)
         except Exception as e:
-            print(e)
             logger.error(str(e))
+            raise
 
     def message_consume(self, channel, method_frame, header_frame, body):
+        """
+        Failed message is requeued once and rejected on redelivery, broken JSON is rejected at once
+        """
+        delivery_tag = method_frame.delivery_tag
+        self.msg_consumer.track(delivery_tag)
+
         try:
             msg = ujson.loads(body)
-            print(msg)
-            self.process_message(msg)
-            print("Message processed.")
         except Exception as e:
-            print(e)
             logger.error(str(e))
+            self.msg_consumer.nack(delivery_tag, requeue=False)
+            return
+
+        try:
+            logger.debug(f"Message received: {msg}")
+            self.process_message(msg)
+            logger.debug("Message processed.")
+        except Exception as e:
+            self.msg_consumer.nack(delivery_tag, redelivered=method_frame.redelivered)
         else:
-            channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+            self.msg_consumer.ack(delivery_tag)
+
+    def dispatch_consume(self, channel, method_frame, header_frame, body):
+        """
+        Pass message to worker pool, it is acknowledged when handled
+        """
+        delivery_tag = method_frame.delivery_tag
+        self.msg_consumer.track(delivery_tag)
+        self.deliveries[delivery_tag] = method_frame.redelivered
+        self.dispatcher.put(delivery_tag, body)
+
+    def settle(self, delivery_tag: int, status: str):
+        """
+        Called on connection I/O thread
+        """
+        redelivered = self.deliveries.pop(delivery_tag, False)
+        if status == DONE:
+            self.msg_consumer.ack(delivery_tag)
+        elif status == BROKEN:
+            self.msg_consumer.nack(delivery_tag, requeue=False)
+        elif status == REQUEUED:
+            self.msg_consumer.nack(delivery_tag, requeue=True)
+        else:
+            self.msg_consumer.nack(delivery_tag, redelivered=redelivered)
+
+    def settle_threadsafe(self, delivery_tag: int, status: str):
+        self.msg_consumer.call_threadsafe(
+            functools.partial(self.settle, delivery_tag, status)
+        )
+
+    def drain(self):
+        """
+        Wait for running handlers, their acks are sent while connection is still opened
+        """
+        self.dispatcher.stop()
+        consumer = self.msg_consumer
+        while self.dispatcher.busy and consumer.is_open:
+            consumer.process_events(time_limit=0.2)
+        self.dispatcher.close()
+        if consumer.is_open:
+            consumer.process_events(time_limit=0)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Count of worker processes, 0 - handle messages in listener process')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Handler threads per worker, for I/O-bound handlers')
+        parser.add_argument('--inline', action='store_true',
+                            help='Handle messages in connection I/O thread (no heartbeats while handling)')
 
     def handle(self, *args, **options):
-        self.msg_consumer.receive(self.message_consume)
+        workers = options.get('workers') or 0
+        threads = options.get('threads') or 1
+
+        if options.get('inline'):
+            self.msg_consumer.receive(self.message_consume)
+            return
+
+        # Handlers never run in pika callback: I/O loop keeps heartbeats and intake while DB work runs
+        if workers:
+            pool = ProcessWorkerPool(self.process_message, workers=workers, threads=threads)
+        else:
+            pool = ThreadWorkerPool(self.process_message, threads=threads)
+
+        self.dispatcher = OrderedDispatcher(pool, settle=self.settle_threadsafe)
+        self.dispatcher.start()
+
+        # graceful shutdown: stop consuming, finish running messages
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        self.msg_consumer.receive(self.dispatch_consume, on_stop=self.drain)
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:38
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0002_auto_20190717_1451'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='Command')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Publish attempts')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Last error')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
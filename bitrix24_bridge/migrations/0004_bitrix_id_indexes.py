@@ -0,0 +1,72 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:42
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keep one row of every bitrix_id before unique constraints:
+    the last row linked to oscar object, the last row if none is linked
+    """
+    linked_fields = {
+        'ProductBX': 'product',
+        'ProductPropertyBX': 'product_attribute',
+        'ProductSectionBX': 'category',
+    }
+    for name, linked in linked_fields.items():
+        model = apps.get_model('bitrix', name)
+        duplicates = (
+            model.objects
+                .exclude(bitrix_id=None)
+                .values('bitrix_id')
+                .annotate(count=Count('id'))
+                .filter(count__gt=1)
+        )
+        for row in duplicates:
+            rows = model.objects.filter(bitrix_id=row['bitrix_id'])
+            keep = (
+                rows
+                    .annotate(linked=Case(
+                        When(**{f'{linked}__isnull': False}, then=Value(1)),
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    ))
+                    .order_by('-linked', '-id')
+                    .values_list('id', flat=True)
+                    .first()
+            )
+            rows.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0003_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='productbx',
+            name='section_id',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True, verbose_name='Associated section ID'),
+        ),
+        migrations.AlterField(
+            model_name='productsectionbx',
+            name='section_id',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True, verbose_name='Associated section ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='productbx',
+            constraint=models.UniqueConstraint(condition=models.Q(bitrix_id__isnull=False), fields=('bitrix_id',), name='bitrix_productbx_bitrix_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='productpropertybx',
+            constraint=models.UniqueConstraint(condition=models.Q(bitrix_id__isnull=False), fields=('bitrix_id',), name='bitrix_productpropertybx_bitrix_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsectionbx',
+            constraint=models.UniqueConstraint(condition=models.Q(bitrix_id__isnull=False), fields=('bitrix_id',), name='bitrix_productsectionbx_bitrix_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0004_bitrix_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productbx',
+            name='payload_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Hash of last applied payload'),
+        ),
+        migrations.AddField(
+            model_name='productpropertybx',
+            name='payload_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Hash of last applied payload'),
+        ),
+        migrations.AddField(
+            model_name='productsectionbx',
+            name='payload_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Hash of last applied payload'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import dateparse, timezone
+
+DATETIME_FIELDS = ('timestamp_x', 'date_create')
+
+
+def parse(value):
+    try:
+        value = dateparse.parse_datetime((value or '').strip())
+    except ValueError:
+        return None
+    if value is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    if not settings.USE_TZ and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def strings_to_datetimes(apps, schema_editor):
+    """
+    Copy TIMESTAMP_X/DATE_CREATE strings to new datetime columns, broken values become NULL
+    """
+    ProductBX = apps.get_model('bitrix', 'ProductBX')
+
+    objs = []
+    for obj in ProductBX.objects.only('id', *DATETIME_FIELDS).iterator():
+        for name in DATETIME_FIELDS:
+            setattr(obj, f'{name}_dt', parse(getattr(obj, name)))
+        objs.append(obj)
+
+        if len(objs) >= 1000:
+            ProductBX.objects.bulk_update(objs, [f'{name}_dt' for name in DATETIME_FIELDS])
+            objs = []
+
+    if objs:
+        ProductBX.objects.bulk_update(objs, [f'{name}_dt' for name in DATETIME_FIELDS])
+
+
+def datetimes_to_strings(apps, schema_editor):
+    ProductBX = apps.get_model('bitrix', 'ProductBX')
+
+    objs = []
+    for obj in ProductBX.objects.only('id', *[f'{name}_dt' for name in DATETIME_FIELDS]).iterator():
+        for name in DATETIME_FIELDS:
+            value = getattr(obj, f'{name}_dt')
+            setattr(obj, name, value.isoformat() if value else None)
+        objs.append(obj)
+
+        if len(objs) >= 1000:
+            ProductBX.objects.bulk_update(objs, DATETIME_FIELDS)
+            objs = []
+
+    if objs:
+        ProductBX.objects.bulk_update(objs, DATETIME_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0005_payload_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=128, unique=True, verbose_name='Entity')),
+                ('timestamp', models.DateTimeField(blank=True, null=True, verbose_name='Last applied TIMESTAMP_X')),
+                ('last_id', models.CharField(blank=True, max_length=128, null=True, verbose_name='Last applied ID')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productbx',
+            name='timestamp_x_dt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productbx',
+            name='date_create_dt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(strings_to_datetimes, datetimes_to_strings),
+        migrations.RemoveField(
+            model_name='productbx',
+            name='timestamp_x',
+        ),
+        migrations.RemoveField(
+            model_name='productbx',
+            name='date_create',
+        ),
+        migrations.RenameField(
+            model_name='productbx',
+            old_name='timestamp_x_dt',
+            new_name='timestamp_x',
+        ),
+        migrations.RenameField(
+            model_name='productbx',
+            old_name='date_create_dt',
+            new_name='date_create',
+        ),
+        migrations.AlterField(
+            model_name='productbx',
+            name='timestamp_x',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='TIMESTAMP_X'),
+        ),
+        migrations.AlterField(
+            model_name='productbx',
+            name='date_create',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='DATE_CREATE'),
+        ),
+    ]
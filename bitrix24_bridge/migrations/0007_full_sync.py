@@ -0,0 +1,47 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0006_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncPage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=128, verbose_name='Entity')),
+                ('start', models.PositiveIntegerField(verbose_name='Offset')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Request attempts')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Total rows of entity')),
+                ('rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Applied rows')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Sent')),
+                ('done', models.DateTimeField(blank=True, null=True, verbose_name='Done')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='bitrix.SyncRun')),
+            ],
+            options={
+                'ordering': ('start',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='syncpage',
+            constraint=models.UniqueConstraint(fields=('run', 'entity', 'start'), name='bitrix_syncpage_run_entity_start_uniq'),
+        ),
+    ]
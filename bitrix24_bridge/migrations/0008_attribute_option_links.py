@@ -0,0 +1,29 @@
+# Generated by Django 2.2.3 on 2026-10-17 13:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0016_auto_20190327_0757'),
+        ('bitrix', '0007_full_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeOptionBX',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value_id', models.CharField(max_length=128, verbose_name='Value ID')),
+                ('xml_id', models.CharField(blank=True, max_length=256, null=True, verbose_name='Mnemonic code')),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalogue.AttributeOption')),
+                ('prop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='option_links', to='bitrix.ProductPropertyBX')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='attributeoptionbx',
+            constraint=models.UniqueConstraint(fields=('prop', 'value_id'), name='bitrix_attributeoptionbx_prop_value_uniq'),
+        ),
+    ]
@@ -0,0 +1,170 @@
+# Generated by Django 2.2.3 on 2026-10-17 14:02
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+PRICE_LIMIT = Decimal(10) ** 10
+
+# flag -> default
+FLAGS = {
+    'active': True,
+    'multiple': False,
+    'is_required': False,
+}
+
+
+def parse_price(value):
+    try:
+        value = Decimal((value or '').strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not value.is_finite() or abs(value) >= PRICE_LIMIT:
+        return None
+    return value
+
+
+def parse_flag(value, default):
+    value = (value or '').strip().upper()
+    if value in ('Y', '1', 'TRUE'):
+        return True
+    if value in ('N', '0', 'FALSE'):
+        return False
+    return default
+
+
+def bulk_copy(model, fields, convert):
+    """
+    Copy values of `fields` to `<field>_typed` columns by chunks
+    """
+    objs = []
+    for obj in model.objects.only('id', *fields).iterator():
+        for name in fields:
+            setattr(obj, f'{name}_typed', convert(name, getattr(obj, name)))
+        objs.append(obj)
+
+        if len(objs) >= 1000:
+            model.objects.bulk_update(objs, [f'{name}_typed' for name in fields])
+            objs = []
+
+    if objs:
+        model.objects.bulk_update(objs, [f'{name}_typed' for name in fields])
+
+
+def bulk_copy_back(model, fields, convert):
+    objs = []
+    for obj in model.objects.only('id', *[f'{name}_typed' for name in fields]).iterator():
+        for name in fields:
+            setattr(obj, name, convert(name, getattr(obj, f'{name}_typed')))
+        objs.append(obj)
+
+        if len(objs) >= 1000:
+            model.objects.bulk_update(objs, fields)
+            objs = []
+
+    if objs:
+        model.objects.bulk_update(objs, fields)
+
+
+def strings_to_types(apps, schema_editor):
+    """
+    Prices become decimals and Y/N flags become booleans, broken prices become NULL, broken flags get defaults
+    """
+    bulk_copy(apps.get_model('bitrix', 'ProductBX'), ['price'], lambda name, value: parse_price(value))
+    bulk_copy(apps.get_model('bitrix', 'ProductPropertyBX'), list(FLAGS),
+              lambda name, value: parse_flag(value, FLAGS[name]))
+
+
+def types_to_strings(apps, schema_editor):
+    bulk_copy_back(apps.get_model('bitrix', 'ProductBX'), ['price'],
+                   lambda name, value: str(value) if value is not None else None)
+    bulk_copy_back(apps.get_model('bitrix', 'ProductPropertyBX'), list(FLAGS),
+                   lambda name, value: 'Y' if value else 'N')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bitrix', '0008_attribute_option_links'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productbx',
+            name='price_typed',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='productpropertybx',
+            name='active_typed',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='productpropertybx',
+            name='multiple_typed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='productpropertybx',
+            name='is_required_typed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(strings_to_types, types_to_strings),
+        migrations.RemoveField(
+            model_name='productbx',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='productpropertybx',
+            name='active',
+        ),
+        migrations.RemoveField(
+            model_name='productpropertybx',
+            name='multiple',
+        ),
+        migrations.RemoveField(
+            model_name='productpropertybx',
+            name='is_required',
+        ),
+        migrations.RenameField(
+            model_name='productbx',
+            old_name='price_typed',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name='productpropertybx',
+            old_name='active_typed',
+            new_name='active',
+        ),
+        migrations.RenameField(
+            model_name='productpropertybx',
+            old_name='multiple_typed',
+            new_name='multiple',
+        ),
+        migrations.RenameField(
+            model_name='productpropertybx',
+            old_name='is_required_typed',
+            new_name='is_required',
+        ),
+        migrations.AlterField(
+            model_name='productbx',
+            name='price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True,
+                                      verbose_name='Price'),
+        ),
+        migrations.AlterField(
+            model_name='productpropertybx',
+            name='active',
+            field=models.BooleanField(default=True, verbose_name='Active'),
+        ),
+        migrations.AlterField(
+            model_name='productpropertybx',
+            name='multiple',
+            field=models.BooleanField(default=False, verbose_name='Multiple'),
+        ),
+        migrations.AlterField(
+            model_name='productpropertybx',
+            name='is_required',
+            field=models.BooleanField(default=False, verbose_name='Is required'),
+        ),
+    ]
@@ -1,6 +1,81 @@
-from typing import Tuple, Dict, Optional, List, Set, Iterable
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Tuple, Dict, Optional, List, Set, Iterable, Callable, Any
+
+from django.db import transaction
+
+from bitrix24_bridge.amqp.amqp import PublishResult, get_var
+from bitrix24_bridge.amqp.pool import get_producer_pool
+from bitrix24_bridge.amqp.scheduler import PRIORITY_BULK, get_scheduler
+from bitrix24_bridge.attributes import export_value
+from bitrix24_bridge.batch import BATCH_LIMIT, BatchCoalescer, current_coalescer, pack_commands
+from bitrix24_bridge.debounce import get_debouncer
+from bitrix24_bridge.normalize import PayloadNormalizer, count_errors
+from bitrix24_bridge import outbox
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FieldMaps:
+    """
+    Fields maps of model class compiled once, see BitrixSyncMixin.compile_maps()
+
+    :param fields_map: Dict[str, str] - bitrix name -> model field name
+    :param reverse_fields_map: Dict[str, str] - model field name -> bitrix name
+    :param from_bitrix: Callable[[Dict], Dict] - bitrix data -> model kwargs, None values and ID are skipped
+    :param merge: Callable[[Dict, Any], Dict] - bitrix data over model instance values -> model kwargs, ID is skipped
+    :param to_bitrix: Callable[[Any], Dict] - model instance -> bitrix data
+    """
+    fields_map: Dict[str, str]
+    reverse_fields_map: Dict[str, str]
+    from_bitrix: Callable[[Dict], Dict]
+    merge: Callable[[Dict, Any], Dict]
+    to_bitrix: Callable[[Any], Dict]
+
+
+def compile_converters(fields_map: Dict[str, str]) -> Tuple[Callable, Callable, Callable]:
+    items: Tuple[Tuple[str, str], ...] = tuple(fields_map.items())
+    load_items = tuple((b_f, o_f) for b_f, o_f in items if o_f != 'bitrix_id')
+
+    def from_bitrix(data: Dict) -> Dict:
+        result = {}
+        get = data.get
+        for b_f, o_f in load_items:
+            value = get(b_f)
+            if value is not None:
+                result[o_f] = value
+        return result
+
+    def merge(data: Dict, obj) -> Dict:
+        return {
+            o_f: data[b_f] if b_f in data else getattr(obj, o_f, None)
+            for b_f, o_f in load_items
+        }
+
+    def to_bitrix(obj) -> Dict:
+        return {
+            b_f: getattr(obj, o_f, None)
+            for b_f, o_f in items
+        }
+
+    return from_bitrix, merge, to_bitrix
 
-from bitrix24_bridge.amqp.amqp import RabbitMQProducer
+
+# bridge bookkeeping fields, never mapped to bitrix fields
+SERVICE_FIELDS = {'payload_hash'}
+
+
+def payload_hash(values: Dict) -> str:
+    """
+    Stable hash of normalized payload (model kwargs from bitrix data)
+    """
+    dump = json.dumps(values, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(dump.encode('utf-8')).hexdigest()
 
 
 class BitrixSyncMixin:
@@ -21,6 +96,19 @@ class BitrixSyncMixin:
     exclude_fields: Optional[Iterable[str]] = None
     include_fields: Optional[Dict[str, str]] = None
 
+    # `select` param of list commands, e.g. ["*", "PROPERTY_*"]
+    list_select: Optional[List[str]] = None
+
+    # FK to oscar object, to_object() is skipped only if it is set
+    object_field: Optional[str] = None
+
+    # True if payload hash matches the last applied one, set by *update_or_create_cls
+    unchanged: bool = False
+
+    # entity -> count of to_object() calls skipped by payload hash
+    skipped: Counter = Counter()
+    _skipped_lock = threading.Lock()
+
     def get_sync_object(self, bitrix_id: int):
         obj = self.objects.filter(bitrix_id=bitrix_id).first()
         return obj
@@ -41,10 +129,8 @@ class BitrixSyncMixin:
 
         obj, created = self.__class__.objects.update_or_create(
             bitrix_id=b_id,
-            defaults={
-                o_f: data.get(b_f, getattr(self, o_f, None))
-                for b_f, o_f in self.get_map().items()
-            }
+            # not a bitrix payload, next import must be applied
+            defaults=dict(self.normalize([self.get_maps().merge(data, self)])[0], payload_hash=None)
         )
 
         return obj
@@ -56,26 +142,99 @@ class BitrixSyncMixin:
             data = {}
 
         b_id = data.pop('ID', None) or data.pop('id', None)
-        de = {
-                o_f: data.get(b_f)
-                for b_f, o_f in cls().get_map().items()
-                if data.get(b_f) is not None
-            }
+
         try:
-            obj, created = cls.objects.update_or_create(
-                bitrix_id=b_id,
-                defaults={
-                    o_f: data.get(b_f)
-                    for b_f, o_f in cls().get_map().items()
-                    if data.get(b_f) is not None
-                }
-            )
-        except Exception as e:
-            print(e)
-            pass
+            defaults = cls.normalize([cls.defaults_from_data(data)])[0]
+            defaults['payload_hash'] = payload_hash(defaults)
+
+            obj = cls.objects.filter(bitrix_id=b_id).first() if b_id is not None else None
+            if obj is not None and obj.payload_hash == defaults['payload_hash']:
+                obj.unchanged = True
+            else:
+                obj, created = cls.objects.update_or_create(
+                    bitrix_id=b_id,
+                    defaults=defaults
+                )
+        except Exception:
+            # message is nacked by listener
+            logger.error(f"{cls.entity} {b_id}: bridge row is not saved")
+            raise
 
         return obj
 
+    @classmethod
+    def defaults_from_data(cls, data: Dict) -> Dict:
+        """
+        Model fields values from bitrix data, ID is not included
+        """
+        return cls.get_maps().from_bitrix(data)
+
+    @classmethod
+    def normalize(cls, rows: List[Dict]) -> List[Dict]:
+        """
+        Convert typed columns of a page of defaults_from_data() results, see PayloadNormalizer.
+        Broken values are counted in normalize.errors by entity and field
+        """
+        normalizer = PayloadNormalizer(cls)
+        rows = normalizer.normalize(rows)
+        if normalizer.errors:
+            count_errors(cls.entity, normalizer.errors)
+            logger.warning(f"{cls.entity}: broken values {dict(normalizer.errors)}")
+        return rows
+
+    @classmethod
+    def bulk_update_or_create_cls(cls, rows: Iterable[Dict]) -> List['BitrixSyncMixin']:
+        """
+        Set-based update_or_create_cls for a page of bitrix results:
+        one SELECT of existing rows, one bulk INSERT and one bulk UPDATE in one transaction
+        Args:
+            rows: Iterable[Dict] - e.g. result of crm.product.list
+
+        Returns:
+            List[BitrixSyncMixin] - objects in order of rows, duplicates are merged, rows without ID are skipped.
+                Rows with payload hash equal to stored one are not written and marked `unchanged`
+        """
+        values: Dict[str, Dict] = {}
+        for data in rows:
+            data = dict(data)
+            b_id = data.pop('ID', None) or data.pop('id', None)
+            if b_id is None:
+                continue
+            values[str(b_id)] = cls.defaults_from_data(data)
+
+        if not values:
+            return []
+
+        for defaults in cls.normalize(list(values.values())):
+            defaults['payload_hash'] = payload_hash(defaults)
+
+        with transaction.atomic():
+            objs = {
+                obj.bitrix_id: obj
+                for obj in cls.objects.select_for_update().filter(bitrix_id__in=values.keys())
+            }
+
+            to_create, to_update, fields = [], [], set()
+            for b_id, defaults in values.items():
+                obj = objs.get(b_id)
+                if obj is None:
+                    obj = objs[b_id] = cls(bitrix_id=b_id, **defaults)
+                    to_create.append(obj)
+                elif obj.payload_hash == defaults['payload_hash']:
+                    obj.unchanged = True
+                else:
+                    for k, v in defaults.items():
+                        setattr(obj, k, v)
+                    fields.update(defaults)
+                    to_update.append(obj)
+
+            if to_create:
+                cls.objects.bulk_create(to_create)
+            if to_update and fields:
+                cls.objects.bulk_update(to_update, fields)
+
+        return [objs[b_id] for b_id in values]
+
     def get_or_create(self, data: Optional[Dict] = None):
         if data is None:
             data = {}
@@ -84,15 +243,14 @@ class BitrixSyncMixin:
 
         obj, created = self.__class__.objects.get_or_create(
             bitrix_id=b_id,
-            defaults={
-                o_f: data.get(b_f, getattr(self, o_f, None))
-                for b_f, o_f in self.get_map().items()
-            }
+            # not a bitrix payload, next import must be applied
+            defaults=dict(self.normalize([self.get_maps().merge(data, self)])[0], payload_hash=None)
         )
 
         return obj
 
-    def generate_map(self, *, include: Optional[Dict[str, str]] = None, exclude: Optional[Iterable[str]] = None):
+    @classmethod
+    def generate_map(cls, *, include: Optional[Dict[str, str]] = None, exclude: Optional[Iterable[str]] = None):
         """
         Generate fields map from django.Model fields
 
@@ -110,71 +268,299 @@ class BitrixSyncMixin:
         return {
             **{
                 str(f.name).upper(): f.name
-                for f in self._meta.get_fields()
-                if f not in exclude and not f.is_relation
+                for f in cls._meta.get_fields()
+                if f.name not in exclude and not f.is_relation
             },
             **include
         }
 
-    def get_reverse_map(self) -> Dict[str, str]:
-        if self.reverse_fields_map is None:
-            self.reverse_fields_map = {
-                v: k
-                for k, v in self.get_map().items()
-            }
+    @classmethod
+    def compile_maps(cls) -> FieldMaps:
+        """
+        Compile fields maps and converters of model class, called once for every model in AppConfig.ready()
+        """
+        fields_map = cls.generate_map(
+            exclude=set(cls.exclude_fields or {'id', 'bitrix_id'}) | SERVICE_FIELDS,
+            include=cls.include_fields or {'ID': 'bitrix_id'}
+        )
+        from_bitrix, merge, to_bitrix = compile_converters(fields_map)
+
+        maps = FieldMaps(
+            fields_map=fields_map,
+            reverse_fields_map={v: k for k, v in fields_map.items()},
+            from_bitrix=from_bitrix,
+            merge=merge,
+            to_bitrix=to_bitrix,
+        )
+
+        cls._field_maps = maps
+        cls.fields_map = maps.fields_map
+        cls.reverse_fields_map = maps.reverse_fields_map
+
+        return maps
+
+    @classmethod
+    def get_maps(cls) -> FieldMaps:
+        # compiled maps of exactly this class, not inherited from parent model
+        maps = cls.__dict__.get('_field_maps')
+        if maps is None:
+            maps = cls.compile_maps()
+        return maps
 
-        return self.reverse_fields_map
+    def get_reverse_map(self) -> Dict[str, str]:
+        return self.get_maps().reverse_fields_map
 
     def get_map(self) -> Dict[str, str]:
-        if self.fields_map is None:
-            try:
-                self.fields_map = self.generate_map(
-                    exclude=self.exclude_fields or {'id', 'bitrix_id'},
-                    include=self.include_fields or {'ID': 'bitrix_id'}
-                )
-            except:
-                pass
-        return self.fields_map
+        return self.get_maps().fields_map
 
     def to_dict(self):
-        return {
-            b_f: getattr(self, o_f, None)
-            for b_f, o_f in self.get_map().items()
-        }
+        # Decimal, datetime and boolean columns in bitrix format
+        return {k: export_value(v) for k, v in self.get_maps().to_bitrix(self).items()}
 
     def to_object(self, force_save: bool = True):
         raise NotImplementedError
 
+    @classmethod
+    def to_objects(cls, objs: Iterable['BitrixSyncMixin']) -> List:
+        """
+        to_object() of many objects, models override it with set-based writes
+        """
+        return [obj.to_object() for obj in objs]
+
+    def is_applied(self) -> bool:
+        """
+        Payload is unchanged and oscar object is already linked
+        """
+        return bool(
+            self.unchanged and self.object_field and getattr(self, f'{self.object_field}_id', None) is not None
+        )
+
+    @classmethod
+    def count_skipped(cls, count: int = 1):
+        if count:
+            with cls._skipped_lock:
+                cls.skipped[cls.entity] += count
+
+    def apply(self):
+        """
+        to_object() unless payload is already applied.
+        Failed to_object() resets stored hash, so the payload is applied again next time
+
+        Returns:
+            oscar object or None if skipped
+        """
+        result = self.apply_many([self])
+        return result[0] if result else None
+
+    @classmethod
+    def apply_many(cls, objs: Iterable['BitrixSyncMixin']) -> List:
+        """
+        to_objects() of objects with not applied payload
+        Returns:
+            List - oscar objects of applied ones
+        """
+        objs = list(objs)
+        changed = [obj for obj in objs if not obj.is_applied()]
+        cls.count_skipped(len(objs) - len(changed))
+
+        if not changed:
+            return []
+
+        try:
+            return cls.to_objects(changed)
+        except Exception:
+            cls.objects.filter(pk__in=[obj.pk for obj in changed if obj.pk is not None]).update(payload_hash=None)
+            raise
+
     @staticmethod
     def from_object(obj, force_save: bool = True):
         raise NotImplementedError
 
+    @classmethod
+    def from_objects(cls, objs: Iterable, force_save: bool = True) -> List['BitrixSyncMixin']:
+        """
+        from_object() for many oscar objects, override to load related data by bulk queries
+        Args:
+            objs: Iterable - oscar objects
+            force_save: bool - save bridge rows by bulk_save()
+
+        Returns:
+            List[BitrixSyncMixin] - in order of objs
+        """
+        sync_objs = [cls.from_object(obj, force_save=False) for obj in objs]
+        if force_save:
+            cls.bulk_save(sync_objs)
+        return sync_objs
+
+    @classmethod
+    def bulk_save(cls, objs: List['BitrixSyncMixin']):
+        """
+        One bulk INSERT of new rows and one bulk UPDATE of existing ones
+        """
+        fields = [field.name for field in cls._meta.concrete_fields if not field.primary_key]
+        to_create = [obj for obj in objs if obj.pk is None]
+        to_update = [obj for obj in objs if obj.pk is not None]
+
+        with transaction.atomic():
+            if to_create:
+                cls.objects.bulk_create(to_create)
+            if to_update:
+                cls.objects.bulk_update(to_update, fields)
+
+    @classmethod
+    def from_queryset(cls, queryset, chunk_size: Optional[int] = None, action: Optional[str] = None,
+                      meta: Optional[Dict] = None, batched: bool = False) -> PublishResult:
+        """
+        Export oscar objects of queryset, e.g. ProductBX.from_queryset(Product.objects.all())
+
+        Objects are read by chunks of `chunk_size` ordered by pk, every chunk is converted by from_objects(),
+        saved and published by update_many() before the next one is read, so memory doesn't grow with queryset
+        Args:
+            queryset: QuerySet - oscar objects
+            chunk_size: Optional[int] - BB_EXPORT_CHUNK_SIZE or 1000 by default
+            batched: bool - pack commands into Bitrix24 `batch` commands
+
+        Returns:
+            PublishResult - failed indexes are counted from the first exported object
+        """
+        chunk_size = chunk_size or int(get_var('BB_EXPORT_CHUNK_SIZE')() or 1000)
+        queryset = queryset.order_by('pk')
+
+        result = PublishResult()
+        exported, last_pk = 0, None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(page[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            sync_objs = cls.from_objects(chunk)
+            published = cls.update_many(sync_objs, action=action, meta=meta, batched=batched)
+
+            result.sent += published.sent
+            result.failed.extend((exported + index, command) for index, command in published.failed)
+            exported += len(sync_objs)
+
+        return result
+
     @staticmethod
-    def send_command(
+    def make_command(
             method: str,
             params: Optional[Dict] = None,
             action: Optional[str] = None,
             meta: Optional[Dict] = None
-    ) -> Optional[bool]:
-        producer = RabbitMQProducer()
-
-        data = {
+    ) -> Dict:
+        return {
             "method": method,
             "action": action,
             "params": params,
             "meta": meta
         }
 
+    @staticmethod
+    def send_commands(commands: Iterable[Dict], batched: bool = False) -> PublishResult:
+        """
+        Publish commands in one batch with publisher confirms
+        Args:
+            commands: Iterable[Dict] - see make_command()
+            batched: bool - pack commands into Bitrix24 `batch` commands by BATCH_LIMIT
+
+        Returns:
+            PublishResult - failed contains (index, command) of not delivered commands
+        """
+        if batched:
+            commands = pack_commands(commands)
+        else:
+            commands = list(commands)
+
+        if outbox.outbox_enabled():
+            return PublishResult(sent=outbox.enqueue(commands))
+
+        return BitrixSyncMixin.publish_commands(commands)
+
+    @staticmethod
+    def publish_commands(commands: List[Dict]) -> PublishResult:
+        """
+        Publish commands as is with publisher confirms, through scheduler if BB_RATE_LIMIT is set
+        """
+        try:
+            scheduler = get_scheduler()
+            if scheduler is not None:
+                return scheduler.submit_many(commands, priority=PRIORITY_BULK).result()
+            return get_producer_pool().send_many(commands)
+        except Exception as e:
+            return PublishResult(failed=list(enumerate(commands)))
+
+    @staticmethod
+    def publish_command(data: Dict, priority: Optional[int] = None) -> bool:
+        """
+        Publish command as is, through scheduler if BB_RATE_LIMIT is set
+        """
         try:
-            producer.send(data)
+            scheduler = get_scheduler()
+            if scheduler is not None:
+                scheduler.submit(data, priority=priority)
+            else:
+                get_producer_pool().send(data)
             response = True
         except Exception as e:
             response = False
-        finally:
-            producer.close()
 
         return response
 
+    @classmethod
+    def send_command(
+            cls,
+            method: str,
+            params: Optional[Dict] = None,
+            action: Optional[str] = None,
+            meta: Optional[Dict] = None,
+            priority: Optional[int] = None
+    ) -> Optional[bool]:
+        """
+        Publish command, if BB_RATE_LIMIT is set command is enqueued to rate limited scheduler.
+        If BB_OUTBOX_ENABLED is set, command is written to outbox in the current transaction instead.
+        If BB_DEBOUNCE_WINDOW is set, update/delete commands are merged by (entity, id) in the window before publishing
+        Args:
+            method: str - e.g. 'crm.product.list'
+            params: Optional[Dict]
+            action: Optional[str]
+            meta: Optional[Dict]
+            priority: Optional[int] - scheduler priority, lower goes first, by default depends on method
+
+        Returns:
+            Optional[bool]
+        """
+        data = cls.make_command(method=method, params=params, action=action, meta=meta)
+
+        coalescer = current_coalescer()
+        if coalescer is not None:
+            coalescer.add(data)
+            return True
+
+        if outbox.outbox_enabled():
+            outbox.enqueue([data])
+            return True
+
+        debouncer = get_debouncer(sender=cls.publish_command)
+        if debouncer is not None and debouncer.push(data):
+            return True
+
+        return cls.publish_command(data, priority=priority)
+
+    @classmethod
+    def coalesce(cls, size: int = BATCH_LIMIT, halt: bool = False) -> BatchCoalescer:
+        """
+        Collect commands sent in context and pack them into Bitrix24 `batch` commands
+
+        Usage:
+            with ProductBX.coalesce():
+                product.update()
+                section.remove()
+        """
+        return BatchCoalescer(sender=cls.send_commands, size=size, halt=halt)
+
     def list(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
         method = f"{self.entity}.list"
         action = action or 'list'
@@ -185,12 +571,16 @@ class BitrixSyncMixin:
         action = action or 'batch'
         return self.send_command(method=method, params=params, action=action, meta=meta)
 
-    def add(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+    def add_command(self, params: Optional[Dict] = None, action: Optional[str] = None,
+                    meta: Optional[Dict] = None) -> Dict:
         method = f"{self.entity}.add"
         params = params or {
             "fields": self.to_dict()
         }
-        return self.send_command(method=method, params=params, action=action, meta=meta)
+        return self.make_command(method=method, params=params, action=action, meta=meta)
+
+    def add(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+        return self.send_command(**self.add_command(params=params, action=action, meta=meta))
 
     def get(self, bid: int = None, action: Optional[str] = None, meta: Optional[Dict] = None):
         method = f"{self.entity}.get"
@@ -203,7 +593,8 @@ class BitrixSyncMixin:
 
         return self.send_command(method=method, params=params, action=action, meta=meta)
 
-    def remove(self, bid: int = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+    def remove_command(self, bid: int = None, action: Optional[str] = None,
+                       meta: Optional[Dict] = None) -> Optional[Dict]:
         method = f"{self.entity}.delete"
 
         params = {
@@ -211,11 +602,20 @@ class BitrixSyncMixin:
         }
 
         if params.get('id') is None:
+            return None
+
+        return self.make_command(method=method, params=params, action=action, meta=meta)
+
+    def remove(self, bid: int = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+        command = self.remove_command(bid=bid, action=action, meta=meta)
+
+        if command is None:
             return False
 
-        return self.send_command(method=method, params=params, action=action, meta=meta)
+        return self.send_command(**command)
 
-    def update(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+    def update_command(self, params: Optional[Dict] = None, action: Optional[str] = None,
+                       meta: Optional[Dict] = None) -> Dict:
         method = f"{self.entity}.update"
 
         params = params or {
@@ -225,9 +625,61 @@ class BitrixSyncMixin:
 
         if params.get('id') is None:
             params.pop('id', None)
-            return self.add(params=params)
+            return self.add_command(params=params)
 
-        return self.send_command(method=method, params=params, action=action, meta=meta)
+        return self.make_command(method=method, params=params, action=action, meta=meta)
+
+    def update(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
+        return self.send_command(**self.update_command(params=params, action=action, meta=meta))
+
+    @classmethod
+    def add_many(cls, objs: Iterable['BitrixSyncMixin'], action: Optional[str] = None,
+                 meta: Optional[Dict] = None, batched: bool = False) -> PublishResult:
+        """
+        Bulk add(), e.g. ProductBX.add_many(ProductBX.objects.filter(bitrix_id=None))
+        Args:
+            objs: Iterable[BitrixSyncMixin] - instances or queryset
+            batched: bool - pack commands into Bitrix24 `batch` commands
+
+        Returns:
+            PublishResult
+        """
+        return cls.send_commands(
+            (obj.add_command(action=action, meta=meta) for obj in objs),
+            batched=batched
+        )
+
+    @classmethod
+    def update_many(cls, objs: Iterable['BitrixSyncMixin'], action: Optional[str] = None,
+                    meta: Optional[Dict] = None, batched: bool = False) -> PublishResult:
+        """
+        Bulk update(), objects without bitrix_id are added
+        Args:
+            objs: Iterable[BitrixSyncMixin] - instances or queryset
+            batched: bool - pack commands into Bitrix24 `batch` commands
+
+        Returns:
+            PublishResult
+        """
+        return cls.send_commands(
+            (obj.update_command(action=action, meta=meta) for obj in objs),
+            batched=batched
+        )
+
+    @classmethod
+    def remove_many(cls, objs: Iterable['BitrixSyncMixin'], action: Optional[str] = None,
+                    meta: Optional[Dict] = None, batched: bool = False) -> PublishResult:
+        """
+        Bulk remove(), objects without bitrix_id are skipped
+        Args:
+            objs: Iterable[BitrixSyncMixin] - instances or queryset
+            batched: bool - pack commands into Bitrix24 `batch` commands
+
+        Returns:
+            PublishResult
+        """
+        commands = (obj.remove_command(action=action, meta=meta) for obj in objs)
+        return cls.send_commands((command for command in commands if command is not None), batched=batched)
 
     def types(self, params: Optional[Dict] = None, action: Optional[str] = None, meta: Optional[Dict] = None):
         method = f"{self.entity}.types"
@@ -1,21 +1,33 @@
+import ast
 import re
+from collections import Counter
+from datetime import datetime
 from decimal import Decimal
-from typing import Dict, Optional, Tuple, List
+from typing import Dict, Iterable, Optional, Tuple, List
 
 from django.conf import settings
-from django.contrib.postgres.fields import HStoreField
-from django.db import models
-from django.utils.datetime_safe import datetime
+from django.contrib.postgres.fields import HStoreField, JSONField
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
+from bitrix24_bridge.attributes import AttributeValueWriter, export_value, property_value
+from bitrix24_bridge.cache import current_session, import_session
+from bitrix24_bridge.categories import CategoryTreeImporter
 from bitrix24_bridge.mixin import BitrixSyncMixin
 from oscar.core.loading import get_model
+from oscar.core.utils import slugify
 
 
 class ProductBX(models.Model, BitrixSyncMixin):
     entity = "crm.product"
+    object_field = "product"
 
-    exclude_fields = {'id', 'bitrix_id', 'properties'},
+    # watermark field of incremental sync, see SyncCursor
+    cursor_field = "TIMESTAMP_X"
+    list_select = ["*", "PROPERTY_*"]
+
+    exclude_fields = {'id', 'bitrix_id', 'properties'}
     include_fields = {'ID': 'bitrix_id'}
 
     bitrix_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Product ID"))
@@ -28,20 +40,20 @@ class ProductBX(models.Model, BitrixSyncMixin):
     sort = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Sort"))
     xml_id = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("Mnemonic code"))
 
-    # real type is DateTime
-    timestamp_x = models.CharField(max_length=64, null=True, blank=True, verbose_name=_("TIMESTAMP_X"))
-    date_create = models.CharField(max_length=64, null=True, blank=True, verbose_name=_("DATE_CREATE"))
+    timestamp_x = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name=_("TIMESTAMP_X"))
+    date_create = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name=_("DATE_CREATE"))
 
     catalog_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Catalog ID"))
-    section_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Associated section ID"))
+    section_id = models.CharField(max_length=128, null=True, blank=True, db_index=True,
+                                  verbose_name=_("Associated section ID"))
 
     description = models.TextField(null=True, blank=True, verbose_name=_("Description"))
 
     description_type = models.CharField(max_length=64, default="text", null=True, blank=True,
                                         verbose_name=_("Description type"))
 
-    # real type Decimal
-    price = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("Price"))
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, db_index=True,
+                                verbose_name=_("Price"))
 
     currency_id = models.CharField(max_length=64, null=True, blank=True, verbose_name=_("Currency id"))
 
@@ -55,6 +67,15 @@ class ProductBX(models.Model, BitrixSyncMixin):
 
     product = models.ForeignKey('catalogue.Product', null=True, blank=True, on_delete=models.CASCADE)
 
+    payload_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True,
+                                    verbose_name=_("Hash of last applied payload"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bitrix_id'], condition=models.Q(bitrix_id__isnull=False),
+                                    name='bitrix_productbx_bitrix_id_uniq'),
+        ]
+
     def process_properties(self, data: Optional[Dict] = None, force_save: bool = True):
         """
         Unpack self.properties from bitrix format
@@ -64,19 +85,33 @@ class ProductBX(models.Model, BitrixSyncMixin):
 
         Returns:
 
+        """
+        self.properties = self.parse_properties(data)
+
+        if force_save:
+            self.save()
+
+        return self.properties
+
+    @staticmethod
+    def parse_properties(data: Optional[Dict] = None) -> Dict:
+        """
+        Custom properties from bitrix format: {"PROPERTY_12": {...}} -> {"12": {...}}
         """
         if data is None:
             data = {}
         reg = re.compile(r'^PROPERTY_([\d]+)$')
-        self.properties = {
+        return {
             reg.search(k).group(1): v
             for k, v in data.items()
             if reg.match(k.strip().upper())
         }
-        if force_save:
-            self.save()
 
-        return self.properties
+    @classmethod
+    def defaults_from_data(cls, data: Dict) -> Dict:
+        defaults = super().defaults_from_data(data)
+        defaults['properties'] = cls.parse_properties(data)
+        return defaults
 
     def get_properties(self, data: Optional[Dict] = None):
         """
@@ -105,186 +140,344 @@ class ProductBX(models.Model, BitrixSyncMixin):
         return dict(super().to_dict(), **self.get_properties())
 
     def update_or_create(self, data: Optional[Dict] = None):
-        obj: ProductBX = super(self).update_or_create(data=data)
+        obj: ProductBX = super().update_or_create(data=data)
 
         obj.process_properties(data=data)
 
         return obj
 
-    @classmethod
-    def update_or_create_cls(cls, data: Optional[Dict] = None):
-        obj: ProductBX = super().update_or_create_cls(data=data)
+    def fill_product(self, product):
+        """
+        Copy fields to oscar Product
+        """
+        product.title = self.name
+        product.description = self.description or ""
 
-        obj.process_properties(data=data)
-        return obj
+        if self.date_create is not None:
+            product.date_created = self.date_create
+        if self.timestamp_x is not None:
+            product.date_updated = self.timestamp_x
 
-    def to_object(self, force_save: bool = True):
-        Product = get_model('catalogue', 'Product')
-        ProductClass = get_model('catalogue', 'ProductClass')
+        return product
 
-        product = self.product or Product(
-            product_class=ProductClass.objects.get_or_create(name="__bitrix_product_class")[0]
-        )
+    def get_price(self) -> Optional[Decimal]:
+        return self.price
 
-        product.title = self.name
-        product.description = self.description or ""
+    def to_object(self, force_save: bool = True):
+        if not force_save:
+            Product = get_model('catalogue', 'Product')
+            self.fill_product(self.product or Product(product_class=current_session().product_class()))
+            return self.product
 
-        # cary on Convert datetime
-        try:
-            product.date_created = datetime.fromisoformat(self.date_create)
-        except Exception as e:
-            pass
-        try:
-            product.date_updated = datetime.fromisoformat(self.timestamp_x)
-        except Exception as e:
-            pass
+        return self.to_objects([self])[0]
 
-        if force_save:
-            product.save()
-            self.product = product
-            self.save()
+    @classmethod
+    def to_objects(cls, objs: Iterable['ProductBX']) -> List:
+        """
+        Set-based to_object() for many products in one transaction:
+        bulk INSERT and bulk UPDATE of products, one INSERT of category links
+        and bulk upsert of stock records keyed by (partner, partner_sku)
+        Args:
+            objs: Iterable[ProductBX] - queryset or list
 
-        if self.properties and product.id:
-            """
-            Don't save props without saved product
-            """
-            props: List[ProductPropertyBX] = (
-                ProductPropertyBX.objects
-                    .prefetch_related('product_attribute')
-                    .filter(bitrix_id__in=self.properties.keys())
-                    .all()
-            )
+        Returns:
+            List[Product] - in order of objs
+        """
+        Product = get_model('catalogue', 'Product')
+        ProductCategory = get_model('catalogue', 'ProductCategory')
+        StockRecord = get_model('partner', 'StockRecord')
 
-            for prop in props:
-                """
-                save_value() create new ProductAttributeValue or set if it exist
-                """
-                if prop.product_attribute:
-                    try:
-                        """
-                        If data broken
-                        """
-                        prop.product_attribute.save_value(
-                            product,
-                            self.properties.get(prop.bitrix_id, {}).get('value')
+        objs: List[ProductBX] = list(objs)
+        if not objs:
+            return []
+
+        # one session for the page, unresolved() and save_attribute_values() reuse its lookups
+        with import_session() as session:
+            # linked products in one query
+            product_field = cls._meta.get_field('product')
+            not_loaded = {obj.product_id for obj in objs if obj.product_id and not product_field.is_cached(obj)}
+            if not_loaded:
+                products = Product.objects.in_bulk(not_loaded)
+                for obj in objs:
+                    if obj.product_id in products:
+                        obj.product = products[obj.product_id]
+
+            session.load_sections(obj.section_id for obj in objs)
+            session.load_properties(key for obj in objs for key in (obj.properties or {}))
+
+            now = timezone.now()
+            products = []
+            for obj in objs:
+                product = obj.fill_product(obj.product or Product(product_class=session.product_class()))
+                if not product.slug:
+                    product.slug = slugify(product.get_title())
+                products.append(product)
+
+            with transaction.atomic():
+                to_create = [product for product in products if product.pk is None]
+                to_update = [product for product in products if product.pk is not None]
+
+                if to_create:
+                    Product.objects.bulk_create(to_create)
+                if to_update:
+                    for product in to_update:
+                        # auto_now of Product.save(), used by search reindex
+                        product.date_updated = now
+                    Product.objects.bulk_update(to_update, ['title', 'description', 'date_created', 'date_updated'])
+
+                linked = [obj for obj, product in zip(objs, products) if obj.product_id != product.pk]
+                for obj, product in zip(objs, products):
+                    obj.product = product
+                if linked:
+                    cls.objects.bulk_update(linked, ['product'])
+
+                cls.save_attribute_values(objs)
+
+                links = []
+                for obj in objs:
+                    section = session.section(obj.section_id)
+                    if section and section.category_id:
+                        links.append(ProductCategory(product_id=obj.product_id, category_id=section.category_id))
+                if links:
+                    ProductCategory.objects.bulk_create(links, ignore_conflicts=True)
+
+                prices = {obj.bitrix_id: obj for obj in objs if obj.get_price() is not None}
+                if prices:
+                    partner = session.partner()
+                    records = {
+                        record.partner_sku: record
+                        for record in StockRecord.objects.filter(partner=partner, partner_sku__in=prices.keys())
+                    }
+
+                    def fill(record, obj):
+                        record.product_id = obj.product_id
+                        record.price_excl_tax = obj.get_price()
+                        if obj.currency_id:
+                            record.price_currency = obj.currency_id
+                        record.date_updated = now
+
+                    to_create, to_update = [], []
+                    for sku, obj in prices.items():
+                        record = records.get(sku)
+                        if record is None:
+                            record = StockRecord(partner=partner, partner_sku=sku)
+                            to_create.append(record)
+                        else:
+                            to_update.append(record)
+                        fill(record, obj)
+
+                    if to_create:
+                        StockRecord.objects.bulk_create(to_create, ignore_conflicts=True)
+                        # rows inserted by concurrent import since the select above are skipped by insert,
+                        # they are updated like existing ones
+                        skus = [record.partner_sku for record in to_create]
+                        for record in StockRecord.objects.filter(partner=partner, partner_sku__in=skus):
+                            obj = prices[record.partner_sku]
+                            if record.product_id != obj.product_id or record.price_excl_tax != obj.get_price() or \
+                                    (obj.currency_id and record.price_currency != obj.currency_id):
+                                fill(record, obj)
+                                to_update.append(record)
+                    if to_update:
+                        StockRecord.objects.bulk_update(
+                            to_update, ['product', 'price_excl_tax', 'price_currency', 'date_updated']
                         )
-                    except Exception as e:
-                        pass
 
-        section = ProductSectionBX.objects.filter(bitrix_id=self.section_id).first()
+                # payload is applied partially, the next import of unchanged payload must apply it again
+                unresolved = cls.unresolved(objs)
+                if unresolved:
+                    for obj in unresolved:
+                        obj.payload_hash = None
+                    cls.objects.filter(pk__in=[obj.pk for obj in unresolved]).update(payload_hash=None)
 
-        if (section and section.category) and product.id:
-            """
-            Add category for product if it not exist
-            """
-            try:
-                product.categories.add(section.category)
-            except Exception as e:
-                pass
+            return products
 
-        if self.price and product.id:
-            StockRecord = get_model('partner', 'StockRecord')
-            Partner = get_model('partner', 'Partner')
+    @classmethod
+    def unresolved(cls, objs: List['ProductBX']) -> List['ProductBX']:
+        """
+        Products with section or properties not imported (or not linked to oscar objects) yet
+        """
+        session = current_session()
 
-            partner, _ = Partner.objects.get_or_create(
-                code="__bitrix24-bridge-partner"
-            )
+        result = []
+        for obj in objs:
+            if obj.section_id:
+                section = session.section(obj.section_id)
+                if section is None or section.category_id is None:
+                    result.append(obj)
+                    continue
 
-            stock_record, _ = StockRecord.objects.get_or_create(
-                partner=partner,
-                product=product,
-                partner_sku=self.bitrix_id,
-            )
+            if obj.properties:
+                props = session.properties_by_ids(obj.properties.keys())
+                if len(props) < len(obj.properties) or any(prop.product_attribute_id is None for prop in props):
+                    result.append(obj)
 
-            stock_record.price_excl_tax = Decimal(self.price)
-            stock_record.price_currency = self.currency_id
+        return result
 
-            stock_record.save()
+    @classmethod
+    def save_attribute_values(cls, objs: List['ProductBX']) -> Counter:
+        """
+        Save custom properties of products with linked ProductAttribute by bulk queries
+        Returns:
+            Counter - see AttributeValueWriter.write()
+        """
+        session = current_session()
+        writer = AttributeValueWriter(session)
 
-        return self.product
+        for obj in objs:
+            if not obj.properties or not obj.product_id:
+                continue
 
-    @staticmethod
-    def from_object(obj, force_save: bool = True):
+            for prop in session.properties_by_ids(obj.properties.keys()):
+                if prop.product_attribute:
+                    writer.add(obj.product, prop.product_attribute, property_value(obj.properties.get(prop.bitrix_id)))
+
+        return writer.write()
+
+    @classmethod
+    def from_object(cls, obj, force_save: bool = True):
         """
         Get ProductBX from Product
         :param obj: Product
         :param force_save: bool
         :return:
         """
-        product = (
-                ProductBX.objects.filter(product=obj).first()
-                or ProductPropertyBX()
-        )
+        return cls.from_objects([obj], force_save=force_save)[0]
+
+    @classmethod
+    def from_objects(cls, objs: Iterable, force_save: bool = True) -> List['ProductBX']:
+        """
+        Get ProductBX of many products. Related data is loaded by a constant number of queries:
+        bridge rows, sections of categories, attribute values with bitrix option ids
+        and stock records of bridge partner
+        Args:
+            objs: Iterable[Product]
+            force_save: bool - save bridge rows by bulk_save()
 
-        product.name = obj.title
-        product.description = obj.description or ""
+        Returns:
+            List[ProductBX] - in order of objs
+        """
+        ProductCategory = get_model('catalogue', 'ProductCategory')
+        ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+        StockRecord = get_model('partner', 'StockRecord')
+
+        objs = list(objs)
+        if not objs:
+            return []
+
+        ids = [obj.pk for obj in objs]
+
+        # the first bridge row of product wins
+        existing = {row.product_id: row for row in cls.objects.filter(product_id__in=ids).order_by('-pk')}
 
         """
-        Take the deepest Section  
+        Take the deepest Section
         """
-        product.section_id = (
-            ProductSectionBX.objects
-                .values_list('bitrix_id', flat=True)
-                .filter(category__in=obj.categories)
-                .order_by('-category__depth')
-                .first()
-        )
+        categories: Dict[int, List[int]] = {}
+        for product_id, category_id in ProductCategory.objects.filter(product_id__in=ids).values_list(
+                'product_id', 'category_id'):
+            categories.setdefault(product_id, []).append(category_id)
+
+        sections: Dict[int, Tuple[int, str]] = {
+            category_id: (depth, bitrix_id)
+            for category_id, depth, bitrix_id in ProductSectionBX.objects
+                .filter(category_id__in={c_id for c_ids in categories.values() for c_id in c_ids})
+                .exclude(bitrix_id=None)
+                .order_by('-pk')
+                .values_list('category_id', 'category__depth', 'bitrix_id')
+        }
+
+        # attribute id -> (property pk, property bitrix id)
+        props: Dict[int, Tuple[int, str]] = {
+            attribute_id: (prop_id, bitrix_id)
+            for attribute_id, prop_id, bitrix_id in ProductPropertyBX.objects
+                .exclude(bitrix_id=None)
+                .exclude(product_attribute=None)
+                .order_by('-pk')
+                .values_list('product_attribute_id', 'id', 'bitrix_id')
+        }
 
-        # cary on Convert datetime
-        try:
-            product.date_create = obj.date_created.isoformat()
-        except Exception as e:
-            pass
-        try:
-            product.timestamp_x = obj.date_updated.isoformat()
-        except Exception as e:
-            pass
-
-        # attributes = obj.attribute.get_queryset()
-
-        objs = (
-            ProductPropertyBX.objects
-                .values_list('bitrix_id', 'product_attribute__productattributevalue')
-                .filter(product_attribute__product=obj)
+        values = list(
+            ProductAttributeValue.objects
+                .filter(product_id__in=ids, attribute_id__in=props.keys())
+                .select_related('attribute', 'value_option')
+                .prefetch_related('value_multi_option')
         )
 
-        if obj:
-            product.properties = {
-                bid: {
-                    "VALUE": pav.value
-                }
-                for bid, pav in objs
+        # (property pk, option id) -> bitrix value id of list property
+        option_values: Dict[Tuple[int, int], str] = {}
+        if any(value.attribute.type in ('option', 'multi_option') for value in values):
+            option_values = {
+                (prop_id, option_id): value_id
+                for prop_id, option_id, value_id in AttributeOptionBX.objects
+                    .filter(prop_id__in={prop_id for prop_id, _ in props.values()})
+                    .values_list('prop_id', 'option_id', 'value_id')
             }
 
+        def option_value(prop_id: int, option) -> str:
+            return option_values.get((prop_id, option.pk), option.option)
+
+        properties: Dict[int, Dict[str, Dict]] = {}
+        for value_obj in values:
+            prop_id, bitrix_id = props[value_obj.attribute_id]
+            if value_obj.attribute.type == 'option':
+                value = option_value(prop_id, value_obj.value_option) if value_obj.value_option else None
+            elif value_obj.attribute.type == 'multi_option':
+                value = [option_value(prop_id, option) for option in value_obj.value_multi_option.all()]
+            else:
+                value = export_value(value_obj.value)
+            properties.setdefault(value_obj.product_id, {})[bitrix_id] = {"VALUE": value}
+
         """
         Try get price with currency
         """
-        Partner = get_model('partner', 'Partner')
-        partner, _ = Partner.objects.get_or_create(
-            code="__bitrix24-bridge-partner"
-        )
-        StockRecord = get_model('partner', 'StockRecord')
-        stock_record = StockRecord.objects.filter(partner=partner, product=obj).first()
+        stock_records = {
+            record.product_id: record
+            for record in StockRecord.objects
+                .filter(partner=current_session().partner(), product_id__in=ids)
+                .order_by('-pk')
+        }
+
+        result = []
+        for obj in objs:
+            product = existing.get(obj.pk) or ProductBX(product=obj)
+
+            product.name = obj.title
+            product.description = obj.description or ""
+
+            product_sections = [sections[c_id] for c_id in categories.get(obj.pk, []) if c_id in sections]
+            product.section_id = max(product_sections, key=lambda item: item[0])[1] if product_sections else None
+
+            product.date_create = obj.date_created
+            product.timestamp_x = obj.date_updated
+
+            product.properties = properties.get(obj.pk, {})
 
-        if stock_record:
-            product.price = str(stock_record.price_excl_tax)
-            product.currency_id = str(stock_record.price_currency)
+            stock_record = stock_records.get(obj.pk)
+            if stock_record:
+                product.price = stock_record.price_excl_tax
+                product.currency_id = str(stock_record.price_currency)
+
+            # local changes, next bitrix payload must be applied
+            product.payload_hash = None
+
+            result.append(product)
 
         if force_save:
-            product.save()
+            cls.bulk_save(result)
 
-        return product
+        return result
 
 
 class ProductPropertyBX(models.Model, BitrixSyncMixin):
     entity = "crm.product.property"
+    object_field = "product_attribute"
 
     bitrix_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Product ID"))
     name = models.CharField(max_length=256, verbose_name=_("Product name"))
 
     iblock_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("IBlock id"))
 
-    active = models.CharField(max_length=64, default="Y", null=True, blank=True, verbose_name=_("Active"))
+    active = models.BooleanField(default=True, verbose_name=_("Active"))
 
     sort = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Sort"))
 
@@ -296,7 +489,7 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
 
     col_count = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Col count"))
 
-    multiple = models.CharField(max_length=64, default="N", null=True, blank=True, verbose_name=_("Multiple"))
+    multiple = models.BooleanField(default=False, verbose_name=_("Multiple"))
 
     xml_id = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("Mnemonic code"))
 
@@ -304,7 +497,7 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
 
     link_iblock_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Link iblock id"))
 
-    is_required = models.CharField(max_length=256, null=True, blank=True, default="N", verbose_name=_("Is required"))
+    is_required = models.BooleanField(default=False, verbose_name=_("Is required"))
 
     user_type = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("User Type"))
 
@@ -314,6 +507,15 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
 
     product_attribute = models.ForeignKey('catalogue.ProductAttribute', null=True, blank=True, on_delete=models.CASCADE)
 
+    payload_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True,
+                                    verbose_name=_("Hash of last applied payload"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bitrix_id'], condition=models.Q(bitrix_id__isnull=False),
+                                    name='bitrix_productpropertybx_bitrix_id_uniq'),
+        ]
+
     # f'{PROPERTY_TYPE}_{USER_TYPE}'
     TYPE_MAPS = {
         "S": "text",
@@ -345,7 +547,6 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
         return result
 
     def to_object(self, force_save: bool = True):
-        AttributeOption = get_model('catalogue', 'AttributeOption')
         AttributeOptionGroup = get_model('catalogue', 'AttributeOptionGroup')
         ProductAttribute = get_model('catalogue', 'ProductAttribute')  # == ProductProperty
 
@@ -353,7 +554,7 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
 
         attribute.name = self.name
         attribute.code = self.bitrix_id
-        attribute.required = self.is_required == 'Y'
+        attribute.required = self.is_required
         attribute.type = self.get_oscar_type(self.property_type, self.user_type)
 
         if self.values:
@@ -365,14 +566,6 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
                 option_group.save()
 
                 attribute.option_group = option_group
-
-                option_group.options.get_queryset().delete()
-
-                options = [
-                    AttributeOption(option=option.get("VALUE"), group=option_group)
-                    for option in self.values.values()
-                ]
-                AttributeOption.objects.bulk_create(options)
             except Exception as e:
                 pass
 
@@ -381,39 +574,211 @@ class ProductPropertyBX(models.Model, BitrixSyncMixin):
             self.product_attribute = attribute
             self.save()
 
+            if attribute.option_group_id and self.values:
+                # failed options are raised, apply_many() resets payload hash so the next import retries them
+                with transaction.atomic():
+                    self.sync_options(attribute.option_group)
+
+            current_session().add_property(self)
+
         return self.product_attribute
 
+    def parse_values(self) -> Dict[str, Dict]:
+        """
+        Values of list property: value id -> {"ID": ..., "VALUE": ..., "XML_ID": ...}.
+        HStoreField keeps nested dicts as their str() after reloading from db
+        """
+        result = {}
+        for value_id, value in (self.values or {}).items():
+            if isinstance(value, str):
+                try:
+                    value = ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    value = {"VALUE": value}
+            if isinstance(value, dict) and value.get("VALUE") is not None:
+                result[str(value.get("ID") or value_id)] = value
+        return result
+
+    def sync_options(self, option_group) -> Counter:
+        """
+        Diff options of group with values of property by bitrix value id (or XML_ID if value id is new):
+        insert new options, rename changed ones, delete removed ones. Links are kept in AttributeOptionBX
+        Returns:
+            Counter - created, updated, deleted options
+        """
+        AttributeOption = get_model('catalogue', 'AttributeOption')
+
+        stats = Counter()
+        values = self.parse_values()
+
+        links: Dict[str, AttributeOptionBX] = {
+            link.value_id: link
+            for link in AttributeOptionBX.objects.select_related('option').filter(prop=self)
+        }
+        by_xml_id = {link.xml_id: link for link in links.values() if link.xml_id}
+        options: Dict[str, 'AttributeOption'] = {option.option: option for option in option_group.options.all()}
+
+        to_link: List[Tuple[str, Dict]] = []
+        renamed: List['AttributeOption'] = []
+        relinked: Dict[int, AttributeOptionBX] = {}
+        kept = set()
+
+        for value_id, value in values.items():
+            text = str(value["VALUE"])
+            xml_id = value.get("XML_ID")
+
+            link = links.get(value_id)
+            if link is None and xml_id and xml_id in by_xml_id and by_xml_id[xml_id].value_id not in values:
+                # value recreated in bitrix with new id
+                link = by_xml_id[xml_id]
+                link.value_id = value_id
+                relinked[link.pk] = link
+
+            if link is None:
+                to_link.append((value_id, value))
+                continue
+
+            if link.xml_id != xml_id:
+                link.xml_id = xml_id
+                relinked[link.pk] = link
+            if link.option.option != text:
+                if text in options:
+                    # the same text as other value
+                    link.option = options[text]
+                    relinked[link.pk] = link
+                else:
+                    options.pop(link.option.option, None)
+                    link.option.option = text
+                    options[text] = link.option
+                    renamed.append(link.option)
+            kept.add(link.option_id)
+
+        if renamed:
+            AttributeOption.objects.bulk_update(renamed, ['option'])
+            stats['updated'] += len(renamed)
+        if relinked:
+            AttributeOptionBX.objects.bulk_update(list(relinked.values()), ['value_id', 'xml_id', 'option'])
+
+        new_options = []
+        for value_id, value in to_link:
+            text = str(value["VALUE"])
+            if text not in options:
+                options[text] = AttributeOption(group=option_group, option=text)
+                new_options.append(options[text])
+        if new_options:
+            AttributeOption.objects.bulk_create(new_options)
+            stats['created'] += len(new_options)
+
+        if to_link:
+            AttributeOptionBX.objects.bulk_create([
+                AttributeOptionBX(prop=self, value_id=value_id, xml_id=value.get("XML_ID"),
+                                  option=options[str(value["VALUE"])])
+                for value_id, value in to_link
+            ])
+            kept.update(options[str(value["VALUE"])].id for _, value in to_link)
+
+        removed_values = [value_id for value_id in links if value_id not in values]
+        if removed_values:
+            AttributeOptionBX.objects.filter(prop=self, value_id__in=removed_values).delete()
+
+        # options of removed values and options left by previous full rewrites
+        removed = option_group.options.exclude(id__in=kept)
+        stats['deleted'] = removed.count()
+        if stats['deleted']:
+            removed.delete()
+
+        session = current_session()
+        session.options.invalidate(option_group.id)
+        session.option_values.invalidate(self.bitrix_id)
+
+        return stats
+
     @classmethod
     def from_object(cls, obj, force_save: bool = True):
         """
-        Get ProductSectionBX24 from Category
+        Get ProductPropertyBX from ProductAttribute
         :param obj:
         :param force_save:
         :return:
         """
-        prop = (
-                ProductPropertyBX.objects.filter(product_attribute=obj).first()
-                or ProductPropertyBX()
-        )
+        return cls.from_objects([obj], force_save=force_save)[0]
+
+    @classmethod
+    def from_objects(cls, objs: Iterable, force_save: bool = True) -> List['ProductPropertyBX']:
+        """
+        Get ProductPropertyBX of many attributes with options of all groups in one query.
+        Linked options keep their bitrix value ids, new ones are sent as "n0", "n1", ...
+        Args:
+            objs: Iterable[ProductAttribute]
+            force_save: bool - save bridge rows by bulk_save()
 
-        prop.name = obj.name
-        prop.is_required = "Y" if obj.required else "N"
-        prop.property_type, prop.user_type = cls().get_bitrix_type(obj.type)
+        Returns:
+            List[ProductPropertyBX] - in order of objs
+        """
+        AttributeOption = get_model('catalogue', 'AttributeOption')
 
-        if obj.type == "option":
-            options = obj.option_group.options.get_queryset() if obj.option_group else []
+        objs = list(objs)
+        if not objs:
+            return []
 
-            prop.values = {
-                f"n{i}": {
-                    "VALUE": op.option
-                }
-                for i, op in enumerate(options)
+        existing = {
+            prop.product_attribute_id: prop
+            for prop in cls.objects.filter(product_attribute_id__in=[obj.pk for obj in objs]).order_by('-pk')
+        }
+
+        group_ids = {obj.option_group_id for obj in objs if obj.type == "option" and obj.option_group_id}
+        options: Dict[int, List['AttributeOption']] = {}
+        for option in AttributeOption.objects.filter(group_id__in=group_ids).order_by('pk'):
+            options.setdefault(option.group_id, []).append(option)
+
+        value_ids: Dict[Tuple[int, int], str] = {}
+        if group_ids:
+            value_ids = {
+                (prop_id, option_id): value_id
+                for prop_id, option_id, value_id in AttributeOptionBX.objects
+                    .filter(prop_id__in=[prop.pk for prop in existing.values()])
+                    .values_list('prop_id', 'option_id', 'value_id')
             }
 
+        result = []
+        for obj in objs:
+            prop = existing.get(obj.pk) or ProductPropertyBX(product_attribute=obj)
+
+            prop.name = obj.name
+            prop.is_required = obj.required
+            prop.property_type, prop.user_type = cls().get_bitrix_type(obj.type)
+
+            if obj.type == "option":
+                prop.values = {
+                    value_ids.get((prop.pk, op.pk), f"n{i}"): {
+                        "VALUE": op.option
+                    }
+                    for i, op in enumerate(options.get(obj.option_group_id, []))
+                }
+
+            prop.payload_hash = None
+
+            result.append(prop)
+
         if force_save:
-            prop.save()
+            cls.bulk_save(result)
+
+        return result
+
+
+class AttributeOptionBX(models.Model):
+    """
+    Link of bitrix list property value to oscar AttributeOption
+    """
+    prop = models.ForeignKey(ProductPropertyBX, related_name='option_links', on_delete=models.CASCADE)
+    value_id = models.CharField(max_length=128, verbose_name=_("Value ID"))
+    xml_id = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("Mnemonic code"))
+    option = models.ForeignKey('catalogue.AttributeOption', related_name='+', on_delete=models.CASCADE)
 
-        return prop
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prop', 'value_id'], name='bitrix_attributeoptionbx_prop_value_uniq'),
+        ]
 
 
 class ProductSectionBX(models.Model, BitrixSyncMixin):
@@ -422,6 +787,7 @@ class ProductSectionBX(models.Model, BitrixSyncMixin):
     """
 
     entity = "crm.productsection"
+    object_field = "category"
     exclude_fields = {'id', 'category', 'bitrix_id'}
     include_fields = {'ID': 'bitrix_id'}
 
@@ -429,73 +795,227 @@ class ProductSectionBX(models.Model, BitrixSyncMixin):
 
     name = models.CharField(max_length=256, verbose_name=_("Section name"))
     catalog_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Catalog ID"))
-    section_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Associated section ID"))
+    section_id = models.CharField(max_length=128, null=True, blank=True, db_index=True,
+                                  verbose_name=_("Associated section ID"))
     xml_id = models.CharField(max_length=256, null=True, blank=True, verbose_name=_("Mnemonic code"))
 
     category = models.ForeignKey('catalogue.Category', null=True, blank=True, default=None,
                                  on_delete=models.CASCADE)
 
-    def to_object(self, force_save=True):
-        Category = get_model('catalogue', 'Category')  # == Section
-
-        category = self.category or Category(
-            name=self.name,
-            depth=1
-        )
-        parent = ProductSectionBX.objects.filter(bitrix_id=self.section_id).first()
+    payload_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True,
+                                    verbose_name=_("Hash of last applied payload"))
 
-        category_parent = parent.category if parent else None
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bitrix_id'], condition=models.Q(bitrix_id__isnull=False),
+                                    name='bitrix_productsectionbx_bitrix_id_uniq'),
+        ]
 
-        if category.id is not None and category_parent is not None:
-            try:
-                category.move(category_parent, 'first-child')
-            except Exception as e:
-                pass
-        elif category.id is None:
-            try:
-                if category_parent is None:
-                    Category.add_root(instance=category)
-                else:
-                    category_parent.add_child(instance=category)
-            except Exception as e:
-                pass
+    def to_object(self, force_save=True):
+        if not force_save:
+            return self.category
 
-        if force_save:
-            category.save()
-            self.category = category
-            self.save()
+        return self.to_objects([self])[0]
 
-        return self.category
+    @classmethod
+    def to_objects(cls, objs: Iterable['ProductSectionBX']) -> List:
+        """
+        Create, move and rename categories of sections, see CategoryTreeImporter
+        Returns:
+            List[Category] - in order of objs
+        """
+        objs: List[ProductSectionBX] = list(objs)
+        CategoryTreeImporter().run(objs)
+        return [obj.category for obj in objs]
 
-    @staticmethod
-    def from_object(obj: 'Category', force_save=True):
+    @classmethod
+    def from_object(cls, obj: 'Category', force_save=True):
         """
         Get ProductSectionBX24 from Category
         :param obj:
         :param force_save:
         :return:
         """
-        section = ProductSectionBX.objects.filter(category=obj).first()
+        return cls.from_objects([obj], force_save=force_save)[0]
 
-        if section:
-            section.name = obj.name
-        else:
-            section = ProductSectionBX(
-                name=obj.name,
-                category=obj,
-                catalog_id=getattr(settings, 'BITRIX24_CATALOG_ID', None)
-            )
+    @classmethod
+    def from_objects(cls, objs: Iterable['Category'], force_save: bool = True) -> List['ProductSectionBX']:
+        """
+        Get ProductSectionBX of many categories, parents are found by treebeard paths in one query
+        Args:
+            objs: Iterable[Category]
+            force_save: bool - save bridge rows by bulk_save()
 
-        obj_parent = obj.get_parent()
+        Returns:
+            List[ProductSectionBX] - in order of objs
+        """
+        Category = get_model('catalogue', 'Category')
 
-        if obj_parent is not None:
-            """
-            Try get parent section_id from ProductSectionBX24 object
-            """
-            parent = ProductSectionBX.objects.filter(category=obj_parent).first()
-            section.section_id = parent.bitrix_id if parent is not None else None
+        objs = list(objs)
+        if not objs:
+            return []
+
+        existing = {
+            section.category_id: section
+            for section in cls.objects.filter(category_id__in=[obj.pk for obj in objs]).order_by('-pk')
+        }
+
+        parent_paths = {obj.pk: obj.path[:-Category.steplen] for obj in objs if obj.depth > 1}
+        parents = dict(Category.objects.filter(path__in=set(parent_paths.values())).values_list('path', 'id'))
+
+        """
+        Try get parent section_id from ProductSectionBX24 object
+        """
+        parent_sections = dict(
+            cls.objects
+                .filter(category_id__in=parents.values())
+                .order_by('-pk')
+                .values_list('category_id', 'bitrix_id')
+        )
+
+        result = []
+        for obj in objs:
+            section = existing.get(obj.pk)
+
+            if section:
+                section.name = obj.name
+            else:
+                section = ProductSectionBX(
+                    name=obj.name,
+                    category=obj,
+                    catalog_id=getattr(settings, 'BITRIX24_CATALOG_ID', None)
+                )
+
+            parent_id = parents.get(parent_paths.get(obj.pk))
+            section.section_id = parent_sections.get(parent_id)
+
+            section.payload_hash = None
+
+            result.append(section)
 
         if force_save:
-            section.save()
+            cls.bulk_save(result)
+
+        return result
 
-        return section
+
+class OutboxMessage(models.Model):
+    """
+    Command waiting for publishing.
+
+    It is written in the transaction of data changes and published by `bitrix_outbox_flush` command,
+    so rolled back changes are never sent and web requests don't wait for broker.
+    """
+    payload = JSONField(verbose_name=_("Command"))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("Created"))
+
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_("Publish attempts"))
+    last_error = models.TextField(null=True, blank=True, verbose_name=_("Last error"))
+
+    class Meta:
+        ordering = ('id',)
+
+
+class SyncCursor(models.Model):
+    """
+    Watermark of incremental sync: the newest TIMESTAMP_X and ID of applied entity records
+    """
+    entity = models.CharField(max_length=128, unique=True, verbose_name=_("Entity"))
+    timestamp = models.DateTimeField(null=True, blank=True, verbose_name=_("Last applied TIMESTAMP_X"))
+    last_id = models.CharField(max_length=128, null=True, blank=True, verbose_name=_("Last applied ID"))
+    updated = models.DateTimeField(auto_now=True, verbose_name=_("Updated"))
+
+    @staticmethod
+    def sort_key(timestamp: datetime, bitrix_id: Optional[str]) -> Tuple[datetime, int]:
+        b_id = str(bitrix_id or '')
+        return timestamp, int(b_id) if b_id.isdigit() else 0
+
+    @classmethod
+    def advance(cls, entity: str, objs: List[BitrixSyncMixin], field: str = 'timestamp_x') -> 'SyncCursor':
+        """
+        Move cursor of entity to the newest of applied objects, the cursor never goes back.
+        Call it in transaction of applying objects, so cursor and data are committed together
+        Args:
+            entity: str - e.g. 'crm.product'
+            objs: List[BitrixSyncMixin] - applied page
+            field: str - watermark field of objs
+
+        Returns:
+            SyncCursor
+        """
+        with transaction.atomic():
+            cursor, _ = cls.objects.select_for_update().get_or_create(entity=entity)
+
+            newest = max(
+                (
+                    cls.sort_key(getattr(obj, field), obj.bitrix_id)
+                    for obj in objs
+                    if isinstance(getattr(obj, field, None), datetime)
+                ),
+                default=None
+            )
+
+            if newest is not None and (
+                    cursor.timestamp is None or newest > cls.sort_key(cursor.timestamp, cursor.last_id)
+            ):
+                cursor.timestamp = newest[0]
+                cursor.last_id = str(newest[1])
+                cursor.save()
+
+        return cursor
+
+
+class SyncRun(models.Model):
+    """
+    Full resync run of `bitrix_full_sync`
+    """
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("Created"))
+    finished = models.DateTimeField(null=True, blank=True, verbose_name=_("Finished"))
+
+    class Meta:
+        ordering = ('-id',)
+
+
+class SyncPage(models.Model):
+    """
+    Page of entity list requested by full resync, completed by bitrix_sync_listener
+    in the transaction of applied rows
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = (
+        (PENDING, _("Pending")),
+        (SENT, _("Sent")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+
+    run = models.ForeignKey(SyncRun, related_name='pages', on_delete=models.CASCADE)
+    entity = models.CharField(max_length=128, verbose_name=_("Entity"))
+    start = models.PositiveIntegerField(verbose_name=_("Offset"))
+
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING, verbose_name=_("Status"))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_("Request attempts"))
+
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name=_("Total rows of entity"))
+    rows = models.PositiveIntegerField(null=True, blank=True, verbose_name=_("Applied rows"))
+
+    sent = models.DateTimeField(null=True, blank=True, verbose_name=_("Sent"))
+    done = models.DateTimeField(null=True, blank=True, verbose_name=_("Done"))
+
+    class Meta:
+        ordering = ('start',)
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'entity', 'start'], name='bitrix_syncpage_run_entity_start_uniq'),
+        ]
+
+    @classmethod
+    def complete(cls, page_id: int, rows: int, total: Optional[int] = None):
+        cls.objects.filter(id=page_id).update(status=cls.DONE, rows=rows, total=total, done=timezone.now())
+
+    @classmethod
+    def fail(cls, page_id: int):
+        cls.objects.filter(id=page_id).exclude(status=cls.DONE).update(status=cls.FAILED)
@@ -0,0 +1,119 @@
+import threading
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from django.db import models
+
+from bitrix24_bridge.utils import parse_datetime
+
+"""
+Normalizer of bitrix payloads to typed model columns
+"""
+
+
+def to_flag(value: Any) -> bool:
+    """
+    Bitrix "Y"/"N" flag
+    """
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().upper()
+    if text in ('Y', '1', 'TRUE'):
+        return True
+    if text in ('N', '0', 'FALSE'):
+        return False
+    raise ValueError(f"Not a flag: {value}")
+
+
+def decimal_converter(field: models.DecimalField) -> Callable[[Any], Decimal]:
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+
+    def to_decimal(value: Any) -> Decimal:
+        number = Decimal(str(value).strip().replace(',', '.')).quantize(exponent)
+        if not number.is_finite() or abs(number) >= limit:
+            raise ValueError(f"Decimal out of range: {value}")
+        return number
+
+    return to_decimal
+
+
+def to_datetime(value: Any) -> datetime:
+    result = parse_datetime(value)
+    if result is None:
+        raise ValueError(f"Wrong datetime: {value}")
+    return result
+
+
+def field_converter(field: models.Field):
+    if isinstance(field, models.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, models.DateTimeField):
+        return to_datetime
+    if isinstance(field, models.BooleanField):
+        return to_flag
+    return None
+
+
+class PayloadNormalizer:
+    """
+    Converts typed columns of a page of model kwargs (see BitrixSyncMixin.defaults_from_data()),
+    column by column with converter of model field looked up once per page.
+
+    Empty values become NULL (field default for not nullable columns), broken values are dropped
+    from kwargs, so stored values are kept, and counted in `errors` by field name.
+
+    Usage:
+        normalizer = PayloadNormalizer(ProductBX)
+        rows = normalizer.normalize(rows)
+        normalizer.errors  # Counter({'price': 2})
+
+    :param model: django model
+    """
+
+    def __init__(self, model):
+        self.columns: Dict[str, Callable[[Any], Any]] = {}
+        self.empty: Dict[str, Any] = {}
+        self.errors: Counter = Counter()
+
+        for field in model._meta.concrete_fields:
+            converter = field_converter(field)
+            if converter is None:
+                continue
+            self.columns[field.name] = converter
+            self.empty[field.name] = None if field.null or not field.has_default() else field.get_default()
+
+    def normalize(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Convert rows in place
+        Returns:
+            List[Dict] - rows
+        """
+        for name, convert in self.columns.items():
+            empty = self.empty[name]
+            for row in rows:
+                if name not in row:
+                    continue
+                value = row[name]
+                if value is None or value == '':
+                    row[name] = empty
+                    continue
+                try:
+                    row[name] = convert(value)
+                except (ValueError, TypeError, ArithmeticError):
+                    self.errors[name] += 1
+                    del row[name]
+        return rows
+
+
+# entity -> field -> count of dropped broken values
+errors: Dict[str, Counter] = {}
+_errors_lock = threading.Lock()
+
+
+def count_errors(entity: str, counter: Counter):
+    if counter:
+        with _errors_lock:
+            errors.setdefault(entity, Counter()).update(counter)
@@ -0,0 +1,86 @@
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.amqp.amqp import PublishResult, get_var
+
+"""
+Transactional outbox of commands
+"""
+
+
+def outbox_enabled() -> bool:
+    return bool(get_var('BB_OUTBOX_ENABLED')())
+
+
+def enqueue(commands: Iterable[Dict]) -> int:
+    """
+    Write commands to outbox in the current transaction
+    Returns:
+        int - count of written commands
+    """
+    OutboxMessage = get_model('bitrix', 'OutboxMessage')
+
+    messages = OutboxMessage.objects.bulk_create(
+        OutboxMessage(payload=command)
+        for command in commands
+    )
+    return len(messages)
+
+
+def last_id() -> Optional[int]:
+    """
+    Id of the newest outbox command, None if outbox is empty
+    """
+    OutboxMessage = get_model('bitrix', 'OutboxMessage')
+    return OutboxMessage.objects.order_by('-id').values_list('id', flat=True).first()
+
+
+def drain(sender: Callable[[List[Dict]], PublishResult], batch_size: int = 500,
+          until_id: Optional[int] = None) -> PublishResult:
+    """
+    Publish the oldest batch of outbox commands.
+
+    Rows are locked with SKIP LOCKED. Commands before the first failed one are deleted,
+    the failed one and all after it stay in outbox with increased attempts and are published again
+    in the same order by the next drain, so commands of an entity are never reordered
+    (commands after the failed one may be delivered twice). Order holds for a single flushing process.
+
+    Args:
+        sender: Callable[[List[Dict]], PublishResult] - e.g. BitrixSyncMixin.publish_commands
+        batch_size: int
+        until_id: Optional[int] - publish only commands with id up to this one, see last_id()
+
+    Returns:
+        PublishResult - sent is count of deleted commands, failed contains (index, command) of kept ones
+    """
+    OutboxMessage = get_model('bitrix', 'OutboxMessage')
+
+    with transaction.atomic():
+        queryset = OutboxMessage.objects.select_for_update(skip_locked=True).order_by('id')
+        if until_id is not None:
+            queryset = queryset.filter(id__lte=until_id)
+        messages = list(queryset[:batch_size])
+
+        if not messages:
+            return PublishResult()
+
+        payloads = [message.payload for message in messages]
+        published = sender(payloads)
+
+        first_failed = min((i for i, _ in published.failed), default=len(messages))
+
+        OutboxMessage.objects.filter(id__in=[message.id for message in messages[:first_failed]]).delete()
+
+        if first_failed < len(messages):
+            OutboxMessage.objects.filter(id__in=[message.id for message in messages[first_failed:]]).update(
+                attempts=F('attempts') + 1,
+                last_error="Not confirmed by broker",
+            )
+
+    return PublishResult(
+        sent=first_failed,
+        failed=[(i, payloads[i]) for i in range(first_failed, len(messages))],
+    )
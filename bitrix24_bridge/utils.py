@@ -0,0 +1,71 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.utils import dateparse, timezone
+
+
+def flatten_params(params: Any, prefix: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Flatten nested params in PHP style: {"fields": {"NAME": "x"}} -> [("fields[NAME]", "x")]
+    Args:
+        params: Any - dict, list or scalar
+        prefix: Optional[str] - key of params in parent
+
+    Returns:
+        List[Tuple[str, str]]
+    """
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, (list, tuple)):
+        items = enumerate(params)
+    else:
+        if params is None:
+            value = ""
+        elif isinstance(params, bool):
+            value = "1" if params else "0"
+        else:
+            value = str(params)
+        return [(prefix, value)] if prefix is not None else []
+
+    result = []
+    for k, v in items:
+        key = f"{prefix}[{k}]" if prefix is not None else str(k)
+        result.extend(flatten_params(v, key))
+    return result
+
+
+def http_build_query(params: Optional[Dict]) -> str:
+    """
+    PHP http_build_query analog, used for Bitrix24 batch commands
+    """
+    return "&".join(
+        f"{quote(k, safe='[]')}={quote(v, safe='')}"
+        for k, v in flatten_params(params or {})
+    )
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """
+    Bitrix24 datetime, e.g. "2019-07-17T14:51:00+03:00", to datetime in USE_TZ mode of project
+    Returns:
+        Optional[datetime] - None if value is empty or broken
+    """
+    if value is None or value == "":
+        return None
+
+    if not isinstance(value, datetime):
+        try:
+            value = dateparse.parse_datetime(str(value).strip())
+        except ValueError:
+            return None
+        if value is None:
+            return None
+
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    elif not settings.USE_TZ and timezone.is_aware(value):
+        value = timezone.make_naive(value)
+
+    return value
@@ -0,0 +1,309 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import ujson
+from django.db import close_old_connections, connections
+
+"""
+Parallel processing of consumed messages
+"""
+
+logger = logging.getLogger(__name__)
+
+# Task statuses
+DONE = 'done'
+FAILED = 'failed'
+BROKEN = 'broken'
+# not processed, returned to queue
+REQUEUED = 'requeued'
+
+# Entities which others depend on: message of these entities is processed alone,
+# after all previous messages and before all next ones.
+# E.g. product must not be processed before its section
+ORDERED_ENTITIES = {'crm.productsection', 'crm.product.property', 'batch'}
+
+
+def run_task(process: Callable[[Dict], None], message: Dict) -> str:
+    try:
+        process(message)
+    except Exception as e:
+        logger.error(str(e))
+        return FAILED
+    finally:
+        close_old_connections()
+    return DONE
+
+
+def worker_main(process: Callable[[Dict], None], tasks, results, threads: int):
+    """
+    Worker process loop, tasks are (tag, message), None stops worker after running tasks
+    """
+    # shutdown is controlled by supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def done(tag, future):
+        try:
+            status = future.result()
+        except Exception:
+            status = FAILED
+        results.put((tag, status))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            tag, message = task
+            future = executor.submit(run_task, process, message)
+            future.add_done_callback(lambda f, tag=tag: done(tag, f))
+
+    connections.close_all()
+
+
+class ThreadWorkerPool:
+    """
+    Handle messages by threads of current process
+    """
+
+    def __init__(self, process: Callable[[Dict], None], threads: int = 1):
+        self.process = process
+        self.threads = max(1, threads)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.on_done: Optional[Callable[[int, str], None]] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.threads
+
+    def start(self, on_done: Callable[[int, str], None]):
+        self.on_done = on_done
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='bitrix-handler')
+
+    def submit(self, tag: int, message: Dict):
+        future = self.executor.submit(run_task, self.process, message)
+        future.add_done_callback(lambda f: self.on_done(tag, f.result()))
+
+    def stop(self, timeout: Optional[float] = None):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class ProcessWorkerPool:
+    """
+    Supervised pool of worker processes, each worker handles messages by `threads` threads.
+
+    Crashed worker is restarted, its unfinished messages are reported as FAILED.
+    """
+
+    def __init__(self, process: Callable[[Dict], None], workers: int, threads: int = 1):
+        self.process = process
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+
+        # handlers run in forked copy of listener
+        self.context = multiprocessing.get_context('fork')
+        self.results = self.context.Queue()
+
+        # index -> (process, tasks queue)
+        self.processes: List[Tuple[multiprocessing.Process, multiprocessing.Queue]] = []
+        # tag -> worker index
+        self.assigned: Dict[int, int] = {}
+        self.lock = threading.Lock()
+
+        self.on_done: Optional[Callable[[int, str], None]] = None
+        self.reader: Optional[threading.Thread] = None
+        self.stopping = False
+
+    @property
+    def capacity(self) -> int:
+        return self.workers * self.threads
+
+    def spawn(self) -> Tuple[multiprocessing.Process, multiprocessing.Queue]:
+        # connections must not be shared with children
+        connections.close_all()
+
+        tasks = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main,
+            args=(self.process, tasks, self.results, self.threads),
+            daemon=True,
+        )
+        process.start()
+        return process, tasks
+
+    def start(self, on_done: Callable[[int, str], None]):
+        self.on_done = on_done
+        self.processes = [self.spawn() for _ in range(self.workers)]
+
+        self.reader = threading.Thread(target=self.read_results, name='bitrix-worker-results', daemon=True)
+        self.reader.start()
+
+    def submit(self, tag: int, message: Dict):
+        with self.lock:
+            load = [0] * len(self.processes)
+            for index in self.assigned.values():
+                load[index] += 1
+            index = min(range(len(self.processes)), key=load.__getitem__)
+
+            self.assigned[tag] = index
+            self.processes[index][1].put((tag, message))
+
+    def finish(self, tag: int, status: str):
+        with self.lock:
+            if self.assigned.pop(tag, None) is None:
+                # already failed by supervisor
+                return
+        self.on_done(tag, status)
+
+    def supervise(self):
+        """
+        Restart dead workers
+        """
+        if self.stopping:
+            return
+
+        for index, (process, tasks) in enumerate(self.processes):
+            if process.is_alive():
+                continue
+
+            logger.error(f"Worker {process.pid} exited with code {process.exitcode}, restart it")
+
+            with self.lock:
+                lost = [tag for tag, i in self.assigned.items() if i == index]
+            for tag in lost:
+                self.finish(tag, FAILED)
+
+            worker = self.spawn()
+            with self.lock:
+                self.processes[index] = worker
+
+    def read_results(self):
+        while not (self.stopping and not self.assigned):
+            try:
+                tag, status = self.results.get(timeout=1)
+            except queue.Empty:
+                pass
+            else:
+                self.finish(tag, status)
+
+            self.supervise()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stopping = True
+
+        for process, tasks in self.processes:
+            tasks.put(None)
+
+        for process, tasks in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        # tasks of terminated workers
+        with self.lock:
+            lost = list(self.assigned)
+        for tag in lost:
+            self.finish(tag, FAILED)
+
+        if self.reader is not None:
+            self.reader.join(timeout)
+
+
+class OrderedDispatcher:
+    """
+    Pass consumed messages to worker pool without blocking connection I/O thread.
+
+    Messages of ORDERED_ENTITIES wait for all previous messages and block next ones,
+    other messages are processed in parallel up to pool capacity.
+
+    :param pool: ThreadWorkerPool or ProcessWorkerPool
+    :param settle: Callable[[int, str], None] - called from pool threads with (delivery tag, status)
+    """
+
+    def __init__(self, pool, settle: Callable[[int, str], None], ordered_entities=None):
+        self.pool = pool
+        self.settle = settle
+        self.ordered_entities = ORDERED_ENTITIES if ordered_entities is None else ordered_entities
+
+        self.intake: queue.Queue = queue.Queue()
+        # messages submitted to pool and not done yet
+        self.running = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.pool.start(self.done)
+        self.thread = threading.Thread(target=self.run, name='bitrix-dispatcher', daemon=True)
+        self.thread.start()
+
+    def put(self, tag: int, body: bytes):
+        self.intake.put((tag, body))
+
+    def done(self, tag: int, status: str):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+        self.settle(tag, status)
+
+    @property
+    def busy(self) -> bool:
+        return self.running > 0
+
+    def run(self):
+        while True:
+            item = self.intake.get()
+            if item is None:
+                break
+
+            tag, body = item
+            try:
+                message = ujson.loads(body)
+            except Exception as e:
+                logger.error(str(e))
+                self.settle(tag, BROKEN)
+                continue
+
+            ordered = message.get('entity') in self.ordered_entities
+
+            with self.condition:
+                if ordered:
+                    self.condition.wait_for(lambda: self.running == 0)
+                else:
+                    self.condition.wait_for(lambda: self.running < self.pool.capacity)
+                self.running += 1
+
+            try:
+                self.pool.submit(tag, message)
+            except Exception as e:
+                logger.error(str(e))
+                self.done(tag, FAILED)
+                continue
+
+            if ordered:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.running == 0)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop dispatching, not dispatched messages are settled as REQUEUED
+        """
+        while True:
+            try:
+                item = self.intake.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.settle(item[0], REQUEUED)
+
+        self.intake.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        self.pool.stop(timeout)
@@ -19,6 +19,12 @@ setup(
         'requests>=1.0',
         'django-oscar>=2.0',
     ],
+    extras_require={
+        'benchmark': [
+            'factory-boy>=2.12',
+            'Faker>=1.0',
+        ],
+    },
     # See http://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
         'Development Status :: 1 - Planning',
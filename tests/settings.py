@@ -0,0 +1,74 @@
+import os
+
+from oscar.defaults import *  # noqa
+
+"""
+Settings of test suite:
+    django-admin test tests --settings=tests.settings
+
+Database tests need PostgreSQL with hstore extension, see BB_TEST_DB_* variables
+"""
+
+SECRET_KEY = 'bitrix24-bridge-tests'
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.sites',
+    'django.contrib.flatpages',
+    'django.contrib.postgres',
+
+    'oscar',
+    'oscar.apps.analytics',
+    'oscar.apps.checkout',
+    'oscar.apps.address',
+    'oscar.apps.shipping',
+    'oscar.apps.catalogue',
+    'oscar.apps.catalogue.reviews',
+    'oscar.apps.partner',
+    'oscar.apps.basket',
+    'oscar.apps.payment',
+    'oscar.apps.offer',
+    'oscar.apps.order',
+    'oscar.apps.customer',
+    'oscar.apps.search',
+    'oscar.apps.voucher',
+    'oscar.apps.wishlists',
+    'oscar.apps.dashboard',
+    'oscar.apps.dashboard.reports',
+    'oscar.apps.dashboard.users',
+    'oscar.apps.dashboard.orders',
+    'oscar.apps.dashboard.catalogue',
+    'oscar.apps.dashboard.offers',
+    'oscar.apps.dashboard.partners',
+    'oscar.apps.dashboard.pages',
+    'oscar.apps.dashboard.ranges',
+    'oscar.apps.dashboard.reviews',
+    'oscar.apps.dashboard.vouchers',
+    'oscar.apps.dashboard.communications',
+    'oscar.apps.dashboard.shipping',
+    'treebeard',
+
+    'bitrix24_bridge',
+]
+
+SITE_ID = 1
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('BB_TEST_DB_NAME', 'bitrix24_bridge'),
+        'USER': os.environ.get('BB_TEST_DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('BB_TEST_DB_PASSWORD', ''),
+        'HOST': os.environ.get('BB_TEST_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('BB_TEST_DB_PORT', '5432'),
+    }
+}
+
+HAYSTACK_CONNECTIONS = {
+    'default': {
+        'ENGINE': 'haystack.backends.simple_backend.SimpleEngine',
+    },
+}
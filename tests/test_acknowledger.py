@@ -0,0 +1,77 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from bitrix24_bridge.amqp.amqp import Acknowledger
+
+
+class AcknowledgerTest(SimpleTestCase):
+
+    def make_acknowledger(self, batch_size: int = 1, interval=None, tags=(1, 2, 3, 4)) -> Acknowledger:
+        acknowledger = Acknowledger(mock.Mock(), mock.Mock(is_open=True), batch_size=batch_size, interval=interval)
+        for tag in tags:
+            acknowledger.track(tag)
+        return acknowledger
+
+    def test_multiple_ack_of_batch(self):
+        acknowledger = self.make_acknowledger(batch_size=3)
+
+        acknowledger.ack(1)
+        acknowledger.ack(2)
+        acknowledger.channel.basic_ack.assert_not_called()
+
+        acknowledger.ack(3)
+        acknowledger.channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        self.assertEqual(list(acknowledger.outstanding), [4])
+
+    def test_ack_stops_at_first_not_settled(self):
+        acknowledger = self.make_acknowledger(batch_size=2)
+
+        acknowledger.ack(1)
+        acknowledger.ack(3)
+
+        acknowledger.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        self.assertEqual(list(acknowledger.outstanding), [2, 3, 4])
+        self.assertEqual(acknowledger.acked, {3})
+
+    def test_out_of_order_ack_is_sent_when_gap_is_settled(self):
+        acknowledger = self.make_acknowledger(batch_size=1)
+
+        acknowledger.ack(2)
+        acknowledger.channel.basic_ack.assert_not_called()
+
+        acknowledger.ack(1)
+        acknowledger.channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+    def test_nacked_message_is_skipped(self):
+        acknowledger = self.make_acknowledger(batch_size=2)
+
+        acknowledger.nack(1, requeue=True)
+        acknowledger.channel.basic_nack.assert_called_once_with(delivery_tag=1, multiple=False, requeue=True)
+
+        acknowledger.ack(2)
+        acknowledger.ack(3)
+
+        acknowledger.channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        self.assertEqual(list(acknowledger.outstanding), [4])
+        self.assertFalse(acknowledger.nacked)
+
+    def test_only_nacked_messages_are_not_acked(self):
+        acknowledger = self.make_acknowledger(batch_size=1, tags=(1, 2))
+
+        acknowledger.nack(1, requeue=False)
+        acknowledger.nack(2, requeue=False)
+        acknowledger.flush()
+
+        acknowledger.channel.basic_ack.assert_not_called()
+        self.assertFalse(acknowledger.outstanding)
+
+    def test_interval_timer(self):
+        acknowledger = self.make_acknowledger(batch_size=10, interval=0.5)
+
+        acknowledger.ack(1)
+        acknowledger.connection.call_later.assert_called_once_with(0.5, acknowledger.on_timer)
+
+        acknowledger.on_timer()
+        acknowledger.channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        self.assertIsNone(acknowledger.timer)
@@ -0,0 +1,82 @@
+from unittest import mock
+
+import pika
+from django.test import SimpleTestCase
+
+from bitrix24_bridge.amqp.amqp import ConfirmedBatch, confirm_delivery_async
+
+
+def confirm_frame(method_class, delivery_tag: int, multiple: bool = False):
+    return mock.Mock(method=method_class(delivery_tag=delivery_tag, multiple=multiple))
+
+
+class ConfirmDeliveryAsyncTest(SimpleTestCase):
+
+    def test_enabled_on_underlying_channel(self):
+        channel = mock.Mock()
+        callback = mock.Mock()
+
+        with mock.patch.object(pika, '__version__', '1.0.1'):
+            self.assertTrue(confirm_delivery_async(channel, callback))
+
+        channel._impl.confirm_delivery.assert_called_once_with(ack_nack_callback=callback)
+        channel.confirm_delivery.assert_not_called()
+
+    def test_unsupported_version(self):
+        channel = mock.Mock()
+
+        with mock.patch.object(pika, '__version__', '2.0.0'):
+            self.assertFalse(confirm_delivery_async(channel, mock.Mock()))
+
+        channel._impl.confirm_delivery.assert_not_called()
+
+    def test_pinned_pika_has_private_channel(self):
+        # fails when installed pika drops BlockingChannel._impl, see ASYNC_CONFIRMS_PIKA_VERSIONS
+        from pika.adapters.blocking_connection import BlockingChannel
+        from pika.channel import Channel
+
+        self.assertIn('_impl', BlockingChannel.__init__.__code__.co_names)
+        self.assertIn('ack_nack_callback', Channel.confirm_delivery.__code__.co_varnames)
+
+
+class ConfirmedBatchTest(SimpleTestCase):
+
+    def make_batch(self, asynchronous: bool = True, **kwargs) -> ConfirmedBatch:
+        producer = mock.Mock()
+        with mock.patch('bitrix24_bridge.amqp.amqp.confirm_delivery_async', return_value=asynchronous):
+            return ConfirmedBatch(producer, window=kwargs.get('window', 10), timeout=1).open()
+
+    def test_multiple_ack_and_nack(self):
+        batch = self.make_batch()
+        for message in 'abc':
+            batch.send(message)
+
+        batch.on_confirm(confirm_frame(pika.spec.Basic.Ack, 2, multiple=True))
+        batch.on_confirm(confirm_frame(pika.spec.Basic.Nack, 3))
+        batch.close()
+
+        self.assertEqual(batch.result.sent, 2)
+        self.assertEqual(batch.result.failed, [(2, 'c')])
+
+    def test_synchronous_confirms(self):
+        batch = self.make_batch(asynchronous=False)
+        batch.channel.confirm_delivery.assert_called_once_with()
+        batch.producer.publish.side_effect = [None, pika.exceptions.NackError([]), None]
+
+        for message in 'abc':
+            batch.send(message)
+        batch.close()
+
+        self.assertEqual(batch.result.sent, 2)
+        self.assertEqual(batch.result.failed, [(1, 'b')])
+
+    def test_connection_lost(self):
+        batch = self.make_batch()
+        batch.send('a')
+        batch.producer.publish.side_effect = pika.exceptions.AMQPConnectionError()
+        batch.send('b')
+        batch.send('c')
+        batch.close()
+
+        self.assertEqual(batch.result.sent, 0)
+        self.assertEqual([index for index, message in batch.result.failed], [0, 1, 2])
@@ -0,0 +1,147 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from bitrix24_bridge.batch import pack_commands, unpack_results
+from bitrix24_bridge.management.commands.bitrix_sync_listener import Command
+
+
+def command(i: int, method: str = 'crm.product.update') -> dict:
+    return {"method": method, "action": "update", "params": {"id": i}, "meta": {"n": i}}
+
+
+class PackCommandsTest(SimpleTestCase):
+
+    def test_split_by_size(self):
+        batches = pack_commands([command(i) for i in range(5)], size=2)
+
+        self.assertEqual([len(batch['params']['cmd']) for batch in batches], [2, 2, 1])
+        self.assertEqual(list(batches[2]['params']['cmd']), ['cmd4'])
+
+    def test_size_is_limited_by_bitrix(self):
+        batches = pack_commands([command(i) for i in range(60)], size=100)
+
+        self.assertEqual([len(batch['params']['cmd']) for batch in batches], [50, 10])
+
+    def test_batch_command(self):
+        batch, = pack_commands([command(7)], halt=True)
+
+        self.assertEqual(batch['method'], 'batch')
+        self.assertEqual(batch['params']['halt'], 1)
+        self.assertEqual(batch['params']['cmd'], {'cmd0': 'crm.product.update?id=7'})
+        self.assertEqual(
+            batch['meta']['commands'],
+            {'cmd0': {"method": "crm.product.update", "action": "update", "meta": {"n": 7}}}
+        )
+
+    def test_empty(self):
+        self.assertEqual(pack_commands([]), [])
+
+
+class UnpackResultsTest(SimpleTestCase):
+
+    def setUp(self):
+        batch, = pack_commands([command(0), command(1), command(2, method='crm.product.list')], halt=True)
+        self.meta = batch['meta']
+
+    def test_results_errors_and_halt(self):
+        data = {
+            "status_code": 200,
+            "meta": self.meta,
+            "result": {
+                "result": {"cmd0": True},
+                "result_error": {"cmd1": {"error": "NOT_FOUND"}},
+                "result_total": [],
+                "result_next": [],
+            },
+        }
+
+        parts = unpack_results(data)
+
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[0], {
+            "status_code": 200, "result": True,
+            "method": "crm.product.update", "action": "update", "meta": {"n": 0},
+        })
+        self.assertEqual(parts[1]['status_code'], 400)
+        self.assertEqual(parts[1]['error'], {"error": "NOT_FOUND"})
+        self.assertEqual(parts[1]['meta'], {"n": 1})
+
+    def test_list_total_and_next(self):
+        data = {
+            "status_code": 200,
+            "result": {
+                "result": {"cmd2": [{"ID": "1"}]},
+                "result_total": {"cmd2": 120},
+                "result_next": {"cmd2": 50},
+            },
+        }
+
+        part, = unpack_results(data, meta=self.meta)
+
+        self.assertEqual(part['method'], 'crm.product.list')
+        self.assertEqual(part['total'], 120)
+        self.assertEqual(part['next'], 50)
+
+    def test_empty_result(self):
+        self.assertEqual(unpack_results({"status_code": 200, "result": {"result": []}}, meta=self.meta), [])
+
+
+@override_settings(BB_TRANSPORT='memory')
+class BatchFanOutTest(SimpleTestCase):
+
+    def setUp(self):
+        self.command = Command()
+        self.product = self.command.HANDLERS['crm.product'] = mock.Mock()
+        self.section = self.command.HANDLERS['crm.productsection'] = mock.Mock()
+
+        batch, = pack_commands([
+            command(0),
+            {"method": "crm.productsection.add", "action": "add", "params": {}, "meta": {"bridge_id": 5}},
+        ])
+        self.message = {
+            "entity": "batch",
+            "result": [{
+                "method": "batch",
+                "status_code": 200,
+                "meta": batch['meta'],
+                "result": {"result": {"cmd0": True, "cmd1": 42}},
+            }],
+        }
+
+    def test_parts_reach_entity_handlers(self):
+        self.command.process_message(self.message)
+
+        (product,), _ = self.product.call_args
+        self.assertEqual(product['entity'], 'crm.product')
+        self.assertEqual(product['result'][0]['method'], 'crm.product.update')
+        (section,), _ = self.section.call_args
+        self.assertEqual(section['entity'], 'crm.productsection')
+        self.assertEqual(section['result'][0]['result'], 42)
+        self.assertEqual(section['result'][0]['meta'], {"bridge_id": 5})
+
+    def test_failed_part_does_not_redeliver_applied_parts(self):
+        self.product.side_effect = ValueError("broken product")
+
+        self.command.process_message(self.message)
+
+        self.section.assert_called_once()
+        self.assertEqual(self.command.HANDLERS['batch'].failed, 1)
+
+    def test_batch_without_applied_parts_is_raised(self):
+        self.product.side_effect = ValueError("broken product")
+        self.section.side_effect = ValueError("broken section")
+
+        with self.assertRaises(ValueError):
+            self.command.process_message(self.message)
+
+        self.assertEqual(self.command.HANDLERS['batch'].failed, 0)
+
+    def test_failed_batch_is_skipped(self):
+        self.message['result'][0]['status_code'] = 500
+
+        with self.assertLogs('bitrix24_bridge.handlers', level='WARNING'):
+            self.command.process_message(self.message)
+
+        self.product.assert_not_called()
+        self.section.assert_not_called()
@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase, TestCase
+
+from bitrix24_bridge.cache import LRUCache, current_session, has_session, import_session
+from bitrix24_bridge.models import ProductSectionBX
+
+
+class LRUCacheTest(SimpleTestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_set_refreshes_key(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 10)
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 10)
+        self.assertNotIn('b', cache)
+
+    def test_default(self):
+        cache = LRUCache()
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 0), 0)
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        cache.invalidate('a')
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+class ImportSessionTest(TestCase):
+
+    def test_nested_sessions_share_cache(self):
+        self.assertFalse(has_session())
+
+        with import_session() as session:
+            self.assertTrue(has_session())
+            self.assertIs(current_session(), session)
+
+            with import_session() as nested:
+                self.assertIs(nested, session)
+
+        self.assertFalse(has_session())
+        self.assertIsNot(current_session(), session)
+
+    def test_sections_are_fetched_once(self):
+        ProductSectionBX.objects.create(bitrix_id='1', name='first')
+
+        with import_session() as session:
+            with self.assertNumQueries(1):
+                session.load_sections(['1', '2'])
+
+            with self.assertNumQueries(0):
+                self.assertEqual(session.section(1).name, 'first')
+                self.assertIsNone(session.section('2'))
+                self.assertIsNone(session.section(None))
@@ -0,0 +1,111 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from bitrix24_bridge.amqp.amqp import PublishResult
+from bitrix24_bridge.cache import import_session
+from bitrix24_bridge.capture import ADD_META, CATEGORY, PRODUCT, ChangeCapture, ignored, on_save
+from bitrix24_bridge.handlers import ProductSectionHandler
+from bitrix24_bridge.models import ProductSectionBX
+
+
+def changes(**kinds) -> dict:
+    return {kind: set(kinds.get(kind, ())) for kind in ('product', 'category', 'attribute')}
+
+
+class ChangeCaptureExportTest(SimpleTestCase):
+
+    def setUp(self):
+        self.capture = ChangeCapture(window=60)
+        # export is called directly, no background thread
+        patcher = mock.patch.object(self.capture, '_schedule')
+        self.schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_export_is_requeued(self):
+        with mock.patch.object(self.capture, 'export_objects', side_effect=ConnectionError()), \
+                self.assertLogs('bitrix24_bridge.capture', level='ERROR'):
+            self.capture.export(changes(product=[1, 2]), changes(category=['7']))
+
+        self.assertEqual(self.capture.dirty, changes(product=[1, 2]))
+        self.assertEqual(self.capture.removed, changes(category=['7']))
+        self.schedule.assert_called_once_with()
+
+    def test_not_delivered_commands_are_requeued(self):
+        removed = PublishResult(sent=1, failed=[(1, {})])
+
+        with mock.patch.object(self.capture, 'export_objects', return_value={2}), \
+                mock.patch.object(ProductSectionBX, 'remove_many', return_value=removed):
+            self.capture.export(changes(product=[1, 2]), changes(category=['7', '8']))
+
+        self.assertEqual(self.capture.dirty, changes(product=[2]))
+        self.assertEqual(self.capture.removed, changes(category=['8']))
+        self.assertEqual(self.capture.exported, 1)
+
+    def test_nothing_to_requeue(self):
+        with mock.patch.object(self.capture, 'export_objects', return_value=set()):
+            self.capture.export(changes(product=[1]), changes())
+
+        self.assertEqual(self.capture.dirty, changes())
+        self.schedule.assert_not_called()
+
+    def test_unlinked_objects_are_added(self):
+        linked = ProductSectionBX(pk=1, bitrix_id='5', name='a', category_id=10)
+        unlinked = ProductSectionBX(pk=2, name='b', category_id=11)
+        sent = []
+
+        def send_commands(commands, **kwargs):
+            sent.extend(commands)
+            return PublishResult(sent=len(sent))
+
+        with mock.patch.object(ProductSectionBX, 'from_objects', return_value=[linked, unlinked]), \
+                mock.patch.object(ProductSectionBX, 'update_many', return_value=PublishResult(failed=[(0, {})])), \
+                mock.patch.object(ProductSectionBX, 'send_commands', side_effect=send_commands):
+            failed = self.capture.export_objects(CATEGORY, ProductSectionBX, [10, 11])
+
+        self.assertEqual(failed, {10})
+        command, = sent
+        self.assertEqual(command['method'], 'crm.productsection.add')
+        self.assertEqual(command['meta'], {ADD_META: 2})
+
+
+class CaptureSignalsTest(SimpleTestCase):
+
+    def test_import_changes_are_ignored(self):
+        self.assertFalse(ignored({}))
+        self.assertTrue(ignored({'raw': True}))
+
+        with import_session():
+            self.assertTrue(ignored({}))
+
+    @mock.patch('bitrix24_bridge.capture.transaction.on_commit')
+    def test_changes_are_marked_on_commit(self, on_commit):
+        with import_session():
+            on_save(PRODUCT, None, mock.Mock(pk=1))
+        on_commit.assert_not_called()
+
+        on_save(PRODUCT, None, mock.Mock(pk=1))
+        on_commit.assert_called_once()
+
+
+class AddResponseTest(TestCase):
+
+    def test_added_object_is_linked(self):
+        section = ProductSectionBX.objects.create(name='a')
+
+        ProductSectionHandler().dispatch({
+            "method": "crm.productsection.add", "status_code": 200, "result": 42, "meta": {ADD_META: section.pk},
+        })
+
+        section.refresh_from_db()
+        self.assertEqual(section.bitrix_id, '42')
+
+    def test_linked_object_is_kept(self):
+        section = ProductSectionBX.objects.create(bitrix_id='5', name='a')
+
+        ProductSectionHandler().dispatch({
+            "method": "crm.productsection.add", "status_code": 200, "result": 42, "meta": {ADD_META: section.pk},
+        })
+
+        section.refresh_from_db()
+        self.assertEqual(section.bitrix_id, '5')
@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.test import TestCase
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.categories import CategoryTreeImporter
+from bitrix24_bridge.models import ProductSectionBX
+
+Category = get_model('catalogue', 'Category')
+
+
+def sections(*rows) -> list:
+    """
+    Save imported sections: (bitrix_id, parent bitrix_id, name)
+    """
+    objs = []
+    for b_id, parent, name in rows:
+        obj = ProductSectionBX.objects.filter(bitrix_id=b_id).first() or ProductSectionBX(bitrix_id=b_id)
+        obj.section_id = parent
+        obj.name = name
+        obj.save()
+        objs.append(obj)
+    return objs
+
+
+def tree() -> list:
+    """
+    (name, parent name) of categories in tree order
+    """
+    return [
+        (category.name, category.get_parent().name if category.depth > 1 else None)
+        for category in Category.objects.order_by('path')
+    ]
+
+
+class CategoryTreeImporterTest(TestCase):
+
+    def run_import(self, *rows):
+        return CategoryTreeImporter().run(sections(*rows))
+
+    def assertValidTree(self):
+        self.assertFalse(any(Category.find_problems()))
+        for section in ProductSectionBX.objects.select_related('category'):
+            self.assertEqual(section.category.name, section.name)
+
+    def test_subtrees_are_created_parents_first(self):
+        stats = self.run_import(('3', '2', 'c'), ('4', '1', 'd'), ('2', '1', 'b'), ('1', None, 'a'), ('5', None, 'e'))
+
+        self.assertEqual(stats['created'], 5)
+        self.assertEqual(tree(), [('a', None), ('b', 'a'), ('c', 'b'), ('d', 'a'), ('e', None)])
+        self.assertValidTree()
+
+    def test_child_imported_before_parent_is_moved(self):
+        self.run_import(('3', '2', 'c'))
+        self.assertEqual(tree(), [('c', None)])
+
+        stats = self.run_import(('2', '1', 'b'), ('1', None, 'a'))
+
+        self.assertEqual((stats['created'], stats['moved']), (2, 1))
+        self.assertEqual(tree(), [('a', None), ('b', 'a'), ('c', 'b')])
+        self.assertValidTree()
+
+    def test_only_changed_categories_are_moved_and_renamed(self):
+        self.run_import(('1', None, 'a'), ('2', '1', 'b'), ('3', None, 'c'))
+
+        stats = self.run_import(('3', '2', 'c'), ('1', None, 'A'))
+
+        self.assertEqual((stats['created'], stats['moved'], stats['renamed']), (0, 1, 1))
+        self.assertEqual(tree(), [('A', None), ('b', 'A'), ('c', 'b')])
+        self.assertEqual(Category.objects.get(name='A').slug, 'a')
+        self.assertValidTree()
+
+    def test_cycle_is_broken(self):
+        stats = self.run_import(('5', '6', 'e'), ('6', '5', 'f'))
+
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(sorted(parent is None for _, parent in tree()), [False, True])
+        self.assertValidTree()
+
+    def test_failed_move_rolls_back_import(self):
+        self.run_import(('1', None, 'a'), ('2', None, 'b'))
+
+        with mock.patch.object(Category, 'move', side_effect=RuntimeError("broken tree")):
+            with self.assertRaises(RuntimeError):
+                self.run_import(('2', '1', 'b'), ('1', None, 'A'))
+
+        self.assertEqual(tree(), [('a', None), ('b', None)])
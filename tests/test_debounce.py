@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from bitrix24_bridge.debounce import UpdateDebouncer, command_key, merge_commands
+
+
+def update(bid, **fields) -> dict:
+    return {"method": "crm.product.update", "params": {"id": bid, "fields": fields}}
+
+
+def delete(bid) -> dict:
+    return {"method": "crm.product.delete", "params": {"id": bid}}
+
+
+class MergeCommandsTest(SimpleTestCase):
+
+    def test_command_key(self):
+        self.assertEqual(command_key(update(1)), ('crm.product', '1'))
+        self.assertEqual(command_key(delete('1')), ('crm.product', '1'))
+        self.assertIsNone(command_key({"method": "crm.product.add", "params": {"fields": {}}}))
+        self.assertIsNone(command_key({"method": "crm.product.update", "params": {"fields": {}}}))
+
+    def test_update_update(self):
+        merged = merge_commands(update(1, NAME='a', PRICE='1'), update(1, NAME='b'))
+
+        self.assertEqual(merged, update(1, NAME='b', PRICE='1'))
+
+    def test_update_delete(self):
+        self.assertEqual(merge_commands(update(1, NAME='a'), delete(1)), delete(1))
+
+    def test_delete_wins(self):
+        self.assertEqual(merge_commands(delete(1), update(1, NAME='a')), delete(1))
+
+
+class UpdateDebouncerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.sender = mock.Mock()
+        self.debouncer = UpdateDebouncer(sender=self.sender, window=60)
+
+    def test_not_debounced_command(self):
+        self.assertFalse(self.debouncer.push({"method": "crm.product.list", "params": {}}))
+        self.assertEqual(len(self.debouncer), 0)
+
+    def test_commands_merged_by_object(self):
+        self.assertTrue(self.debouncer.push(update(1, NAME='a')))
+        self.debouncer.push(update(2, NAME='x'))
+        self.debouncer.push(update(1, PRICE='10'))
+        self.debouncer.push(delete(2))
+
+        self.assertEqual(len(self.debouncer), 2)
+        self.sender.assert_not_called()
+
+        self.debouncer.flush()
+
+        self.assertEqual(self.sender.call_args_list, [
+            mock.call(update(1, NAME='a', PRICE='10')),
+            mock.call(delete(2)),
+        ])
+        self.assertEqual((self.debouncer.received, self.debouncer.sent), (4, 2))
+
+    def test_due_commands_in_order_of_arrival(self):
+        with mock.patch('time.monotonic', return_value=100.0):
+            self.debouncer.push(update(1))
+        with mock.patch('time.monotonic', return_value=130.0):
+            self.debouncer.push(update(2))
+
+        self.assertEqual(self.debouncer._pop_due(now=165.0), [update(1)])
+        self.assertEqual(len(self.debouncer), 1)
+
+    def test_failed_command_is_counted(self):
+        self.sender.side_effect = [ConnectionError("broker is down"), None]
+        self.debouncer.push(update(1, NAME='a'))
+        self.debouncer.push(update(2, NAME='b'))
+
+        with self.assertLogs('bitrix24_bridge.debounce', level='ERROR'):
+            self.debouncer.flush()
+
+        self.assertEqual(self.sender.call_count, 2)
+        self.assertEqual((self.debouncer.sent, self.debouncer.failed), (1, 1))
+        self.assertEqual(len(self.debouncer), 0)
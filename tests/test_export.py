@@ -0,0 +1,114 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.cache import PARTNER_CODE
+from bitrix24_bridge.models import AttributeOptionBX, ProductBX, ProductPropertyBX, ProductSectionBX
+
+AttributeOption = get_model('catalogue', 'AttributeOption')
+AttributeOptionGroup = get_model('catalogue', 'AttributeOptionGroup')
+Category = get_model('catalogue', 'Category')
+Partner = get_model('partner', 'Partner')
+Product = get_model('catalogue', 'Product')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+ProductClass = get_model('catalogue', 'ProductClass')
+StockRecord = get_model('partner', 'StockRecord')
+
+
+class ExportTestCase(TestCase):
+
+    def count_queries(self, func, *args, **kwargs) -> int:
+        with CaptureQueriesContext(connection) as context:
+            func(*args, **kwargs)
+        return len(context.captured_queries)
+
+    def make_option_attribute(self, name: str, *options) -> ProductAttribute:
+        group = AttributeOptionGroup.objects.create(name=name)
+        for option in options:
+            AttributeOption.objects.create(group=group, option=option)
+        return ProductAttribute.objects.create(name=name, code=name.lower(), type='option', option_group=group)
+
+
+class ProductFromObjectsTest(ExportTestCase):
+
+    def setUp(self):
+        self.product_class = ProductClass.objects.create(name='Phones')
+        self.partner = Partner.objects.create(code=PARTNER_CODE, name='Bitrix24')
+
+        root = Category.add_root(name='a', slug='a')
+        child = root.add_child(name='b', slug='b')
+        self.categories = [root, child]
+        ProductSectionBX.objects.create(bitrix_id='1', name='a', category=root)
+        ProductSectionBX.objects.create(bitrix_id='2', name='b', category=child, section_id='1')
+
+        self.color = ProductAttribute.objects.create(name='Color', code='color', type='text')
+        ProductPropertyBX.objects.create(bitrix_id='12', name='Color', property_type='S', product_attribute=self.color)
+
+        self.size = self.make_option_attribute('Size', 'S', 'M')
+        size = ProductPropertyBX.objects.create(bitrix_id='13', name='Size', property_type='L',
+                                                product_attribute=self.size)
+        self.small = AttributeOption.objects.get(option='S')
+        AttributeOptionBX.objects.create(prop=size, value_id='100', option=self.small)
+
+    def make_products(self, count: int) -> list:
+        products = []
+        for i in range(count):
+            product = Product.objects.create(product_class=self.product_class, title=f'p{i}', description='d')
+            for category in self.categories:
+                ProductCategory.objects.create(product=product, category=category)
+            ProductAttributeValue.objects.create(product=product, attribute=self.color, value_text='red')
+            ProductAttributeValue.objects.create(product=product, attribute=self.size, value_option=self.small)
+            StockRecord.objects.create(product=product, partner=self.partner, partner_sku=str(product.pk),
+                                       price_excl_tax=Decimal('10.00'), price_currency='RUB')
+            products.append(product)
+        return products
+
+    def test_product_data(self):
+        product, = self.make_products(1)
+
+        obj, = ProductBX.from_objects([product])
+
+        self.assertEqual((obj.name, obj.section_id), ('p0', '2'))
+        self.assertEqual(obj.properties, {'12': {"VALUE": 'red'}, '13': {"VALUE": '100'}})
+        self.assertEqual((obj.price, obj.currency_id), (Decimal('10.00'), 'RUB'))
+        self.assertEqual(ProductBX.objects.get().product_id, product.pk)
+
+    def test_queries_do_not_grow_with_products(self):
+        few, many = self.make_products(2), self.make_products(8)
+
+        self.assertEqual(
+            self.count_queries(ProductBX.from_objects, few, force_save=False),
+            self.count_queries(ProductBX.from_objects, many, force_save=False),
+        )
+
+
+class ProductPropertyFromObjectsTest(ExportTestCase):
+
+    def test_option_values(self):
+        attribute = self.make_option_attribute('Size', 'S', 'M')
+        prop = ProductPropertyBX.objects.create(bitrix_id='13', name='Size', property_type='L',
+                                                product_attribute=attribute)
+        AttributeOptionBX.objects.create(prop=prop, value_id='100', option=AttributeOption.objects.get(option='S'))
+
+        obj, = ProductPropertyBX.from_objects([attribute])
+
+        self.assertEqual(obj.pk, prop.pk)
+        self.assertEqual((obj.property_type, obj.user_type), ('L', ''))
+        self.assertEqual(obj.values, {'100': {"VALUE": 'S'}, 'n1': {"VALUE": 'M'}})
+
+    def test_queries_do_not_grow_with_attributes(self):
+        few = [self.make_option_attribute(f'A{i}', 'x', 'y') for i in range(2)]
+        many = [self.make_option_attribute(f'B{i}', 'x', 'y', 'z') for i in range(6)]
+        for attribute in few + many:
+            ProductPropertyBX.objects.create(bitrix_id=attribute.code, name=attribute.name, property_type='L',
+                                             product_attribute=attribute)
+
+        self.assertEqual(
+            self.count_queries(ProductPropertyBX.from_objects, few, force_save=False),
+            self.count_queries(ProductPropertyBX.from_objects, many, force_save=False),
+        )
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from bitrix24_bridge.fullsync import PAGE_SIZE, FullSync, FullSyncError
+from bitrix24_bridge.models import ProductSectionBX, SyncPage, SyncRun
+
+TOTAL = 120
+
+
+class FullSyncTest(TestCase):
+
+    def setUp(self):
+        self.run = SyncRun.objects.create()
+        self.sync = FullSync(self.run, concurrency=2, retries=2, interval=0, report=lambda message: None)
+        self.requested = []
+        self.queue = []
+        self.failing = set()
+
+    def send(self, params, action, meta):
+        self.requested.append(params['start'])
+        self.queue.append((params['start'], meta['full_sync']['page']))
+
+    def listen(self, seconds):
+        """
+        Apply requested pages while full sync waits, as bitrix_sync_listener would do
+        """
+        for start, page_id in self.queue:
+            if start in self.failing:
+                self.failing.discard(start)
+                SyncPage.fail(page_id)
+            else:
+                SyncPage.complete(page_id, rows=min(PAGE_SIZE, TOTAL - start), total=TOTAL)
+        self.queue.clear()
+
+    def sync_entity(self):
+        with mock.patch.object(ProductSectionBX, 'list', side_effect=self.send), \
+                mock.patch('bitrix24_bridge.fullsync.time.sleep', side_effect=self.listen):
+            self.sync.sync_entity(ProductSectionBX)
+
+    def test_pages_are_planned_by_total(self):
+        self.sync_entity()
+
+        self.assertEqual(self.requested, [0, 50, 100])
+        pages = SyncPage.objects.filter(run=self.run, entity=ProductSectionBX.entity)
+        self.assertEqual(list(pages.values_list('start', 'status', 'rows')), [
+            (0, SyncPage.DONE, 50),
+            (50, SyncPage.DONE, 50),
+            (100, SyncPage.DONE, 20),
+        ])
+
+    def test_resume_requests_not_applied_pages(self):
+        entity = ProductSectionBX.entity
+        SyncPage.objects.create(run=self.run, entity=entity, start=0, status=SyncPage.DONE, rows=50, total=TOTAL)
+        SyncPage.objects.create(run=self.run, entity=entity, start=50, status=SyncPage.SENT, attempts=1,
+                                sent=timezone.now())
+        SyncPage.objects.create(run=self.run, entity=entity, start=100, status=SyncPage.DONE, rows=20, total=TOTAL)
+        self.sync.page_timeout = 0
+
+        self.sync_entity()
+
+        self.assertEqual(self.requested, [50])
+        self.assertEqual(SyncPage.objects.get(run=self.run, start=50).attempts, 2)
+
+    def test_failed_page_is_requested_again(self):
+        self.failing = {50}
+
+        self.sync_entity()
+
+        self.assertEqual(self.requested, [0, 50, 100, 50])
+        self.assertFalse(SyncPage.objects.exclude(status=SyncPage.DONE).exists())
+
+    def test_retries_are_limited(self):
+        self.sync.retries = 1
+        self.failing = {50}
+
+        with self.assertRaises(FullSyncError):
+            self.sync_entity()
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase
+
+from bitrix24_bridge.incremental import request_changes, request_next
+from bitrix24_bridge.models import ProductBX, SyncCursor
+
+T0 = datetime(2019, 7, 17, 14, 51)
+
+
+def product(b_id: str, timestamp: datetime) -> ProductBX:
+    return ProductBX(bitrix_id=b_id, timestamp_x=timestamp)
+
+
+class SyncCursorTest(TestCase):
+
+    def test_advance_to_newest(self):
+        objs = [product('2', T0), product('10', T0), product('1', T0 - timedelta(days=1))]
+
+        cursor = SyncCursor.advance('crm.product', objs)
+
+        self.assertEqual((cursor.timestamp, cursor.last_id), (T0, '10'))
+
+    def test_cursor_never_goes_back(self):
+        SyncCursor.advance('crm.product', [product('5', T0)])
+
+        SyncCursor.advance('crm.product', [product('4', T0), product('9', T0 - timedelta(seconds=1))])
+        cursor = SyncCursor.advance('crm.product', [product('1', None)])
+
+        self.assertEqual((cursor.timestamp, cursor.last_id), (T0, '5'))
+        self.assertEqual(SyncCursor.objects.count(), 1)
+
+
+@mock.patch.object(ProductBX, 'list')
+class RequestNextTest(TestCase):
+
+    meta = {"entity": "crm.product", "since": T0.isoformat(), "start": None}
+
+    def params(self, list_mock) -> dict:
+        _, kwargs = list_mock.call_args
+        return kwargs['params']
+
+    def test_next_page_from_new_watermark(self, list_mock):
+        newest = T0 + timedelta(minutes=5)
+
+        request_next(ProductBX, self.meta, [product('1', T0), product('2', newest)], next_start=50)
+
+        params = self.params(list_mock)
+        self.assertEqual(params['filter'], {">=TIMESTAMP_X": newest.isoformat()})
+        self.assertNotIn('start', params)
+        self.assertEqual(params['order'], {"TIMESTAMP_X": "ASC", "ID": "ASC"})
+
+    def test_page_of_one_watermark_uses_offset(self, list_mock):
+        request_next(ProductBX, self.meta, [product('1', T0), product('2', T0)], next_start=50)
+
+        params = self.params(list_mock)
+        self.assertEqual(params['filter'], {">=TIMESTAMP_X": T0.isoformat()})
+        self.assertEqual(params['start'], 50)
+
+    def test_last_page(self, list_mock):
+        self.assertIsNone(request_next(ProductBX, self.meta, [product('1', T0)], next_start=None))
+
+        list_mock.assert_not_called()
+
+    def test_changes_since_cursor(self, list_mock):
+        SyncCursor.advance('crm.product', [product('3', T0)])
+
+        request_changes(ProductBX)
+
+        _, kwargs = list_mock.call_args
+        self.assertEqual(kwargs['params']['filter'], {">=TIMESTAMP_X": T0.isoformat()})
+        self.assertEqual(kwargs['meta']['cursor'], self.meta)
+        self.assertEqual(kwargs['action'], 'incremental')
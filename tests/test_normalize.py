@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from bitrix24_bridge import normalize
+from bitrix24_bridge.models import ProductBX, ProductPropertyBX
+from bitrix24_bridge.normalize import PayloadNormalizer, to_flag
+
+
+class ToFlagTest(SimpleTestCase):
+
+    def test_flags(self):
+        self.assertTrue(to_flag('Y'))
+        self.assertTrue(to_flag(' y '))
+        self.assertTrue(to_flag(True))
+        self.assertFalse(to_flag('N'))
+        self.assertFalse(to_flag('0'))
+
+        with self.assertRaises(ValueError):
+            to_flag('maybe')
+
+
+class PayloadNormalizerTest(SimpleTestCase):
+
+    def test_prices(self):
+        normalizer = PayloadNormalizer(ProductBX)
+
+        rows = normalizer.normalize([
+            {"price": "1500.5"},
+            {"price": "10,25"},
+            {"price": ""},
+            {"price": "free"},
+            {"price": "1e20"},
+            {"name": "no price"},
+        ])
+
+        self.assertEqual(rows, [
+            {"price": Decimal('1500.50')},
+            {"price": Decimal('10.25')},
+            {"price": None},
+            {},
+            {},
+            {"name": "no price"},
+        ])
+        self.assertEqual(normalizer.errors, {'price': 2})
+
+    def test_flags_with_defaults(self):
+        normalizer = PayloadNormalizer(ProductPropertyBX)
+
+        rows = normalizer.normalize([
+            {"active": "N", "multiple": "Y", "is_required": None},
+            {"active": "", "multiple": "?"},
+        ])
+
+        self.assertEqual(rows, [
+            {"active": False, "multiple": True, "is_required": False},
+            {"active": True},
+        ])
+        self.assertEqual(normalizer.errors, {'multiple': 1})
+
+
+class NormalizeRowsTest(SimpleTestCase):
+
+    def setUp(self):
+        normalize.errors.clear()
+
+    def test_broken_values_are_counted_and_logged(self):
+        with self.assertLogs('bitrix24_bridge.mixin', level='WARNING') as logs:
+            rows = ProductBX.normalize([{"price": "free"}, {"price": "1"}])
+
+        self.assertEqual(rows, [{}, {"price": Decimal('1.00')}])
+        self.assertEqual(normalize.errors, {ProductBX.entity: {'price': 1}})
+        self.assertIn('price', logs.output[0])
@@ -0,0 +1,60 @@
+from django.test import TestCase
+
+from bitrix24_bridge import outbox
+from bitrix24_bridge.amqp.amqp import PublishResult
+from bitrix24_bridge.models import OutboxMessage
+
+
+def command(i: int) -> dict:
+    return {"method": "crm.product.update", "params": {"id": i}}
+
+
+class DrainTest(TestCase):
+
+    def setUp(self):
+        outbox.enqueue([command(i) for i in range(5)])
+
+    def payloads(self):
+        return [message.payload for message in OutboxMessage.objects.order_by('id')]
+
+    def test_published_commands_are_deleted(self):
+        sent = []
+
+        def sender(commands):
+            sent.extend(commands)
+            return PublishResult(sent=len(commands))
+
+        result = outbox.drain(sender, batch_size=3)
+
+        self.assertEqual(result, PublishResult(sent=3))
+        self.assertEqual(sent, [command(0), command(1), command(2)])
+        self.assertEqual(self.payloads(), [command(3), command(4)])
+
+    def test_commands_from_first_failure_are_kept_in_order(self):
+        def sender(commands):
+            return PublishResult(sent=3, failed=[(1, commands[1])])
+
+        result = outbox.drain(sender, batch_size=4)
+
+        self.assertEqual(result.sent, 1)
+        self.assertEqual([index for index, _ in result.failed], [1, 2, 3])
+        self.assertEqual(self.payloads(), [command(i) for i in range(1, 5)])
+        self.assertEqual(
+            list(OutboxMessage.objects.order_by('id').values_list('attempts', flat=True)),
+            [1, 1, 1, 0]
+        )
+
+    def test_until_id(self):
+        last_id = outbox.last_id()
+        outbox.enqueue([command(5)])
+
+        result = outbox.drain(lambda commands: PublishResult(sent=len(commands)), until_id=last_id)
+
+        self.assertEqual(result.sent, 5)
+        self.assertEqual(self.payloads(), [command(5)])
+
+    def test_empty(self):
+        OutboxMessage.objects.all().delete()
+
+        self.assertEqual(outbox.drain(lambda commands: PublishResult()), PublishResult())
+        self.assertIsNone(outbox.last_id())
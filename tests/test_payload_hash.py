@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from bitrix24_bridge.models import ProductSectionBX
+
+
+def section(b_id: str, name: str) -> dict:
+    return {"ID": b_id, "NAME": name, "CATALOG_ID": "1", "SECTION_ID": None, "XML_ID": None}
+
+
+class PayloadHashTest(TestCase):
+
+    def setUp(self):
+        ProductSectionBX.skipped.clear()
+
+    def test_unchanged_payload_is_not_written(self):
+        first = ProductSectionBX.bulk_update_or_create_cls([section('1', 'a'), section('2', 'b')])
+        self.assertFalse(any(obj.unchanged for obj in first))
+
+        second = ProductSectionBX.bulk_update_or_create_cls([section('1', 'a'), section('2', 'B')])
+
+        self.assertEqual([obj.unchanged for obj in second], [True, False])
+        self.assertEqual(ProductSectionBX.objects.get(bitrix_id='2').name, 'B')
+
+    def test_applied_payload_is_skipped(self):
+        ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+        ProductSectionBX.objects.filter(bitrix_id='1').update(category=self.make_category())
+
+        objs = ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+        with mock.patch.object(ProductSectionBX, 'to_objects') as to_objects:
+            ProductSectionBX.apply_many(objs)
+
+        to_objects.assert_not_called()
+        self.assertEqual(ProductSectionBX.skipped[ProductSectionBX.entity], 1)
+
+    def test_not_linked_payload_is_applied(self):
+        ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+        objs = ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+
+        with mock.patch.object(ProductSectionBX, 'to_objects', return_value=[]) as to_objects:
+            ProductSectionBX.apply_many(objs)
+
+        to_objects.assert_called_once_with(objs)
+
+    def test_failed_apply_resets_hash(self):
+        ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+        objs = ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])
+
+        with mock.patch.object(ProductSectionBX, 'to_objects', side_effect=RuntimeError()):
+            with self.assertRaises(RuntimeError):
+                ProductSectionBX.apply_many(objs)
+
+        self.assertIsNone(ProductSectionBX.objects.get(bitrix_id='1').payload_hash)
+        self.assertFalse(ProductSectionBX.bulk_update_or_create_cls([section('1', 'a')])[0].unchanged)
+
+    def test_failed_save_is_raised(self):
+        with mock.patch.object(ProductSectionBX.objects, 'update_or_create', side_effect=RuntimeError()):
+            with self.assertRaises(RuntimeError), self.assertLogs('bitrix24_bridge.mixin', level='ERROR'):
+                ProductSectionBX.update_or_create_cls(section('1', 'a'))
+
+        self.assertFalse(ProductSectionBX.objects.exists())
+
+    @staticmethod
+    def make_category():
+        from oscar.core.loading import get_model
+        return get_model('catalogue', 'Category').add_root(name='a', slug='a')
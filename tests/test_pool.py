@@ -0,0 +1,91 @@
+from unittest import mock
+
+import pika.exceptions
+from django.test import SimpleTestCase
+
+from bitrix24_bridge.amqp.pool import ProducerPool
+
+
+class ProducerPoolTest(SimpleTestCase):
+
+    def make_pool(self, size: int = 2) -> ProducerPool:
+        return ProducerPool(size=size, timeout=0.01, factory=mock.Mock)
+
+    def test_reuse_released_producer(self):
+        pool = self.make_pool()
+
+        producer = pool.acquire()
+        pool.release(producer)
+
+        self.assertIs(pool.acquire(), producer)
+        self.assertEqual(pool._created, 1)
+
+    def test_size_limit(self):
+        pool = self.make_pool(size=1)
+        pool.acquire()
+
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+
+    def test_discard_frees_slot(self):
+        pool = self.make_pool(size=1)
+
+        producer = pool.acquire()
+        pool.discard(producer)
+
+        producer.close.assert_called_once_with()
+        self.assertEqual(pool._created, 0)
+        self.assertIsNot(pool.acquire(), producer)
+
+    def test_reconnect_error_discards_producer(self):
+        pool = self.make_pool(size=1)
+
+        with self.assertRaises(pika.exceptions.AMQPConnectionError):
+            with pool.producer() as producer:
+                raise pika.exceptions.AMQPConnectionError()
+
+        producer.close.assert_called_once_with()
+        self.assertEqual(pool._created, 0)
+
+    def test_other_error_releases_producer(self):
+        pool = self.make_pool(size=1)
+
+        with self.assertRaises(ValueError):
+            with pool.producer() as producer:
+                raise ValueError()
+
+        producer.close.assert_not_called()
+        self.assertIs(pool.acquire(), producer)
+
+    def test_send_retries_through_new_producer(self):
+        broken, alive = mock.Mock(), mock.Mock()
+        broken.send.side_effect = pika.exceptions.StreamLostError()
+        pool = ProducerPool(size=1, timeout=0.01, retries=1, factory=mock.Mock(side_effect=[broken, alive]))
+
+        pool.send({"method": "crm.product.list"})
+
+        broken.close.assert_called_once_with()
+        alive.send.assert_called_once_with({"method": "crm.product.list"})
+
+    def test_forked_child_drops_inherited_producers(self):
+        pool = self.make_pool(size=1)
+        inherited = pool.acquire()
+        pool.release(inherited)
+
+        with mock.patch('os.getpid', return_value=pool._pid + 1):
+            producer = pool.acquire()
+            self.assertIsNot(producer, inherited)
+            self.assertEqual(pool._created, 1)
+
+        inherited.close.assert_not_called()
+
+    def test_producer_of_parent_is_not_released_in_child(self):
+        pool = self.make_pool(size=1)
+        producer = pool.acquire()
+
+        with mock.patch('os.getpid', return_value=pool._pid + 1):
+            pool.release(producer)
+            pool.discard(producer)
+
+        self.assertTrue(pool._idle.empty())
+        self.assertEqual(pool._created, 1)
@@ -0,0 +1,114 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.cache import ImportSession, has_session
+from bitrix24_bridge.models import ProductBX, ProductPropertyBX, ProductSectionBX
+
+Category = get_model('catalogue', 'Category')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+StockRecord = get_model('partner', 'StockRecord')
+
+
+def product(b_id: str, name: str, price='10.00', section_id='7') -> dict:
+    return {"ID": b_id, "NAME": name, "PRICE": price, "CURRENCY_ID": "RUB", "SECTION_ID": section_id}
+
+
+class ProductToObjectsTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.add_root(name='Phones', slug='phones')
+        ProductSectionBX.objects.create(bitrix_id='7', name='Phones', category=self.category)
+
+    def apply(self, *rows):
+        objs = ProductBX.bulk_update_or_create_cls(rows)
+        return objs, ProductBX.to_objects(objs)
+
+    def test_products_are_created(self):
+        objs, products = self.apply(product('1', 'first'), product('2', 'second', price='20.50'))
+
+        self.assertEqual([p.title for p in products], ['first', 'second'])
+        self.assertTrue(all(p.pk for p in products))
+        self.assertEqual(
+            dict(ProductBX.objects.values_list('bitrix_id', 'product_id')),
+            {'1': products[0].pk, '2': products[1].pk}
+        )
+        self.assertEqual(
+            set(ProductCategory.objects.values_list('product_id', 'category_id')),
+            {(products[0].pk, self.category.pk), (products[1].pk, self.category.pk)}
+        )
+        self.assertEqual(
+            dict(StockRecord.objects.values_list('partner_sku', 'price_excl_tax')),
+            {'1': Decimal('10.00'), '2': Decimal('20.50')}
+        )
+        self.assertTrue(all(obj.payload_hash for obj in ProductBX.objects.all()))
+
+    def test_products_are_updated(self):
+        _, (created,) = self.apply(product('1', 'first'))
+
+        _, (updated,) = self.apply(product('1', 'renamed', price='15.00'))
+
+        self.assertEqual(updated.pk, created.pk)
+        updated.refresh_from_db()
+        self.assertEqual(updated.title, 'renamed')
+        self.assertEqual(ProductCategory.objects.count(), 1)
+        record = StockRecord.objects.get()
+        self.assertEqual((record.product_id, record.price_excl_tax), (created.pk, Decimal('15.00')))
+
+    def test_stock_record_inserted_concurrently_is_updated(self):
+        _, (created,) = self.apply(product('1', 'first'))
+        objs = ProductBX.bulk_update_or_create_cls([product('1', 'first', price='99.00')])
+
+        # concurrent import inserted the record after the select of existing ones
+        filter_records = StockRecord.objects.filter
+        selects = []
+
+        def filter_missing_once(*args, **kwargs):
+            selects.append(kwargs)
+            qs = filter_records(*args, **kwargs)
+            return qs.none() if len(selects) == 1 else qs
+
+        with mock.patch.object(StockRecord.objects, 'filter', side_effect=filter_missing_once):
+            ProductBX.to_objects(objs)
+
+        self.assertEqual(len(selects), 2)
+        record = StockRecord.objects.get()
+        self.assertEqual((record.product_id, record.price_excl_tax), (created.pk, Decimal('99.00')))
+
+    def test_unresolved_section_resets_payload_hash(self):
+        objs, products = self.apply(product('1', 'linked'), product('2', 'orphan', section_id='404'))
+
+        self.assertTrue(all(p.pk for p in products))
+        self.assertEqual(
+            dict(ProductBX.objects.values_list('bitrix_id', 'payload_hash')),
+            {'1': objs[0].payload_hash, '2': None}
+        )
+        self.assertIsNone(objs[1].payload_hash)
+        self.assertEqual(ProductCategory.objects.get().product_id, products[0].pk)
+
+    def test_one_session_per_page(self):
+        objs = ProductBX.bulk_update_or_create_cls([product('1', 'first'), product('2', 'orphan', section_id='404')])
+
+        with mock.patch.object(ImportSession, 'section', autospec=True, side_effect=ImportSession.section) as section:
+            ProductBX.to_objects(objs)
+
+        # category links and unresolved() use sections loaded by to_objects()
+        self.assertEqual(len({id(call[0][0]) for call in section.call_args_list}), 1)
+        self.assertFalse(has_session())
+
+    def test_properties_loaded_from_db_are_reapplied(self):
+        attribute = ProductAttribute.objects.create(name='Color', code='12', type='text')
+        ProductPropertyBX.objects.create(bitrix_id='12', name='Color', product_attribute=attribute)
+        row = dict(product('1', 'first'), PROPERTY_12={"valueId": "5", "value": "red"})
+        self.apply(row)
+
+        # HStoreField returns nested dict as str
+        obj = ProductBX.objects.get(bitrix_id='1')
+        self.assertIsInstance(obj.properties['12'], str)
+        ProductBX.to_objects([obj])
+
+        self.assertEqual(ProductAttributeValue.objects.get(attribute=attribute).value_text, 'red')
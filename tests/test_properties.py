@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from oscar.core.loading import get_model
+
+from bitrix24_bridge.models import AttributeOptionBX, ProductPropertyBX
+
+AttributeOption = get_model('catalogue', 'AttributeOption')
+
+
+def value(value_id: str, text: str, xml_id: str = None) -> dict:
+    return {"ID": value_id, "VALUE": text, "XML_ID": xml_id or f"x{value_id}"}
+
+
+class ParseValuesTest(SimpleTestCase):
+
+    def test_values_by_id(self):
+        prop = ProductPropertyBX(values={'1': value('1', 'red'), 'n0': value('2', 'blue')})
+
+        self.assertEqual(prop.parse_values(), {'1': value('1', 'red'), '2': value('2', 'blue')})
+
+    def test_values_reloaded_from_hstore(self):
+        prop = ProductPropertyBX(values={'1': str(value('1', 'red')), '2': 'green', '3': str({"ID": "3"})})
+
+        self.assertEqual(prop.parse_values(), {'1': value('1', 'red'), '2': {"VALUE": 'green'}})
+
+    def test_empty(self):
+        self.assertEqual(ProductPropertyBX(values=None).parse_values(), {})
+
+
+class SyncOptionsTest(TestCase):
+
+    def apply(self, *values):
+        self.prop.values = {v["ID"]: v for v in values}
+        self.prop.save()
+        return self.prop.sync_options(self.prop.product_attribute.option_group)
+
+    def options(self) -> dict:
+        return dict(
+            AttributeOptionBX.objects.filter(prop=self.prop).values_list('value_id', 'option__option')
+        )
+
+    def setUp(self):
+        self.prop = ProductPropertyBX.objects.create(bitrix_id='12', name='Color', property_type='L', values={})
+        self.prop.values = {'1': value('1', 'red')}
+        self.prop.to_object()
+
+    def test_options_are_created(self):
+        stats = self.apply(value('1', 'red'), value('2', 'blue'))
+
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(self.options(), {'1': 'red', '2': 'blue'})
+
+    def test_renamed_and_removed_values(self):
+        self.apply(value('1', 'red'), value('2', 'blue'))
+        red = AttributeOption.objects.get(option='red')
+
+        stats = self.apply(value('1', 'crimson'))
+
+        self.assertEqual((stats['created'], stats['updated'], stats['deleted']), (0, 1, 1))
+        self.assertEqual(self.options(), {'1': 'crimson'})
+        self.assertEqual(AttributeOption.objects.get(option='crimson').pk, red.pk)
+        self.assertEqual(AttributeOption.objects.count(), 1)
+
+    def test_recreated_value_is_relinked_by_xml_id(self):
+        red = AttributeOption.objects.get(option='red')
+
+        stats = self.apply(value('7', 'red', xml_id='x1'))
+
+        self.assertEqual((stats['created'], stats['deleted']), (0, 0))
+        self.assertEqual(self.options(), {'7': 'red'})
+        self.assertEqual(AttributeOption.objects.get().pk, red.pk)
+
+    def test_failed_options_are_raised(self):
+        self.prop.values = {'1': value('1', 'red'), '2': value('2', 'blue')}
+        self.prop.payload_hash = 'applied'
+        self.prop.save()
+
+        with mock.patch.object(ProductPropertyBX, 'sync_options', side_effect=RuntimeError()):
+            with self.assertRaises(RuntimeError):
+                ProductPropertyBX.apply_many([self.prop])
+
+        self.assertIsNone(ProductPropertyBX.objects.get(pk=self.prop.pk).payload_hash)
@@ -0,0 +1,151 @@
+import shutil
+import tempfile
+import uuid
+
+import ujson
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from bitrix24_bridge.amqp.transports import (
+    FileSpool,
+    MemoryConsumer,
+    MemoryProducer,
+    SpoolConsumer,
+    SpoolProducer,
+    get_memory_broker,
+    get_transport,
+)
+
+
+class StopConsumer(KeyboardInterrupt):
+    pass
+
+
+class MemoryTransportTest(SimpleTestCase):
+
+    def setUp(self):
+        self.queue = f'test-{uuid.uuid4()}'
+        self.broker_queue = get_memory_broker().queue(self.queue)
+
+    def consume(self, callback, count: int, **kwargs) -> MemoryConsumer:
+        """
+        Run consumer until callback got `count` messages
+        """
+        consumer = MemoryConsumer(queue=self.queue, poll_interval=0.01, **kwargs)
+        received = []
+
+        def on_message(channel, method_frame, header_frame, body):
+            received.append(method_frame)
+            callback(consumer, method_frame, ujson.loads(body))
+            if len(received) >= count:
+                raise StopConsumer()
+
+        consumer.receive(on_message)
+        return consumer
+
+    def test_registered(self):
+        self.assertIs(get_transport('memory').producer, MemoryProducer)
+        with self.assertRaises(ImproperlyConfigured):
+            get_transport('unknown')
+
+    def test_producer_to_consumer(self):
+        producer = MemoryProducer(routing_key=self.queue)
+        for i in range(3):
+            producer.send({"n": i})
+
+        messages = []
+
+        def callback(consumer, method_frame, message):
+            consumer.track(method_frame.delivery_tag)
+            messages.append(message['n'])
+            consumer.ack(method_frame.delivery_tag)
+
+        self.consume(callback, count=3)
+
+        self.assertEqual(messages, [0, 1, 2])
+        self.assertEqual(len(self.broker_queue), 0)
+        self.assertFalse(self.broker_queue.unacked)
+
+    def test_failed_message_requeued_once(self):
+        get_memory_broker().publish(self.queue, {"n": 0})
+        get_memory_broker().publish(self.queue, {"n": 1})
+
+        deliveries = []
+
+        def callback(consumer, method_frame, message):
+            consumer.track(method_frame.delivery_tag)
+            deliveries.append((message['n'], method_frame.redelivered))
+            if message['n'] == 0:
+                consumer.nack(method_frame.delivery_tag, redelivered=method_frame.redelivered)
+            else:
+                consumer.ack(method_frame.delivery_tag)
+
+        self.consume(callback, count=3, requeue_on_failure=True)
+
+        # requeued message goes back to the head
+        self.assertEqual(deliveries, [(0, False), (0, True), (1, False)])
+        self.assertEqual([ujson.loads(body) for body in self.broker_queue.dead], [{"n": 0}])
+
+    def test_unsettled_messages_stay_unacked(self):
+        get_memory_broker().publish(self.queue, {"n": 0})
+
+        def callback(consumer, method_frame, message):
+            consumer.track(method_frame.delivery_tag)
+
+        self.consume(callback, count=1)
+
+        self.assertEqual(len(self.broker_queue.unacked), 1)
+        self.assertEqual(len(self.broker_queue), 0)
+
+
+class SpoolTransportTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.producer = SpoolProducer(directory=self.directory, routing_key='messages')
+
+    def consumer(self) -> SpoolConsumer:
+        return SpoolConsumer(directory=self.directory, queue='messages', poll_interval=0.01, commit_every=1)
+
+    def fetch(self, consumer: SpoolConsumer):
+        delivery, body = consumer.fetch(0)
+        return delivery, ujson.loads(body)['n']
+
+    def test_requeued_message_is_delivered_before_next_ones(self):
+        self.producer.send_many([{"n": i} for i in range(3)])
+        consumer = self.consumer().connect()
+
+        first, _ = self.fetch(consumer)
+        second, _ = self.fetch(consumer)
+        consumer.nack(first.delivery_tag)
+        consumer.ack(second.delivery_tag)
+
+        redelivery, n = self.fetch(consumer)
+        self.assertEqual((n, redelivery.redelivered), (0, True))
+        consumer.nack(redelivery.delivery_tag, redelivered=True)
+
+        delivery, n = self.fetch(consumer)
+        self.assertEqual((n, delivery.redelivered), (2, False))
+        consumer.ack(delivery.delivery_tag)
+        consumer.close()
+
+        spool = FileSpool(self.directory, 'messages')
+        with open(spool.dead_path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        with open(spool.log_path, 'rb') as f:
+            self.assertEqual(spool.read_offset(), len(f.read()))
+
+    def test_offset_stays_before_requeued_message(self):
+        self.producer.send_many([{"n": i} for i in range(2)])
+        consumer = self.consumer().connect()
+
+        first, _ = self.fetch(consumer)
+        second, _ = self.fetch(consumer)
+        consumer.nack(first.delivery_tag)
+        consumer.ack(second.delivery_tag)
+        consumer.close()
+
+        # restart before redelivery
+        consumer = self.consumer().connect()
+        self.assertEqual([self.fetch(consumer)[1], self.fetch(consumer)[1]], [0, 1])